@@ -1,2 +1,3 @@
 from .adapter_controller import AdapterController
 from .adapter_configuration import AdapterConfig
+from .adapter_modeling import BankedLayerNorm, BankedLinear, set_adapter_ids
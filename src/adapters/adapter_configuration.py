@@ -17,3 +17,6 @@ class AdapterConfig(object):
     add_adapter_after_feedforward = True
     # Trains the adapters if this is set to true.
     adapter_tune = False
+    # If set, each adapter is a bank of num_adapters adapters, indexed per row of the
+    # batch by the ids set with `set_adapter_ids`.
+    num_adapters = None
@@ -1,13 +1,15 @@
 """Implements adapter controller, a module that apply adapter layers."""
 import torch.nn as nn
-from .adapter_modeling import Adapter
+from .adapter_modeling import Adapter, BankedLayerNorm
 
 
 class AdapterController(nn.Module):
     """Implements Adapter controller module which controls the logits of
     putting adapter layers within  the transformer's layers.
     config: adapter configuraiton.
-    input_dim: input dimension of the hidden representation feed into adapters."""
+    input_dim: input dimension of the hidden representation feed into adapters.
+    With `config.num_adapters` set, the adapter and its layer norms are banks indexed
+    per row, so the rows of a batch can go through the adapters of different tasks."""
 
     def __init__(self, config, input_dim):
         super().__init__()
@@ -17,14 +19,19 @@ class AdapterController(nn.Module):
         self.add_layer_norm_after_adapter = config.add_layer_norm_after_adapter
         self.adapter = self.construct_adapters()
         if self.add_layer_norm_before_adapter:
-            self.pre_layer_norm = nn.LayerNorm(input_dim)
+            self.pre_layer_norm = self.construct_layer_norm()
         if self.add_layer_norm_after_adapter:
-            self.post_layer_norm = nn.LayerNorm(input_dim)
+            self.post_layer_norm = self.construct_layer_norm()
 
     def construct_adapters(self):
         """Construct the Adapter layers."""
         return Adapter(self.config, input_dim=self.input_dim)
 
+    def construct_layer_norm(self):
+        if self.config.num_adapters is not None:
+            return BankedLayerNorm(self.config.num_adapters, self.input_dim)
+        return nn.LayerNorm(self.input_dim)
+
     def forward(self, inputs):
         z = (
             self.pre_layer_norm(inputs)
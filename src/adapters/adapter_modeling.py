@@ -1,7 +1,77 @@
+import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from .utils import Activations
 
 
+class BankedLinear(nn.Module):
+    """A bank of num_adapters linear layers, the rows of the batch are grouped by adapter id
+    and each group is projected with a single matmul by the layer of its adapter."""
+
+    def __init__(self, num_adapters, in_features, out_features):
+        super().__init__()
+        self.weight = nn.Parameter(torch.empty(num_adapters, out_features, in_features))
+        self.bias = nn.Parameter(torch.zeros(num_adapters, out_features))
+        nn.init.normal_(self.weight, std=0.02)
+        self.adapter_ids = None
+        self.adapter_groups = None
+
+    def forward(self, x):
+        if len(self.adapter_groups) == 1:
+            adapter_id, _ = self.adapter_groups[0]
+            return F.linear(x, self.weight[adapter_id], self.bias[adapter_id])
+        # Gathers the rows of each adapter, and scatters their outputs back in place, without
+        # materializing the weights of each row.
+        output = x.new_empty(x.shape[:-1] + (self.weight.shape[1],))
+        for adapter_id, rows in self.adapter_groups:
+            output[rows] = F.linear(
+                x[rows], self.weight[adapter_id], self.bias[adapter_id]
+            )
+        return output
+
+
+class BankedLayerNorm(nn.Module):
+    """A bank of num_adapters layer norms, each row of the batch is scaled and shifted
+    with the weights of its adapter id."""
+
+    def __init__(self, num_adapters, hidden_size, eps=1e-5):
+        super().__init__()
+        self.weight = nn.Parameter(torch.ones(num_adapters, hidden_size))
+        self.bias = nn.Parameter(torch.zeros(num_adapters, hidden_size))
+        self.eps = eps
+        self.adapter_ids = None
+
+    def forward(self, x):
+        x = F.layer_norm(x, x.shape[-1:], eps=self.eps)
+        return torch.addcmul(
+            self.bias[self.adapter_ids].unsqueeze(1),
+            x,
+            self.weight[self.adapter_ids].unsqueeze(1),
+        )
+
+
+def group_adapter_ids(adapter_ids):
+    """Returns the list of (adapter id, indices of its rows) of the adapters in the batch."""
+    adapter_ids_list = adapter_ids.tolist()
+    if len(set(adapter_ids_list)) == 1:
+        return [(adapter_ids_list[0], None)]
+    return [
+        (adapter_id, (adapter_ids == adapter_id).nonzero().squeeze(-1))
+        for adapter_id in sorted(set(adapter_ids_list))
+    ]
+
+
+def set_adapter_ids(model, adapter_ids):
+    """Sets the adapter id of each row of the next batches, of size batch_size, in all
+    the banks of the model."""
+    adapter_groups = group_adapter_ids(adapter_ids)
+    for module in model.modules():
+        if isinstance(module, (BankedLinear, BankedLayerNorm)):
+            module.adapter_ids = adapter_ids
+        if isinstance(module, BankedLinear):
+            module.adapter_groups = adapter_groups
+
+
 class Adapter(nn.Module):
     """Conventional adapter latyer."""
 
@@ -10,9 +80,19 @@ class Adapter(nn.Module):
         self.config = config
         self.input_dim = input_dim
         self.down_sample_size = self.input_dim // config.reduction_factor
-        self.down_sampler = nn.Linear(self.input_dim, self.down_sample_size)
+        if config.num_adapters is not None:
+            self.down_sampler = BankedLinear(
+                config.num_adapters, self.input_dim, self.down_sample_size
+            )
+        else:
+            self.down_sampler = nn.Linear(self.input_dim, self.down_sample_size)
         self.activation = Activations(config.nonlinearity.lower())
-        self.up_sampler = nn.Linear(self.down_sample_size, self.input_dim)
+        if config.num_adapters is not None:
+            self.up_sampler = BankedLinear(
+                config.num_adapters, self.down_sample_size, self.input_dim
+            )
+        else:
+            self.up_sampler = nn.Linear(self.down_sample_size, self.input_dim)
 
     def forward(self, x):
         output = self.down_sampler(x)
@@ -0,0 +1,134 @@
+"""
+Measures the time of a training step (forward, PET loss and backward) of RobertaForMaskedLM
+for tasks with different numbers of labels, to compare the implementations of the PET losses.
+
+Usage: python src/benchmark_pet_loss.py --num_labels 2 77 [--soft_pet] [--verbalizer_head]
+    [--token_hinge_loss] [--num_negatives 8 --negative_sampling hardest]
+"""
+
+import argparse
+import json
+import time
+
+import torch
+from transformers.modeling_utils import no_init_weights
+
+from models import RobertaConfig, RobertaForMaskedLM
+
+
+def build_model(args, num_labels):
+    config = RobertaConfig(
+        vocab_size=args.vocab_size,
+        hidden_size=args.hidden_size,
+        num_hidden_layers=args.num_hidden_layers,
+        num_attention_heads=args.hidden_size // 64,
+        intermediate_size=4 * args.hidden_size,
+        max_position_embeddings=args.seq_length + 2,
+        soft_pet=args.soft_pet,
+        verbalizer_head=args.verbalizer_head,
+        token_hinge_loss=args.token_hinge_loss,
+        num_negatives=args.num_negatives,
+        negative_sampling=args.negative_sampling,
+        train_in_batch=True,
+        extra_tokens_init="random",
+    )
+    config.num_labels = num_labels
+    config.mask_token_id = args.vocab_size - 1
+    config.pad_token_id = 1
+    # Each label has a verbalizer of num_masks tokens.
+    tokenized_verbalizers = {
+        "init": [
+            [list(range(label * args.num_masks, (label + 1) * args.num_masks))]
+            for label in range(num_labels)
+        ]
+    }
+    if args.soft_pet:
+        tokenized_verbalizers["extra"] = [
+            [
+                list(
+                    range(
+                        args.vocab_size + label * args.num_masks,
+                        args.vocab_size + (label + 1) * args.num_masks,
+                    )
+                )
+            ]
+            for label in range(num_labels)
+        ]
+    # The weights are initialized randomly, the values do not matter for the timings.
+    with no_init_weights():
+        model = RobertaForMaskedLM(config, tokenized_verbalizers=tokenized_verbalizers)
+    for parameter in model.parameters():
+        parameter.data.normal_(mean=0.0, std=config.initializer_range)
+    return model.to(args.device).train()
+
+
+def get_batch(args, num_labels):
+    input_ids = torch.randint(
+        2, args.vocab_size - 1, (args.batch_size, args.seq_length)
+    )
+    mask_start = torch.randint(1, args.seq_length - args.num_masks, (args.batch_size,))
+    mask_indices = mask_start.unsqueeze(-1) + torch.arange(args.num_masks)
+    input_ids.scatter_(1, mask_indices, args.vocab_size - 1)
+    batch = {
+        "input_ids": input_ids,
+        "attention_mask": torch.ones_like(input_ids),
+        "mask_start": mask_start,
+        "labels": torch.randint(0, num_labels, (args.batch_size,)),
+    }
+    return {k: v.to(args.device) for k, v in batch.items()}
+
+
+def synchronize(device):
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def benchmark(args, num_labels):
+    """Returns the median time of a training step in milliseconds."""
+    model = build_model(args, num_labels)
+    batch = get_batch(args, num_labels)
+    times = []
+    for step in range(args.num_warmup_steps + args.num_steps):
+        synchronize(args.device)
+        start = time.perf_counter()
+        loss = model(**batch).loss
+        loss.backward()
+        synchronize(args.device)
+        model.zero_grad()
+        if step >= args.num_warmup_steps:
+            times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_labels", nargs="+", type=int, default=[2, 77])
+    parser.add_argument("--soft_pet", action="store_true")
+    parser.add_argument("--verbalizer_head", action="store_true")
+    parser.add_argument("--token_hinge_loss", action="store_true")
+    parser.add_argument("--num_negatives", type=int, default=None)
+    parser.add_argument(
+        "--negative_sampling", default="uniform", choices=["uniform", "hardest"]
+    )
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--seq_length", type=int, default=128)
+    parser.add_argument("--num_masks", type=int, default=3)
+    parser.add_argument("--vocab_size", type=int, default=50265)
+    parser.add_argument("--hidden_size", type=int, default=768)
+    parser.add_argument("--num_hidden_layers", type=int, default=12)
+    parser.add_argument("--num_warmup_steps", type=int, default=3)
+    parser.add_argument("--num_steps", type=int, default=20)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for num_labels in args.num_labels:
+        results[num_labels] = benchmark(args, num_labels)
+        print(f"{num_labels:4d} labels: {results[num_labels]:8.2f} ms/step")
+    print(json.dumps({"args": vars(args), "ms_per_step": results}))
+
+
+if __name__ == "__main__":
+    main()
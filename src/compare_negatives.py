@@ -0,0 +1,127 @@
+"""
+Compares the step time and the final accuracy of the PET hinge losses computed against all
+the wrong labels and against sampled ones, by training the task of the config (banking_77 by
+default) with each loss. The runs train for the max_steps of the config without the
+intermediate evaluations, so that their time only counts the training steps, and the final
+model is evaluated on the validation set and on the labeled test set of data/test.
+
+Usage: python src/compare_negatives.py [--config configs/banking_77.json]
+    [--num_negatives 8] [--full_negatives_steps 600] [--output_dir outputs/negatives]
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import OrderedDict
+
+from data.eval_results import eval as eval_test_accuracy
+from main import main as train_and_predict
+from utils.utils import load_json
+
+
+def get_variants(args):
+    """Returns the arguments of the losses to compare."""
+    full_end = {"full_negatives_steps": args.full_negatives_steps}
+    return OrderedDict(
+        [
+            ("full", {"num_negatives": None}),
+            ("uniform", {"negative_sampling": "uniform"}),
+            ("hardest", {"negative_sampling": "hardest"}),
+            ("uniform_full_end", {"negative_sampling": "uniform", **full_end}),
+            ("hardest_full_end", {"negative_sampling": "hardest", **full_end}),
+        ]
+    )
+
+
+def run(config, run_dir):
+    """Trains the task of the config and predicts its test set in run_dir, where the
+    predictions are written to results/<task>.csv. Returns the train and eval metrics, and
+    the trainer state."""
+    config_path = os.path.join(run_dir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=1)
+    cwd, argv = os.getcwd(), sys.argv
+    os.chdir(run_dir)
+    sys.argv = [argv[0], config_path]
+    try:
+        train_and_predict()
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+    return {
+        name: load_json(os.path.join(config["output_dir"], f"{name}.json"))
+        for name in ["train_results", "eval_results", "trainer_state"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="configs/banking_77.json")
+    parser.add_argument("--num_negatives", type=int, default=8)
+    parser.add_argument(
+        "--full_negatives_steps",
+        type=int,
+        default=None,
+        help="Defaults to the last 10% of the training steps.",
+    )
+    parser.add_argument("--output_dir", default="outputs/negatives")
+    parser.add_argument("--variants", nargs="+", default=None)
+    args = parser.parse_args()
+
+    base_config = load_json(args.config)
+    if args.full_negatives_steps is None:
+        args.full_negatives_steps = base_config["max_steps"] // 10
+    # The runs are in their own directories, the paths of the config are kept from here.
+    base_config = {
+        key: (
+            os.path.abspath(value)
+            if isinstance(value, str) and os.path.exists(value)
+            else value
+        )
+        for key, value in base_config.items()
+    }
+    task = base_config["task"]
+    variants = get_variants(args)
+    if args.variants is not None:
+        variants = OrderedDict((name, variants[name]) for name in args.variants)
+
+    results = OrderedDict()
+    for name, variant_args in variants.items():
+        run_dir = os.path.abspath(os.path.join(args.output_dir, name))
+        # The predictions are written to results/<task>.csv from the run directory.
+        os.makedirs(os.path.join(run_dir, "results"), exist_ok=True)
+        config = {
+            **base_config,
+            "num_negatives": args.num_negatives,
+            **variant_args,
+            "output_dir": os.path.join(run_dir, "outputs"),
+            "do_train": True,
+            "do_eval": True,
+            "do_predict": True,
+            "evaluation_strategy": "no",
+            "save_strategy": "no",
+            "load_best_model_at_end": False,
+        }
+        outputs = run(config, run_dir)
+        results[name] = {
+            "ms_per_step": 1000
+            * outputs["train_results"]["train_runtime"]
+            / outputs["trainer_state"]["global_step"],
+            "eval_accuracy": outputs["eval_results"]["eval_average"],
+            # The labeled test set is read from data/test, 0 if it is missing.
+            "test_accuracy": eval_test_accuracy(task, os.path.join(run_dir, "results")),
+        }
+
+    print(f"{'loss':>18s} {'ms/step':>9s} {'eval acc':>9s} {'test acc':>9s}")
+    for name, result in results.items():
+        print(
+            f"{name:>18s} {result['ms_per_step']:9.1f} {result['eval_accuracy']:9.2f} "
+            f"{result['test_accuracy']:9.4f}"
+        )
+    with open(os.path.join(args.output_dir, "results.json"), "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Caches the processed datasets on disk as Arrow files, which are memory-mapped in the next
+runs instead of processing the datasets again."""
+import hashlib
+import json
+import os
+
+# The cache key holds the processing settings, not a fingerprint of the processing code: bump
+# this version with every change of the outputs of the processing code (patterns, templates,
+# truncation, features), otherwise the runs load the features of the previous code.
+CACHE_VERSION = 2
+
+
+def get_processor_config(processor):
+    """Returns the settings of the MLMProcessor which determine its outputs."""
+    tokenizer = processor.tokenizer
+    return {
+        "tokenizer": type(tokenizer).__name__,
+        "tokenizer_name_or_path": tokenizer.name_or_path,
+        "vocab_size": len(tokenizer),
+        "task": processor.processor.name,
+        "with_pattern": processor.processor.with_pattern,
+        "pattern_id": processor.processor.pattern_id,
+        "mask_position": processor.processor.mask_position,
+        "max_seq_length": processor.max_seq_length,
+        "mask_length": processor.mask_length,
+        "tokenized_verbalizers": processor.tokenized_verbalizers,
+        # The verbalizers of the task determine the number of masks of hard PET.
+        "task_tokenized_verbalizers": processor.processor.get_tokenized_verbalizers(),
+        "train_classifier": processor.train_classifier,
+    }
+
+
+def get_cache_file_name(cache_dir, dataset, config):
+    """Returns the path of the cache file, named after the hash of the config, of the
+    fingerprint of the dataset and of the cache version."""
+    config = dict(config, fingerprint=dataset._fingerprint, version=CACHE_VERSION)
+    key = hashlib.sha256(
+        json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return os.path.join(cache_dir, f"{key}.arrow")
+
+
+def map_with_cache(dataset, function, config, cache_dir, overwrite_cache, **kwargs):
+    """Maps the function over the dataset like `datasets.Dataset.map`, and stores the
+    result in cache_dir. The next calls with the same config and dataset load the cache
+    file, unless overwrite_cache is set.
+    config: the settings which determine the outputs of the function."""
+    os.makedirs(cache_dir, exist_ok=True)
+    return dataset.map(
+        function,
+        cache_file_name=get_cache_file_name(cache_dir, dataset, config),
+        load_from_cache_file=not overwrite_cache,
+        keep_in_memory=False,
+        **kwargs,
+    )
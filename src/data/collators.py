@@ -0,0 +1,33 @@
+"""Implements data collators to batch the processed examples."""
+import torch
+
+from dataclasses import dataclass
+
+
+@dataclass
+class DataCollatorWithDynamicPadding:
+    """Pads each batch only up to the length of its longest example, the examples
+    are stored without padding. The keys missing from some of the examples, as the ones of
+    some tasks of a multi-task batch, are filled with missing_value.
+    pad_token_id: the id used to pad the input_ids.
+    missing_value: the value of the keys missing from an example, -100 as the ignored labels."""
+
+    pad_token_id: int
+    missing_value: int = -100
+
+    def __call__(self, features):
+        max_length = max(len(feature["input_ids"]) for feature in features)
+        padding_values = {"input_ids": self.pad_token_id, "attention_mask": 0}
+        keys = list(dict.fromkeys(key for feature in features for key in feature))
+        batch = {}
+        for key in keys:
+            if key in padding_values:
+                values = [
+                    feature[key]
+                    + [padding_values[key]] * (max_length - len(feature[key]))
+                    for feature in features
+                ]
+            else:
+                values = [feature.get(key, self.missing_value) for feature in features]
+            batch[key] = torch.tensor(values)
+        return batch
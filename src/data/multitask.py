@@ -0,0 +1,37 @@
+"""Concatenates the processed training sets of several tasks, to train them at once."""
+import bisect
+
+import torch
+from torch.utils.data import Dataset
+
+
+class MultiTaskDataset(Dataset):
+    """Returns the processed examples of all the tasks, with the id of their task as
+    `task_ids`. Sampled randomly, the batches mix the examples of the tasks in proportion
+    to the sizes of their training sets.
+    datasets: the processed training set of each task, as datasets or tensor stores,
+    in the order of the task ids."""
+
+    def __init__(self, datasets):
+        self.datasets = datasets
+        self.offsets = [0]
+        for dataset in datasets:
+            self.offsets.append(self.offsets[-1] + len(dataset))
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    @property
+    def num_rows(self):
+        return len(self)
+
+    def __getitem__(self, index):
+        task_id = bisect.bisect_right(self.offsets, index) - 1
+        # Both the datasets and the tensor stores return a batch of the given indices.
+        batch = self.datasets[task_id][[index - self.offsets[task_id]]]
+        features = {
+            key: values[0].tolist() if isinstance(values, torch.Tensor) else values[0]
+            for key, values in batch.items()
+        }
+        features["task_ids"] = task_id
+        return features
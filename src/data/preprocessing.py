@@ -3,6 +3,8 @@ import sys
 import torch
 from typing import List, Tuple
 
+from .utils import TemplateField
+
 
 class MLMProcessor(torch.nn.Module):
     """Process the data for a model which is pretrained with the masked
@@ -42,42 +44,81 @@ class MLMProcessor(torch.nn.Module):
             else 0
         )
 
-    # copied from pet
-    def remove_last(self, parts: List[Tuple[str, bool]]):
-        last_idx = max(
-            idx for idx, (seq, shortenable) in enumerate(parts) if shortenable and seq
-        )
-        parts[last_idx] = (parts[last_idx][0][:-1], parts[last_idx][1])
+    def remove_last(self, parts: List[Tuple[str, bool]], num_tokens: int):
+        """Removes num_tokens tokens from the end of the shortenable parts, starting from
+        the last one."""
+        for idx in reversed(range(len(parts))):
+            if num_tokens == 0:
+                break
+            seq, shortenable = parts[idx]
+            if shortenable and seq:
+                num_removed = min(num_tokens, len(seq))
+                parts[idx] = (seq[: len(seq) - num_removed], shortenable)
+                num_tokens -= num_removed
 
-    # copied from pet
     def truncate(
         self, parts_a: List[Tuple[str, bool]], parts_b: List[Tuple[str, bool]]
     ):
-        """Truncate two sequences of text to a predefined total maximum length"""
+        """Truncate two sequences of text to a predefined total maximum length. As in PET,
+        the tokens are removed one at a time from the sequence with the longest shortenable
+        parts, and from parts_b in case of ties. The number of tokens removed from each
+        sequence is computed at once. The parts are truncated in place."""
         total_len = self.seq_length(parts_a) + self.seq_length(parts_b)
         total_len += self.tokenizer.num_special_tokens_to_add(bool(parts_b))
         num_tokens_to_remove = total_len - self.max_seq_length
 
         if num_tokens_to_remove <= 0:
-            return parts_a, parts_b
-
-        for _ in range(num_tokens_to_remove):
-            if self.seq_length(parts_a, only_shortenable=True) > self.seq_length(
-                parts_b, only_shortenable=True
-            ):
-                self.remove_last(parts_a)
-            else:
-                self.remove_last(parts_b)
-
-    def tokenize(self, text_list):
-        """Gets a list of Text enteries and tokenize them, returns the output as a list of tuples with the
-        tokenized text and the shortenable entry."""
+            return
+
+        len_a = self.seq_length(parts_a, only_shortenable=True)
+        len_b = self.seq_length(parts_b, only_shortenable=True)
+        if num_tokens_to_remove > len_a + len_b:
+            raise ValueError(
+                f"Cannot remove {num_tokens_to_remove} tokens from the shortenable parts"
+                f" of length {len_a + len_b}."
+            )
+        # The longest sequence is shortened until both have the same length, then the
+        # tokens are removed alternately, starting with parts_b.
+        num_removed_a = min(num_tokens_to_remove, max(len_a - len_b, 0))
+        num_removed_b = min(num_tokens_to_remove - num_removed_a, max(len_b - len_a, 0))
+        num_remaining = num_tokens_to_remove - num_removed_a - num_removed_b
+        num_removed_a += num_remaining // 2
+        num_removed_b += num_remaining - num_remaining // 2
+        self.remove_last(parts_a, num_removed_a)
+        self.remove_last(parts_b, num_removed_b)
+
+    def tokenize_fields(self, examples, templates):
+        """Tokenizes the fields of the examples used in their templates with a single call
+        of the tokenizer, each distinct text is tokenized once. Returns for each example
+        its template parts, with the fields replaced by their token ids."""
+        texts = list(
+            dict.fromkeys(
+                example[seq.name]
+                for example, template in zip(examples, templates)
+                for parts in template
+                for seq, _ in parts
+                if isinstance(seq, TemplateField)
+            )
+        )
+        tokenized_texts = {}
+        if texts:
+            tokenized_texts = dict(
+                zip(texts, self.tokenizer(texts, add_special_tokens=False)["input_ids"])
+            )
         return [
-            (
-                self.tokenizer.encode(text.text, add_special_tokens=False),
-                text.shortenable,
+            tuple(
+                [
+                    (
+                        tokenized_texts[example[seq.name]]
+                        if isinstance(seq, TemplateField)
+                        else seq,
+                        shortenable,
+                    )
+                    for seq, shortenable in parts
+                ]
+                for parts in template
             )
-            for text in text_list
+            for example, template in zip(examples, templates)
         ]
 
     def get_tokens(self, tuple_list):
@@ -95,12 +136,12 @@ class MLMProcessor(torch.nn.Module):
             max_length=self.max_seq_length,
             truncation=True,
         )["input_ids"]
+        return self.get_classification_features(example, input_ids)
+
+    def get_classification_features(self, example, input_ids):
         target = self.processor.get_target(example=example)
+        # The examples are padded per batch in the data collator.
         attention_mask = [1] * len(input_ids)
-        n_mask = self.max_seq_length - len(input_ids)
-        # Pads the tokens and attention mask.
-        input_ids = input_ids + [self.pad_token_id] * n_mask
-        attention_mask = attention_mask + [0] * n_mask
         extra_fields = self.processor.get_extra_fields(example=example)
         return {
             "labels": int(target),
@@ -109,10 +150,40 @@ class MLMProcessor(torch.nn.Module):
             "extra_fields": extra_fields,
         }
 
-    def forward(self, example):
-        if self.train_classifier:
-            return self.prepare_classification_inputs(example)
+    def prepare_batch_classification_inputs(self, examples):
+        # Slow tokenizers encode the batches example by example.
+        if not self.tokenizer.is_fast:
+            return [self.prepare_classification_inputs(example) for example in examples]
+        parts = [
+            self.processor.get_classification_parts(example=example)
+            for example in examples
+        ]
+        # The fast `encode_plus` ignores empty second sentences, so the examples with and
+        # without a second sentence are tokenized in separate calls.
+        batch_input_ids = [None] * len(examples)
+        for with_part_1 in [False, True]:
+            indices = [
+                i for i, (_, part_1) in enumerate(parts) if bool(part_1) == with_part_1
+            ]
+            if not indices:
+                continue
+            # Roberta does not use token_type ids.
+            input_ids = self.tokenizer(
+                [parts[i][0] for i in indices],
+                [parts[i][1] for i in indices] if with_part_1 else None,
+                add_special_tokens=True,
+                max_length=self.max_seq_length,
+                truncation=True,
+            )["input_ids"]
+            for i, example_input_ids in zip(indices, input_ids):
+                batch_input_ids[i] = example_input_ids
+        return [
+            self.get_classification_features(example, input_ids)
+            for example, input_ids in zip(examples, batch_input_ids)
+        ]
 
+    def get_template(self, example):
+        """Returns the compiled pattern used for the example."""
         # For PET, we assume we have only one verbalizer per label.
         # We need not to cache it, and use the given one only if this is not None.
         tokenized_verbalizers = self.tokenized_verbalizers
@@ -126,13 +197,11 @@ class MLMProcessor(torch.nn.Module):
         else:
             mask_length = self.mask_length
 
-        part_0, part_1 = self.processor.get_sentence_parts(
-            example=example, mask_length=mask_length
-        )
+        return self.processor.get_template(mask_length)
 
+    def get_features(self, example, part_0_tuples, part_1_tuples):
+        """Truncates the tokenized parts of the example, and builds its features."""
         target = self.processor.get_target(example=example)
-        part_0_tuples = self.tokenize(part_0)
-        part_1_tuples = self.tokenize(part_1)
         self.truncate(part_0_tuples, part_1_tuples)
         token_ids_0 = self.get_tokens(part_0_tuples)
         token_ids_1 = self.get_tokens(part_1_tuples)
@@ -140,29 +209,48 @@ class MLMProcessor(torch.nn.Module):
         input_ids = self.tokenizer.build_inputs_with_special_tokens(
             token_ids_0=token_ids_0, token_ids_1=token_ids_1
         )
+        # The examples are padded per batch in the data collator.
         attention_mask = [1] * len(input_ids)
-        n_mask = self.max_seq_length - len(input_ids)
-
-        # Pads the tokens and attention mask.
-        input_ids = input_ids + [self.pad_token_id] * n_mask
-        attention_mask = attention_mask + [0] * n_mask
 
-        # Builds candidates tokens ids.
-        candidates_ids = []
+        # The masks are consecutive, the candidate tokens of the labels are placed from the
+        # first mask onward by the model.
         mask_start = input_ids.index(self.mask_token_id)
-        for verbalizers_list in tokenized_verbalizers:
-            tokens = verbalizers_list[0]
-            candidate_ids = [-100] * len(input_ids)
-            mask_end = mask_start + len(tokens)
-            candidate_ids[mask_start:mask_end] = tokens
-            candidates_ids.append(candidate_ids)
 
         extra_fields = self.processor.get_extra_fields(example=example)
 
         return {
-            "candidates_ids": candidates_ids,
+            "mask_start": mask_start,
             "labels": int(target),
             "attention_mask": attention_mask,
             "input_ids": input_ids,
             "extra_fields": extra_fields,
         }
+
+    def forward(self, example):
+        if self.train_classifier:
+            return self.prepare_classification_inputs(example)
+
+        part_0_tuples, part_1_tuples = self.tokenize_fields(
+            [example], [self.get_template(example)]
+        )[0]
+        return self.get_features(example, part_0_tuples, part_1_tuples)
+
+    def process_batch(self, batch):
+        """Processes a batch of examples given as a dictionary of columns, as passed by
+        `datasets.Dataset.map` with `batched=True`. The outputs are the same as processing
+        each example with `forward`, but the fields of the batch are tokenized at once.
+        """
+        examples = [dict(zip(batch.keys(), values)) for values in zip(*batch.values())]
+        if not examples:
+            return {}
+        if self.train_classifier:
+            features = self.prepare_batch_classification_inputs(examples)
+        else:
+            templates = [self.get_template(example) for example in examples]
+            features = [
+                self.get_features(example, part_0_tuples, part_1_tuples)
+                for example, (part_0_tuples, part_1_tuples) in zip(
+                    examples, self.tokenize_fields(examples, templates)
+                )
+            ]
+        return {key: [feature[key] for feature in features] for key in features[0]}
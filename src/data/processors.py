@@ -5,7 +5,14 @@ import string
 from collections import OrderedDict
 from unicodedata import name
 
-from .utils import Text, get_verbalization_ids, remove_final_punctuation, lowercase
+from .utils import (
+    Text,
+    TemplateField,
+    TemplateExample,
+    get_verbalization_ids,
+    remove_final_punctuation,
+    lowercase,
+)
 
 
 class AbstractProcessor(abc.ABC):
@@ -17,6 +24,7 @@ class AbstractProcessor(abc.ABC):
         self.pattern_id = pattern_id
         self.tokenized_verbalizers = None
         self.mask_position = mask_position
+        self.templates = {}
 
     def get_sentence_parts(self, example, mask_length):
         pass
@@ -48,6 +56,29 @@ class AbstractProcessor(abc.ABC):
         ]
         return self.tokenized_verbalizers
 
+    def get_template(self, mask_length):
+        """Compiles the sentence parts of the pattern once per mask_length. The constant
+        texts are tokenized, and the fields of the examples are kept as `TemplateField`s.
+        Returns part_0 and part_1 as lists of tuples with the token ids or the field, and
+        the shortenable entry."""
+        if mask_length not in self.templates:
+            parts = self.get_sentence_parts(
+                example=TemplateExample(), mask_length=mask_length
+            )
+            self.templates[mask_length] = tuple(
+                [
+                    (
+                        text.text
+                        if isinstance(text.text, TemplateField)
+                        else get_verbalization_ids(text.text, self.tokenizer),
+                        text.shortenable,
+                    )
+                    for text in part
+                ]
+                for part in parts
+            )
+        return self.templates[mask_length]
+
     def get_extra_fields(self, example=None):
         # If there is a need to keep extra information, here we keep a dictionary
         # from keys to their values.
@@ -0,0 +1,181 @@
+"""Streams the examples to predict from a file, so that large prediction sets are read,
+processed and predicted batch by batch in a constant memory."""
+
+import csv
+import json
+import os
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+def read_csv_blocks(path):
+    """Reads the records of the CSV file without parsing them, as blocks of one row holding
+    the lines of the record: a record ends on the first line where its quotes are balanced,
+    as the quotes inside the quoted fields are doubled."""
+    with open(path, newline="") as f:
+        fieldnames = None
+        lines, num_quotes = [], 0
+        for line in f:
+            lines.append(line)
+            num_quotes += line.count('"')
+            if num_quotes % 2:
+                continue
+            if fieldnames is None:
+                fieldnames = next(csv.reader(lines))
+            # Skips the empty lines, as `csv.DictReader`.
+            elif lines[0].strip("\r\n"):
+                yield 1, (fieldnames, lines)
+            lines, num_quotes = [], 0
+        if lines:
+            yield 1, (fieldnames, lines)
+
+
+def parse_csv_block(block):
+    fieldnames, lines = block
+    return list(csv.DictReader(lines, fieldnames=fieldnames))
+
+
+def read_jsonl_blocks(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield 1, line
+
+
+def parse_jsonl_block(line):
+    return [json.loads(line)]
+
+
+def read_arrow_blocks(path):
+    """Reads the record batches of the Arrow files in the stream format, as the datasets
+    cache files, or in the file format. The batches are memory-mapped, only the rows read
+    are converted to Python objects."""
+    source = pa.memory_map(path)
+    try:
+        reader = pa.ipc.open_stream(source)
+    except pa.ArrowInvalid:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        batches = iter(reader)
+    for batch in batches:
+        yield batch.num_rows, batch
+
+
+def parse_arrow_block(batch):
+    return batch
+
+
+def read_parquet_blocks(path):
+    """Reads the row groups of the Parquet file, their sizes are given by the metadata and
+    they are only decoded when some of their rows are read."""
+    parquet_file = pq.ParquetFile(path)
+    for i in range(parquet_file.num_row_groups):
+        yield parquet_file.metadata.row_group(i).num_rows, (parquet_file, i)
+
+
+def parse_parquet_block(block):
+    parquet_file, row_group = block
+    return parquet_file.read_row_group(row_group)
+
+
+# The functions reading the blocks of rows of each format, as pairs of their number of rows
+# and their unparsed content, and parsing the content of a block as a list of rows or an
+# Arrow table.
+READER_MAPPING = OrderedDict(
+    [
+        (".csv", (read_csv_blocks, parse_csv_block)),
+        (".jsonl", (read_jsonl_blocks, parse_jsonl_block)),
+        (".arrow", (read_arrow_blocks, parse_arrow_block)),
+        (".parquet", (read_parquet_blocks, parse_parquet_block)),
+    ]
+)
+
+
+def read_chunks(path, chunk_size, shard_id=0, num_shards=1):
+    """Reads lazily the rows of the file as dictionaries, in chunks of chunk_size rows,
+    keeping only the chunks whose index modulo num_shards is shard_id. The format is given
+    by the extension of the file. The blocks of rows of the file without rows in the kept
+    chunks are skipped without being parsed."""
+    extension = os.path.splitext(path)[1]
+    if extension not in READER_MAPPING:
+        raise ValueError(
+            "Unrecognized extension {} of the file to predict.\n"
+            "Extension should be one of {}.".format(
+                extension, ", ".join(c for c in READER_MAPPING.keys())
+            )
+        )
+    read_blocks, parse_block = READER_MAPPING[extension]
+    chunk = []
+    # The index in the file of the first row of the block.
+    block_start = 0
+    for num_rows, block in read_blocks(path):
+        block_end = block_start + num_rows
+        rows = None
+        start = block_start
+        while start < block_end:
+            chunk_index = start // chunk_size
+            end = min((chunk_index + 1) * chunk_size, block_end)
+            if chunk_index % num_shards == shard_id:
+                if rows is None:
+                    rows = parse_block(block)
+                chunk_rows = rows[start - block_start : end - block_start]
+                chunk.extend(
+                    chunk_rows
+                    if isinstance(chunk_rows, list)
+                    else chunk_rows.to_pylist()
+                )
+                if end % chunk_size == 0:
+                    yield chunk
+                    chunk = []
+            start = end
+        block_start = block_end
+    if chunk:
+        yield chunk
+
+
+class StreamingPredictionDataset(IterableDataset):
+    """Yields the IDs and the collated inputs of the batches of examples read from the file.
+    The examples are read and processed in the workers of the dataloader, each worker
+    reading every num_workers-th batch and skipping the others without parsing them, so
+    the dataloader, which takes the batches of the workers in turn, yields them in the
+    order of the file. The dataloader should be created with batch_size=None, as the
+    batches are already collated.
+    path: a CSV, JSONL, Arrow or Parquet file, with the fields of the task and an ID column.
+    processor: the MLMProcessor of the task.
+    data_collator: the collator used to batch the processed examples.
+    batch_size: the number of examples per batch."""
+
+    # The examples to predict are unlabeled, they get the label of the unlabeled RAFT
+    # test examples.
+    unlabeled = 0
+
+    def __init__(self, path, processor, data_collator, batch_size, id_column="ID"):
+        self.path = path
+        self.processor = processor
+        self.data_collator = data_collator
+        self.batch_size = batch_size
+        self.id_column = id_column
+
+    def process_chunk(self, rows):
+        ids = [row.pop(self.id_column) for row in rows]
+        for row in rows:
+            row["Label"] = self.unlabeled
+        batch = {key: [row.get(key) for row in rows] for key in rows[0]}
+        features = self.processor.process_batch(batch)
+        features.pop("extra_fields")
+        features = [
+            dict(zip(features.keys(), values)) for values in zip(*features.values())
+        ]
+        return ids, self.data_collator(features)
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = 0, 1
+        if worker_info is not None:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+        for rows in read_chunks(self.path, self.batch_size, worker_id, num_workers):
+            yield self.process_chunk(rows)
@@ -0,0 +1,178 @@
+"""Stores the processed datasets as memory-mapped arrays of fixed shapes, from which whole
+batches are sliced as tensors, without collating the examples in python."""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from .cache import get_cache_file_name
+
+# The columns of variable length, which are padded to the longest example of the dataset
+# and cut to the longest example of each batch.
+PADDED_COLUMNS = ("input_ids", "attention_mask")
+LENGTHS_NAME = "lengths"
+METADATA_NAME = "metadata.json"
+# The number of examples read at once from the dataset while writing the store.
+WRITE_BATCH_SIZE = 1000
+
+
+def get_integer_dtype(min_value, max_value):
+    """Returns the smallest signed integer dtype which holds the values."""
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return dtype
+    return np.int64
+
+
+def iterate_batches(dataset):
+    for start in range(0, dataset.num_rows, WRITE_BATCH_SIZE):
+        yield dataset[start : start + WRITE_BATCH_SIZE]
+
+
+def save_tensor_store(dataset, path, pad_token_id):
+    """Writes each column of the processed dataset to a .npy array in path, the columns of
+    `PADDED_COLUMNS` are padded to the longest example with pad_token_id for the input_ids
+    and 0 for the attention_mask, and their lengths are written to `LENGTHS_NAME`."""
+    padding_values = {"input_ids": pad_token_id, "attention_mask": 0}
+    # Finds the shapes and the ranges of values of the columns.
+    shapes, ranges = {}, {}
+    lengths = []
+    for batch in iterate_batches(dataset):
+        lengths.extend(len(input_ids) for input_ids in batch["input_ids"])
+        for name, values in batch.items():
+            if name in PADDED_COLUMNS:
+                values = [value for row in values for value in row]
+                values.append(padding_values[name])
+                values = np.array(values)
+            else:
+                values = np.array(values)
+                if shapes.setdefault(name, values.shape[1:]) != values.shape[1:]:
+                    raise ValueError(
+                        f"The column {name} has examples of different shapes, only the "
+                        f"columns {PADDED_COLUMNS} can have a variable length."
+                    )
+            low, high = ranges.get(name, (0, 0))
+            ranges[name] = (min(low, values.min()), max(high, values.max()))
+
+    num_rows, max_length = len(lengths), max(lengths, default=0)
+    for name in PADDED_COLUMNS:
+        shapes[name] = (max_length,)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+    arrays = {
+        name: np.lib.format.open_memmap(
+            os.path.join(tmp_path, f"{name}.npy"),
+            mode="w+",
+            dtype=get_integer_dtype(*ranges[name]),
+            shape=(num_rows,) + shapes[name],
+        )
+        for name in dataset.column_names
+    }
+    start = 0
+    for batch in iterate_batches(dataset):
+        end = start + len(batch["input_ids"])
+        for name, values in batch.items():
+            if name in PADDED_COLUMNS:
+                arrays[name][start:end] = padding_values[name]
+                for i, row in enumerate(values):
+                    arrays[name][start + i, : len(row)] = row
+            else:
+                arrays[name][start:end] = values
+        start = end
+    for array in arrays.values():
+        array.flush()
+    np.save(
+        os.path.join(tmp_path, f"{LENGTHS_NAME}.npy"),
+        np.array(lengths, dtype=get_integer_dtype(0, max_length)),
+    )
+    with open(os.path.join(tmp_path, METADATA_NAME), "w") as f:
+        json.dump({"num_rows": num_rows, "columns": dataset.column_names}, f)
+
+    # The store is moved in place once complete, so that concurrent runs never read a
+    # partially written store.
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another run has written the same store in the meantime.
+        shutil.rmtree(tmp_path)
+
+
+class TensorStore(Dataset):
+    """Reads a store written by `save_tensor_store`. The arrays are memory-mapped, so their
+    pages are loaded lazily and shared through the page cache with the concurrent runs.
+    Indexing the store with the list of indices of a batch returns the collated batch,
+    the padded columns being cut to the longest example of the batch. The tensors of
+    consecutive indices are views of the memory-mapped arrays."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, METADATA_NAME)) as f:
+            self.metadata = json.load(f)
+        # Copy-on-write mapping, the arrays are never written but torch requires
+        # writable arrays.
+        self.arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="c")
+            for name in self.column_names + [LENGTHS_NAME]
+        }
+
+    @property
+    def column_names(self):
+        return list(self.metadata["columns"])
+
+    @property
+    def num_rows(self):
+        return self.metadata["num_rows"]
+
+    @property
+    def lengths(self):
+        return self.arrays[LENGTHS_NAME]
+
+    def __len__(self):
+        return self.num_rows
+
+    def get_column(self, name):
+        """Returns the values of the column as lists, like the columns of the datasets."""
+        if name in PADDED_COLUMNS:
+            return [
+                row[:length].tolist()
+                for row, length in zip(self.arrays[name], self.lengths)
+            ]
+        return self.arrays[name].tolist()
+
+    def __getitem__(self, indices):
+        if isinstance(indices, str):
+            return self.get_column(indices)
+        indices = np.asarray(indices)
+        rows = indices
+        if len(indices) > 0 and np.all(np.diff(indices) == 1):
+            rows = slice(int(indices[0]), int(indices[-1]) + 1)
+        max_length = int(self.lengths[rows].max())
+        batch = {}
+        for name in self.column_names:
+            values = self.arrays[name][rows]
+            if name in PADDED_COLUMNS:
+                values = values[:, :max_length]
+            batch[name] = torch.from_numpy(values)
+        return batch
+
+
+def get_tensor_store(dataset, cache_dir, pad_token_id, overwrite_cache):
+    """Returns the tensor store of the processed dataset, which is written in cache_dir
+    if it does not exist yet or if overwrite_cache is set."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.splitext(
+        get_cache_file_name(
+            cache_dir,
+            dataset,
+            {"function": "tensor_store", "pad_token_id": pad_token_id},
+        )
+    )[0]
+    if overwrite_cache or not os.path.isfile(os.path.join(path, METADATA_NAME)):
+        save_tensor_store(dataset, path, pad_token_id)
+    return TensorStore(path)
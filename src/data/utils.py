@@ -1,4 +1,5 @@
 """Defines the utilities to process the datasets."""
+import functools
 import string
 import torch
 
@@ -6,6 +7,9 @@ from dataclasses import dataclass
 from typing import Optional
 from transformers.file_utils import ModelOutput
 
+# The maximum number of verbalizers whose tokens are memoized.
+VERBALIZERS_CACHE_SIZE = 65536
+
 
 @dataclass
 class Text(ModelOutput):
@@ -13,9 +17,29 @@ class Text(ModelOutput):
     text: str = None
 
 
+@dataclass(frozen=True)
+class TemplateField:
+    """Stands for a field of the examples in the compiled patterns."""
+
+    name: str
+
+
+class TemplateExample(dict):
+    """An example whose fields are `TemplateField`s, used to compile the patterns."""
+
+    def __missing__(self, key):
+        return TemplateField(name=key)
+
+
+@functools.lru_cache(maxsize=VERBALIZERS_CACHE_SIZE)
+def _get_verbalization_ids(word, tokenizer):
+    return tuple(tokenizer.encode(word, add_special_tokens=False))
+
+
 def get_verbalization_ids(word, tokenizer):
-    """Tokenize a verbalization word and return the tokens."""
-    return tokenizer.encode(word, add_special_tokens=False)
+    """Tokenize a verbalization word and return the tokens. The tokens are memoized in a
+    LRU cache shared by all the processors, as the verbalizers repeat across examples."""
+    return list(_get_verbalization_ids(word, tokenizer))
 
 
 def remove_final_punctuation(word):
@@ -0,0 +1,118 @@
+"""Implements writers to save the predictions on the test sets incrementally,
+while the batches are being predicted."""
+import abc
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class AbstractPredictionWriter(abc.ABC):
+    """Writes the predictions of each batch as soon as they are computed.
+    path: path of the output file without the extension.
+    ids: the IDs of the test examples, in the order they are predicted, or None if the IDs
+        are given with each batch.
+    verbalizers: the verbalizer of each label, which is written as the label."""
+
+    extension = NotImplemented
+
+    def __init__(self, path, ids, verbalizers):
+        self.path = path + self.extension
+        self.ids = ids
+        self.verbalizers = verbalizers
+        self.num_written = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_batch(self, logits, ids=None):
+        """Returns the IDs and labels of the given batch of label scores."""
+        start = self.num_written
+        self.num_written += logits.shape[0]
+        if ids is None:
+            ids = self.ids[start : self.num_written]
+        labels = [self.verbalizers[label] for label in np.argmax(logits, axis=1)]
+        return ids, labels
+
+    def open(self):
+        pass
+
+    def write(self, logits, ids=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class CSVPredictionWriter(AbstractPredictionWriter):
+    """Writes the predicted labels in the format of the RAFT submissions."""
+
+    extension = ".csv"
+
+    def open(self):
+        self.file = open(self.path, "w+")
+        self.file.write("ID,Label" + "\n")
+
+    def write(self, logits, ids=None):
+        ids, labels = self.get_batch(logits, ids)
+        self.file.write(
+            "".join(str(id) + "," + label + "\n" for id, label in zip(ids, labels))
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetPredictionWriter(AbstractPredictionWriter):
+    """Writes the predicted labels together with the scores of all the labels."""
+
+    extension = ".parquet"
+
+    def open(self):
+        self.writer = None
+
+    def write(self, logits, ids=None):
+        ids, labels = self.get_batch(logits, ids)
+        scores = pa.FixedSizeListArray.from_arrays(
+            pa.array(logits.astype(np.float32).reshape(-1)), logits.shape[1]
+        )
+        table = pa.Table.from_arrays(
+            [pa.array(ids), pa.array(labels), scores], names=["ID", "Label", "Scores"]
+        )
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITER_MAPPING = OrderedDict(
+    [
+        ("csv", CSVPredictionWriter),
+        ("parquet", ParquetPredictionWriter),
+    ]
+)
+
+
+class AutoPredictionWriter:
+    @classmethod
+    def get(self, output_format, path, ids, verbalizers):
+        if output_format in WRITER_MAPPING:
+            return WRITER_MAPPING[output_format](
+                path=path,
+                ids=ids,
+                verbalizers=verbalizers,
+            )
+        raise ValueError(
+            "Unrecognized format {} for AutoPredictionWriter.\n"
+            "Format should be one of {}.".format(
+                output_format, ", ".join(c for c in WRITER_MAPPING.keys())
+            )
+        )
@@ -0,0 +1,114 @@
+"""
+Exports a trained soft-PET prototypical classifier to ONNX or TorchScript, and checks the
+exported artifact against the eager model on a few test examples.
+
+Usage: python src/export.py configs/export.json, with `model_name_or_path` set to the trained checkpoint.
+"""
+
+import logging
+import os
+import sys
+
+os.environ["WANDB_DISABLED"] = "true"
+
+from transformers import HfArgumentParser
+
+from training_args import (
+    ModelArguments,
+    DataTrainingArguments,
+    FewShotTrainingArguments,
+    AdapterArguments,
+    ExportArguments,
+)
+from data.tasks import AutoTask
+from serving import load_predictor
+from serving.export import (
+    get_prototypical_classifier,
+    export_prototypical_classifier,
+    check_parity,
+    RUNNER_MAPPING,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = HfArgumentParser(
+        (
+            ModelArguments,
+            DataTrainingArguments,
+            FewShotTrainingArguments,
+            AdapterArguments,
+            ExportArguments,
+        )
+    )
+    if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
+        (
+            model_args,
+            data_args,
+            training_args,
+            adapter_args,
+            export_args,
+        ) = parser.parse_json_file(json_file=os.path.abspath(sys.argv[1]))
+    else:
+        (
+            model_args,
+            data_args,
+            training_args,
+            adapter_args,
+            export_args,
+        ) = parser.parse_args_into_dataclasses()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%m/%d/%Y %H:%M:%S",
+        handlers=[logging.StreamHandler(sys.stdout)],
+        level=logging.INFO,
+    )
+
+    predictor = load_predictor(model_args, data_args, training_args, adapter_args)
+    classifier = get_prototypical_classifier(predictor.trainer).cpu()
+
+    # Uses a few test examples to trace the model and to check the parity.
+    task = AutoTask.get(
+        task=data_args.task,
+        data_seed=data_args.data_seed,
+        cache_dir=model_args.cache_dir,
+        data_dir=data_args.data_dir,
+    )
+    test_dataset = task.get_datasets()["test"]
+    examples = [
+        test_dataset[i]
+        for i in range(min(export_args.num_parity_examples, test_dataset.num_rows))
+    ]
+    features = [predictor.preprocess(example) for example in examples]
+    trace_inputs = predictor.data_collator(features[:2])
+
+    export_path = export_args.export_path
+    if export_path is None:
+        extension = ".onnx" if export_args.export_format == "onnx" else ".pt"
+        export_path = os.path.join(
+            model_args.model_name_or_path, "prototypical_classifier" + extension
+        )
+    export_prototypical_classifier(
+        classifier,
+        trace_inputs,
+        export_path,
+        export_format=export_args.export_format,
+        opset_version=export_args.opset_version,
+    )
+
+    # Checks the parity on batches of other sizes and lengths than the traced one.
+    runner = RUNNER_MAPPING[export_args.export_format](
+        export_path,
+        data_collator=predictor.data_collator,
+        batch_size=training_args.per_device_eval_batch_size,
+    )
+    parity_batches = [
+        predictor.data_collator(features[i : i + 3]) for i in range(0, len(features), 3)
+    ]
+    check_parity(classifier, runner, parity_batches, atol=export_args.parity_atol)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,9 @@ import numpy as np
 import os
 import sys
 import functools
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
 from tqdm import tqdm
 
 os.environ["WANDB_DISABLED"] = "true"
@@ -21,7 +24,6 @@ import transformers
 from transformers import (
     AutoTokenizer,
     HfArgumentParser,
-    default_data_collator,
     set_seed,
 )
 from transformers.trainer_utils import get_last_checkpoint
@@ -32,17 +34,15 @@ from models import (
     RobertaForMaskedLM,
     RobertaConfig,
     RobertaForSequenceClassification,
+    MultiTaskModel,
 )
-from trainers import BaseTrainer
+from trainers import BaseTrainer, MultiTaskTrainer, CENTROIDS_NAME
 from utils.utils import (
     load_json,
     get_adapter_config,
-    set_trainable_params_for_adapters,
     set_config_args,
-    freeze_model,
-    set_layernorms_trainable_params,
-    set_trainable_params_for_bitfit,
-    set_trainable_params_for_prompt_tuning,
+    set_trainable_params,
+    share_frozen_parameters,
 )
 from training_args import (
     ModelArguments,
@@ -53,6 +53,12 @@ from training_args import (
 from data.preprocessing import MLMProcessor
 from data.tasks import AutoTask
 from data.processors import AutoProcessor
+from data.writers import AutoPredictionWriter
+from data.collators import DataCollatorWithDynamicPadding
+from data.cache import map_with_cache, get_processor_config
+from data.tensor_store import get_tensor_store
+from data.streaming import StreamingPredictionDataset
+from data.multitask import MultiTaskDataset
 
 # Will error if the minimal version of Transformers is not installed. Remove at your own risks.
 check_min_version("4.10.0")
@@ -65,8 +71,8 @@ require_version(
 logger = logging.getLogger(__name__)
 
 
-def main():
-    parser = HfArgumentParser(
+def get_parser():
+    return HfArgumentParser(
         (
             ModelArguments,
             DataTrainingArguments,
@@ -75,63 +81,24 @@ def main():
         )
     )
 
-    if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
-        model_args, data_args, training_args, adapter_args = parser.parse_json_file(
-            json_file=os.path.abspath(sys.argv[1])
-        )
-    else:
-        (
-            model_args,
-            data_args,
-            training_args,
-            adapter_args,
-        ) = parser.parse_args_into_dataclasses()
-
-    if training_args.classifier_eval or training_args.prototypical_eval:
-        assert training_args.classifier_eval != training_args.prototypical_eval
 
-    # Setup logging
-    logging.basicConfig(
-        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
-        datefmt="%m/%d/%Y %H:%M:%S",
-        handlers=[logging.StreamHandler(sys.stdout)],
-    )
+@dataclass
+class TaskSetup:
+    """The trainer of a task, with its arguments and the data to predict."""
 
-    log_level = training_args.get_process_log_level()
-    logger.setLevel(log_level)
-    datasets.utils.logging.set_verbosity(log_level)
-    transformers.utils.logging.set_verbosity(log_level)
-    transformers.utils.logging.enable_default_handler()
-    transformers.utils.logging.enable_explicit_format()
+    data_args: DataTrainingArguments
+    training_args: FewShotTrainingArguments
+    trainer: BaseTrainer
+    processor: MLMProcessor
+    raw_datasets: datasets.DatasetDict
+    verbalizers: List[str]
+    predict_dataset: Optional[datasets.Dataset] = None
 
-    # Log on each process the small summary:
-    logger.warning(
-        f"Process rank: {training_args.local_rank}, device: {training_args.device}, n_gpu: {training_args.n_gpu}"
-        + f"distributed training: {bool(training_args.local_rank != -1)}, 16-bits training: {training_args.fp16}"
-    )
-    logger.info(f"Training/evaluation parameters {training_args}")
-
-    # Detecting last checkpoint.
-    last_checkpoint = None
-    if (
-        os.path.isdir(training_args.output_dir)
-        and training_args.do_train
-        and not training_args.overwrite_output_dir
-    ):
-        last_checkpoint = get_last_checkpoint(training_args.output_dir)
-        if last_checkpoint is None and len(os.listdir(training_args.output_dir)) > 0:
-            raise ValueError(
-                f"Output directory ({training_args.output_dir}) already exists and is not empty. "
-                "Use --overwrite_output_dir to overcome."
-            )
-        elif (
-            last_checkpoint is not None and training_args.resume_from_checkpoint is None
-        ):
-            logger.info(
-                f"Checkpoint detected, resuming training at {last_checkpoint}. To avoid this behavior, change "
-                "the `--output_dir` or add `--overwrite_output_dir` to train from scratch."
-            )
 
+def setup_task(model_args, data_args, training_args, adapter_args, shared_model=None):
+    """Builds the model of the task and its trainer, on the processed datasets of the task.
+    shared_model: in the multi-task training, the model of the first task, with which the
+    frozen parameters of the model are shared."""
     # Set seed before initializing model.
     set_seed(training_args.seed)
 
@@ -231,25 +198,47 @@ def main():
             training_args.num_extra_tokens = max(
                 [len(t[0]) for t in processor.get_tokenized_verbalizers()]
             )
-        else:
+        elif training_args.soft_pet:
             # when dataset has dynamic verbalizers, we need to go through the whole training examples,
-            # and compute the maximum length of the verbalizers.
-            def get_max_num_verbalizers_tokens(example, processor):
-                max_verbalizer_length = max(
-                    [len(t[0]) for t in processor.get_tokenized_verbalizers(example)]
-                )
-                return {"length": max_verbalizer_length}
-
-            max_lengths = raw_datasets["train"].map(
-                functools.partial(get_max_num_verbalizers_tokens, processor=processor),
-                batched=False,
+            # and compute the maximum length of the verbalizers. This is only needed for soft_pet, where
+            # all the examples have this number of masks. The lengths are recorded as a column in a single
+            # batched pass, which is cached as the processed datasets.
+            def get_verbalizers_lengths(examples, processor):
+                rows = [
+                    dict(zip(examples.keys(), values))
+                    for values in zip(*examples.values())
+                ]
+                return {
+                    "verbalizers_length": [
+                        max(
+                            [
+                                len(t[0])
+                                for t in processor.get_tokenized_verbalizers(row)
+                            ]
+                        )
+                        for row in rows
+                    ]
+                }
+
+            verbalizers_lengths = map_with_cache(
+                raw_datasets["train"],
+                functools.partial(get_verbalizers_lengths, processor=processor),
+                config={
+                    "function": "verbalizers_length",
+                    "tokenizer_name_or_path": tokenizer.name_or_path,
+                    "vocab_size": len(tokenizer),
+                    "task": processor.name,
+                },
+                cache_dir=data_args.preprocessing_cache_dir,
+                overwrite_cache=data_args.overwrite_cache,
+                batched=True,
                 num_proc=data_args.preprocessing_num_workers,
-                # FIXME:
-                keep_in_memory=True,
-                load_from_cache_file=False,
+                remove_columns=raw_datasets["train"].column_names,
                 desc="Finding the length of max verbalizer in the training set",
             )
-            training_args.num_extra_tokens = max(max_lengths["length"])
+            training_args.num_extra_tokens = max(
+                verbalizers_lengths["verbalizers_length"]
+            )
 
     if training_args.soft_pet:
         start = config.vocab_size
@@ -349,16 +338,10 @@ def main():
         model.create_prompt_embedding()
 
     # freeze parameters.
-    if adapter_args.adapter_tune:
-        set_trainable_params_for_adapters(model, adapter_args.tune_layernorms)
-    if adapter_args.freeze_model:
-        freeze_model(model)
-    if adapter_args.tune_layernorms:
-        set_layernorms_trainable_params(model, adapter_args.tune_layernorms)
-    if adapter_args.tune_biases:
-        set_trainable_params_for_bitfit(model, adapter_args.tune_lm_head)
-    if training_args.prompt_tune:
-        set_trainable_params_for_prompt_tuning(model)
+    set_trainable_params(model, adapter_args, prompt_tune=training_args.prompt_tune)
+    # In the multi-task training, the frozen backbone is shared with the first task.
+    if shared_model is not None:
+        share_frozen_parameters(shared_model, model)
     if adapter_args.print_params:
         total_trainable_params = sum(
             p.numel() for p in model.parameters() if p.requires_grad
@@ -381,6 +364,8 @@ def main():
         targets = [int(target) - 1 for target in targets]
         return {"targets": targets}
 
+    # The processed datasets are cached on disk, and loaded in the next runs with the same settings.
+    processor_config = get_processor_config(processor)
     if training_args.do_train:
         if "train" not in raw_datasets:
             raise ValueError("--do_train requires a train dataset")
@@ -388,17 +373,19 @@ def main():
         if data_args.max_train_samples is not None:
             train_dataset = train_dataset.select(range(data_args.max_train_samples))
         with training_args.main_process_first(desc="train dataset map pre-processing"):
-            train_dataset = train_dataset.map(
-                processor,
-                batched=False,
+            train_dataset = map_with_cache(
+                train_dataset,
+                processor.process_batch,
+                config=processor_config,
+                cache_dir=data_args.preprocessing_cache_dir,
+                overwrite_cache=data_args.overwrite_cache,
+                batched=True,
                 num_proc=data_args.preprocessing_num_workers,
                 remove_columns=column_names,
-                # FIXME:
-                keep_in_memory=True,
-                load_from_cache_file=False,  # not data_args.overwrite_cache,
                 desc="Running tokenizer on train dataset",
             )
 
+    eval_targets = None
     if training_args.do_eval:
         if "validation" not in raw_datasets:
             raise ValueError("--do_eval requires a validation dataset")
@@ -408,28 +395,34 @@ def main():
         with training_args.main_process_first(
             desc="validation dataset map pre-processing"
         ):
-            eval_targets = eval_dataset.map(
+            eval_targets = map_with_cache(
+                eval_dataset,
                 extract_targets,
+                config={"function": "extract_targets"},
+                cache_dir=data_args.preprocessing_cache_dir,
+                overwrite_cache=data_args.overwrite_cache,
                 batched=True,
                 num_proc=data_args.preprocessing_num_workers,
                 remove_columns=column_names,
-                # FIXME:
-                keep_in_memory=True,
-                load_from_cache_file=False,
                 desc="Running tokenizer on eval dataset",
             )
-            eval_dataset = eval_dataset.map(
-                processor,
-                batched=False,
+            eval_dataset = map_with_cache(
+                eval_dataset,
+                processor.process_batch,
+                config=processor_config,
+                cache_dir=data_args.preprocessing_cache_dir,
+                overwrite_cache=data_args.overwrite_cache,
+                batched=True,
                 num_proc=data_args.preprocessing_num_workers,
                 remove_columns=column_names,
-                # FIXME:
-                keep_in_memory=True,
-                load_from_cache_file=False,  # not data_args.overwrite_cache,
                 desc="Running tokenizer on validation dataset",
             )
 
-    if training_args.do_predict:
+    # With a predict_file, the examples are processed while predicting.
+    process_predict_dataset = (
+        training_args.do_predict and data_args.predict_file is None
+    )
+    if process_predict_dataset:
         if "test" not in raw_datasets:
             raise ValueError("--do_predict requires a test dataset")
         predict_dataset = raw_datasets["test"]
@@ -440,24 +433,25 @@ def main():
         with training_args.main_process_first(
             desc="prediction dataset map pre-processing"
         ):
-            predict_dataset = predict_dataset.map(
-                processor,
-                batched=False,
+            predict_dataset = map_with_cache(
+                predict_dataset,
+                processor.process_batch,
+                config=processor_config,
+                cache_dir=data_args.preprocessing_cache_dir,
+                overwrite_cache=data_args.overwrite_cache,
+                batched=True,
                 num_proc=data_args.preprocessing_num_workers,
                 remove_columns=column_names,
-                # FIXME:
-                keep_in_memory=True,
-                load_from_cache_file=False,  # not data_args.overwrite_cache,
                 desc="Running tokenizer on predict dataset",
             )
 
-    data_collator = default_data_collator
+    data_collator = DataCollatorWithDynamicPadding(pad_token_id=tokenizer.pad_token_id)
     all_datasets = {}
     if training_args.do_train:
         all_datasets["train"] = train_dataset
     if training_args.do_eval:
         all_datasets["eval"] = eval_dataset
-    if training_args.do_predict:
+    if process_predict_dataset:
         all_datasets["predict"] = predict_dataset
 
     extra_info = {k: v["extra_fields"] for k, v in all_datasets.items()}
@@ -466,9 +460,24 @@ def main():
         train_dataset = train_dataset.remove_columns("extra_fields")
     if training_args.do_eval:
         eval_dataset = eval_dataset.remove_columns("extra_fields")
-    if training_args.do_predict:
+    if process_predict_dataset:
         predict_dataset = predict_dataset.remove_columns("extra_fields")
 
+    if data_args.use_tensor_store:
+        get_store = functools.partial(
+            get_tensor_store,
+            cache_dir=data_args.preprocessing_cache_dir,
+            pad_token_id=tokenizer.pad_token_id,
+            overwrite_cache=data_args.overwrite_cache,
+        )
+        with training_args.main_process_first(desc="writing the tensor stores"):
+            if training_args.do_train:
+                train_dataset = get_store(train_dataset)
+            if training_args.do_eval:
+                eval_dataset = get_store(eval_dataset)
+            if process_predict_dataset:
+                predict_dataset = get_store(predict_dataset)
+
     # Initialize our Trainer
     trainer = BaseTrainer(
         model=model,
@@ -477,13 +486,261 @@ def main():
         train_dataset=train_dataset if training_args.do_train else None,
         eval_dataset=eval_dataset if training_args.do_eval else None,
         tokenizer=tokenizer,
-        # Data collator will default to DataCollatorWithPadding, so we change it.
+        # Pads each batch to the length of its longest example.
         data_collator=data_collator,
         task=data_args.task,
         metrics=task.metric,
         extra_info=extra_info,
     )
 
+    # When loading a trained checkpoint, uses the centroids saved with it, so there is no
+    # need to load and encode the training set to predict.
+    centroids_path = os.path.join(model_args.model_name_or_path or "", CENTROIDS_NAME)
+    if (
+        not training_args.do_train
+        and training_args.prototypical_eval
+        and os.path.isfile(centroids_path)
+    ):
+        logger.info(f"Loading the train centroids from {centroids_path}")
+        trainer.load_centroids(centroids_path)
+
+    return TaskSetup(
+        data_args=data_args,
+        training_args=training_args,
+        trainer=trainer,
+        processor=processor,
+        raw_datasets=raw_datasets,
+        verbalizers=verbalizers_tags,
+        predict_dataset=predict_dataset if process_predict_dataset else None,
+    )
+
+
+def evaluate_task(setup):
+    """Evaluates the task on its validation set, and saves the metrics."""
+    trainer, data_args = setup.trainer, setup.data_args
+    logger.info("*** Evaluate ***")
+    metrics = trainer.evaluate()
+    eval_dataset = trainer.eval_dataset
+    eval_samples = (
+        eval_dataset[0].num_rows
+        if isinstance(eval_dataset, list)
+        else eval_dataset.num_rows
+    )
+    max_eval_samples = (
+        data_args.max_eval_samples
+        if data_args.max_eval_samples is not None
+        else eval_samples
+    )
+    metrics["eval_samples"] = min(max_eval_samples, eval_samples)
+    trainer.log_metrics("eval", metrics)
+    trainer.save_metrics("eval", metrics)
+
+
+def predict_task(setup):
+    """Writes the predictions of the test set of the task, or of its predict_file, in
+    results/<task>."""
+    trainer, data_args, training_args = (
+        setup.trainer,
+        setup.data_args,
+        setup.training_args,
+    )
+    # Writes the predictions of each batch while predicting.
+    if data_args.predict_file is not None:
+        ids = None
+        predictions = trainer.predict_stream(
+            StreamingPredictionDataset(
+                path=data_args.predict_file,
+                processor=setup.processor,
+                data_collator=trainer.data_collator,
+                batch_size=training_args.per_device_eval_batch_size,
+            )
+        )
+    else:
+        # Fetches the IDs once, the batches are predicted in the order of the test set.
+        ids = setup.raw_datasets["test"]["ID"]
+        predictions = (
+            (None, logits) for logits in trainer.predict_batches(setup.predict_dataset)
+        )
+    with AutoPredictionWriter.get(
+        output_format=training_args.predict_output_format,
+        path=os.path.join("results", data_args.task),
+        ids=ids,
+        verbalizers=setup.verbalizers,
+    ) as writer:
+        for batch_ids, logits in tqdm(predictions):
+            writer.write(logits, batch_ids)
+
+
+def train_multitask(data_args, training_args, last_checkpoint):
+    """Trains the tasks of data_args.task_configs at once, with a single frozen backbone.
+    The training arguments are the ones of training_args, the other arguments of each task
+    are read from its config. Each task is then saved, evaluated and predicted as in its
+    separate run, in training_args.output_dir/<task>."""
+    parser = get_parser()
+    setups = OrderedDict()
+    shared_model = None
+    for task_config in data_args.task_configs:
+        (
+            task_model_args,
+            task_data_args,
+            task_training_args,
+            task_adapter_args,
+        ) = parser.parse_json_file(json_file=os.path.abspath(task_config))
+        if (
+            not task_training_args.do_train
+            or not (task_adapter_args.adapter_tune or task_adapter_args.freeze_model)
+            or task_training_args.prompt_tune
+        ):
+            raise ValueError(
+                f"The multi-task training requires do_train and a frozen backbone, with adapter_tune or "
+                f"freeze_model, without prompt_tune, in {task_config}."
+            )
+        if task_data_args.task in setups:
+            raise ValueError(
+                f"The task {task_data_args.task} is given twice to the multi-task training."
+            )
+        # The examples of the tasks are batched together, so they should be processed the
+        # same way, with the same features.
+        for mode in ["soft_pet", "train_classifier"]:
+            if setups and getattr(task_training_args, mode) != getattr(
+                next(iter(setups.values())).training_args, mode
+            ):
+                raise ValueError(
+                    f"The tasks of the multi-task training should share {mode}, which differs in {task_config}."
+                )
+        if (
+            shared_model is not None
+            and task_model_args.model_name_or_path
+            != shared_model.config.model_name_or_path
+        ):
+            raise ValueError(
+                "The tasks of the multi-task training should share the model_name_or_path."
+            )
+        task_training_args.output_dir = os.path.join(
+            training_args.output_dir, task_data_args.task
+        )
+        setup = setup_task(
+            task_model_args,
+            task_data_args,
+            task_training_args,
+            task_adapter_args,
+            shared_model=shared_model,
+        )
+        if shared_model is None:
+            shared_model_trainer = setup.trainer
+            shared_model = shared_model_trainer.model
+        if setup.trainer.is_world_process_zero():
+            os.makedirs(task_training_args.output_dir, exist_ok=True)
+            setup.trainer.save_metrics("arguments", load_json(task_config))
+        setups[task_data_args.task] = setup
+
+    task_trainers = OrderedDict((task, setup.trainer) for task, setup in setups.items())
+    trainer = MultiTaskTrainer(
+        task_trainers=task_trainers,
+        model=MultiTaskModel(
+            OrderedDict((task, t.model) for task, t in task_trainers.items())
+        ),
+        args=training_args,
+        train_dataset=MultiTaskDataset(
+            [t.train_dataset for t in task_trainers.values()]
+        ),
+        # The tasks share the tokenizer, so their examples are padded the same way.
+        data_collator=shared_model_trainer.data_collator,
+    )
+    if trainer.is_world_process_zero():
+        os.makedirs(training_args.output_dir, exist_ok=True)
+        trainer.save_metrics("arguments", load_json(sys.argv[1]))
+
+    checkpoint = None
+    if training_args.resume_from_checkpoint is not None:
+        checkpoint = training_args.resume_from_checkpoint
+    elif last_checkpoint is not None:
+        checkpoint = last_checkpoint
+    train_result = trainer.train(resume_from_checkpoint=checkpoint)
+    trainer.save_model()
+    metrics = train_result.metrics
+    metrics["train_samples"] = len(trainer.train_dataset)
+    trainer.log_metrics("train", metrics)
+    trainer.save_metrics("train", metrics)
+    trainer.save_state()
+
+    for setup in setups.values():
+        # Saves the checkpoint of the task with its centroids, as its separate run.
+        setup.trainer.save_model()
+        if setup.training_args.do_eval:
+            evaluate_task(setup)
+        if setup.training_args.do_predict:
+            predict_task(setup)
+
+
+def main():
+    parser = get_parser()
+
+    if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
+        model_args, data_args, training_args, adapter_args = parser.parse_json_file(
+            json_file=os.path.abspath(sys.argv[1])
+        )
+    else:
+        (
+            model_args,
+            data_args,
+            training_args,
+            adapter_args,
+        ) = parser.parse_args_into_dataclasses()
+
+    if training_args.classifier_eval or training_args.prototypical_eval:
+        assert training_args.classifier_eval != training_args.prototypical_eval
+
+    # Setup logging
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%m/%d/%Y %H:%M:%S",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+
+    log_level = training_args.get_process_log_level()
+    logger.setLevel(log_level)
+    datasets.utils.logging.set_verbosity(log_level)
+    transformers.utils.logging.set_verbosity(log_level)
+    transformers.utils.logging.enable_default_handler()
+    transformers.utils.logging.enable_explicit_format()
+
+    # Log on each process the small summary:
+    logger.warning(
+        f"Process rank: {training_args.local_rank}, device: {training_args.device}, n_gpu: {training_args.n_gpu}"
+        + f"distributed training: {bool(training_args.local_rank != -1)}, 16-bits training: {training_args.fp16}"
+    )
+    logger.info(f"Training/evaluation parameters {training_args}")
+
+    # Detecting last checkpoint.
+    last_checkpoint = None
+    if (
+        os.path.isdir(training_args.output_dir)
+        and training_args.do_train
+        and not training_args.overwrite_output_dir
+    ):
+        last_checkpoint = get_last_checkpoint(training_args.output_dir)
+        if last_checkpoint is None and len(os.listdir(training_args.output_dir)) > 0:
+            raise ValueError(
+                f"Output directory ({training_args.output_dir}) already exists and is not empty. "
+                "Use --overwrite_output_dir to overcome."
+            )
+        elif (
+            last_checkpoint is not None and training_args.resume_from_checkpoint is None
+        ):
+            logger.info(
+                f"Checkpoint detected, resuming training at {last_checkpoint}. To avoid this behavior, change "
+                "the `--output_dir` or add `--overwrite_output_dir` to train from scratch."
+            )
+
+    if data_args.task_configs is not None:
+        train_multitask(data_args, training_args, last_checkpoint)
+        return
+
+    setup = setup_task(model_args, data_args, training_args, adapter_args)
+    trainer = setup.trainer
+    train_dataset = trainer.train_dataset
+
     if trainer.is_world_process_zero():
         os.makedirs(training_args.output_dir, exist_ok=True)
         trainer.save_metrics("arguments", load_json(sys.argv[1]))
@@ -540,21 +797,7 @@ def main():
 
     # Evaluation
     if training_args.do_eval:
-        logger.info("*** Evaluate ***")
-        metrics = trainer.evaluate()
-        eval_samples = (
-            eval_dataset[0].num_rows
-            if isinstance(eval_dataset, list)
-            else eval_dataset.num_rows
-        )
-        max_eval_samples = (
-            data_args.max_eval_samples
-            if data_args.max_eval_samples is not None
-            else eval_samples
-        )
-        metrics["eval_samples"] = min(max_eval_samples, eval_samples)
-        trainer.log_metrics("eval", metrics)
-        trainer.save_metrics("eval", metrics)
+        evaluate_task(setup)
 
     # Prediction
     if training_args.do_predict:
@@ -566,20 +809,7 @@ def main():
             end = torch.cuda.Event(enable_timing=True)
             start.record()
 
-        predict_labels = trainer.predict(predict_dataset)
-
-        file = open(os.path.join("results", data_args.task + ".csv"), "w+")
-        file.writelines("ID,Label" + "\n")
-
-        for i in tqdm(range(raw_datasets["test"].num_rows)):
-            id = raw_datasets["test"]["ID"][i]
-
-            label = predict_labels[i]
-            label_token = verbalizers_tags[label]
-
-            file.writelines(str(id) + "," + label_token + "\n")
-
-        file.close()
+        predict_task(setup)
 
         if training_args.compute_inference_time:
             end.record()
@@ -587,10 +817,20 @@ def main():
             total_time = start.elapsed_time(end) / (1000 * 60)
             performance_metrics.update({"inference time(min)": total_time})
 
+    if training_args.auto_batch_size:
+        performance_metrics.update(
+            {
+                "per_device_train_batch_size": training_args.per_device_train_batch_size,
+                "gradient_accumulation_steps": training_args.gradient_accumulation_steps,
+                "per_device_eval_batch_size": training_args.per_device_eval_batch_size,
+            }
+        )
+
     if (
         training_args.compute_memory
         or training_args.compute_time
         or training_args.compute_inference_time
+        or training_args.auto_batch_size
     ):
         print(performance_metrics)
         trainer.save_metrics("performance", performance_metrics)
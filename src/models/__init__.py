@@ -1,5 +1,7 @@
 from .roberta.modeling_roberta import (
     RobertaForMaskedLM,
     RobertaForSequenceClassification,
+    RobertaModel,
 )
 from .roberta.configuration_roberta import RobertaConfig
+from .multitask import MultiTaskModel
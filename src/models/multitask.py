@@ -0,0 +1,135 @@
+"""Trains the models of several tasks at once, on batches mixing the examples of the tasks."""
+import copy
+import itertools
+
+from torch import nn
+from transformers.modeling_outputs import BaseModelOutputWithPoolingAndCrossAttentions
+
+from adapters.adapter_modeling import group_adapter_ids
+
+
+class TaskRouter(nn.Module):
+    """Applies to the rows of each task of the batch the module of their task: the rows
+    are grouped by task, and each group goes through the module of its task.
+    task_modules: the module of each task, in the order of the task ids, taking a tensor
+    of size batch_size x ... as input."""
+
+    def __init__(self, task_modules):
+        super().__init__()
+        self.task_modules = nn.ModuleList(task_modules)
+        self.task_groups = None
+
+    def forward(self, inputs):
+        if len(self.task_groups) == 1:
+            task_id, _ = self.task_groups[0]
+            return self.task_modules[task_id](inputs)
+        outputs = None
+        for task_id, rows in self.task_groups:
+            task_outputs = self.task_modules[task_id](inputs[rows])
+            if outputs is None:
+                outputs = task_outputs.new_empty(
+                    inputs.shape[:1] + task_outputs.shape[1:]
+                )
+            outputs[rows] = task_outputs
+        return outputs
+
+
+def build_routed_encoder(encoders):
+    """Returns a copy of the first encoder, sharing its parameters, in which the modules
+    whose parameters differ across the encoders of the tasks (as the adapters and the
+    tuned layer norms) are replaced by a TaskRouter over the modules of the tasks."""
+    first_encoder = encoders[0]
+    # Copies the modules, the parameters and buffers are kept.
+    memo = {
+        id(tensor): tensor
+        for tensor in itertools.chain(
+            first_encoder.parameters(), first_encoder.buffers()
+        )
+    }
+    routed_encoder = copy.deepcopy(first_encoder, memo)
+    task_modules = [dict(encoder.named_modules()) for encoder in encoders]
+
+    def route(module, prefix):
+        for name, child in list(module.named_children()):
+            path = f"{prefix}{name}"
+            modules = [modules[path] for modules in task_modules]
+            parameters = [list(module.parameters()) for module in modules]
+            if all(
+                p is q
+                for task_parameters in parameters[1:]
+                for p, q in zip(parameters[0], task_parameters)
+            ):
+                continue
+            # The modules holding task-specific parameters themselves, or only
+            # task-specific ones, are routed as a whole.
+            direct_parameters = [
+                list(module.parameters(recurse=False)) for module in modules
+            ]
+            if any(
+                p is not q
+                for task_parameters in direct_parameters[1:]
+                for p, q in zip(direct_parameters[0], task_parameters)
+            ) or not any(
+                p is q
+                for task_parameters in parameters[1:]
+                for p, q in zip(parameters[0], task_parameters)
+            ):
+                setattr(module, name, TaskRouter(modules))
+            else:
+                route(child, f"{path}.")
+
+    route(routed_encoder, "")
+    return routed_encoder
+
+
+class MultiTaskModel(nn.Module):
+    """Holds the models of the tasks, which share their frozen backbone (see
+    `share_frozen_parameters`) and have their own adapters, layer norms and label
+    embeddings. A mixed-task batch goes through the shared encoder at once, each row with
+    the adapters and layer norms of its task, then the rows of each task go through the
+    head and loss of their task model.
+    models: an OrderedDict of the model of each task, the task ids index its keys."""
+
+    def __init__(self, models):
+        super().__init__()
+        self.tasks = list(models.keys())
+        self.models = nn.ModuleDict(models)
+        self.encoder = build_routed_encoder(
+            [model.roberta for model in models.values()]
+        )
+        self.routers = [
+            module
+            for module in self.encoder.modules()
+            if isinstance(module, TaskRouter)
+        ]
+
+    def forward(self, task_ids, **inputs):
+        """Returns the loss of the batch, the average of the losses of its rows computed by
+        the models of their tasks."""
+        task_groups = group_adapter_ids(task_ids)
+        for router in self.routers:
+            router.task_groups = task_groups
+        sequence_output = self.encoder(
+            **{
+                key: value
+                for key, value in inputs.items()
+                if key in ["input_ids", "attention_mask", "token_type_ids"]
+            },
+            return_dict=True,
+        )[0]
+        loss = 0
+        for task_id, rows in task_groups:
+            model = self.models[self.tasks[task_id]]
+            if rows is None:
+                task_inputs, task_sequence_output = inputs, sequence_output
+            else:
+                task_inputs = {key: value[rows] for key, value in inputs.items()}
+                task_sequence_output = sequence_output[rows]
+            outputs = model(
+                **task_inputs,
+                encoder_outputs=BaseModelOutputWithPoolingAndCrossAttentions(
+                    last_hidden_state=task_sequence_output
+                ),
+            )
+            loss = loss + outputs.loss * len(task_inputs["input_ids"])
+        return {"loss": loss / len(task_ids)}
@@ -20,6 +20,9 @@ class RobertaConfig(RobertaConfig):
         eval_soft_pet_aggregation=None,
         soft_pet_aggregation=None,
         prototypical_similarity="cos",
+        verbalizer_head=False,
+        num_negatives=None,
+        negative_sampling="uniform",
         **kwargs
     ):
         super().__init__(**kwargs)
@@ -37,3 +40,6 @@ class RobertaConfig(RobertaConfig):
         self.eval_soft_pet_aggregation = eval_soft_pet_aggregation
         self.soft_pet_aggregation = soft_pet_aggregation
         self.prototypical_similarity = prototypical_similarity
+        self.verbalizer_head = verbalizer_head
+        self.num_negatives = num_negatives
+        self.negative_sampling = negative_sampling
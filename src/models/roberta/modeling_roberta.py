@@ -1251,8 +1251,26 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
         )
         self.soft_pet = config.soft_pet
         self.train_in_batch = config.train_in_batch
+        self.verbalizer_head = config.verbalizer_head
         self.prompt_tune = config.prompt_tune
         self.prompt_length = config.prompt_length
+        self.num_negatives = config.num_negatives
+        self.negative_sampling = config.negative_sampling
+        # Unset by the trainer to compute the hinge losses against all the wrong labels.
+        self.sample_negatives = True
+        if self.num_negatives is not None:
+            if self.negative_sampling not in ["uniform", "hardest"]:
+                raise ValueError(
+                    f"negative_sampling should be `uniform` or `hardest`, got {self.negative_sampling}."
+                )
+            if self.negative_sampling == "hardest":
+                # The hinge loss of each wrong label for each correct label, at the last step
+                # they were sampled together. The pairs never sampled come first.
+                self.register_buffer(
+                    "negative_hinge_losses",
+                    torch.full((config.num_labels, config.num_labels), math.inf),
+                    persistent=False,
+                )
         if self.soft_pet:
             self.extra_embedding_weight = extra_embedding_weight
             self.multiclass_ce_loss = config.multiclass_ce_loss
@@ -1267,6 +1285,33 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
         # The LM head weights require special treatment only when they are tied with the word embeddings
         self.update_keys_to_ignore(config, ["lm_head.decoder.weight"])
         self.tokenized_verbalizers = tokenized_verbalizers
+        if (
+            not self.soft_pet
+            and tokenized_verbalizers is not None
+            and tokenized_verbalizers.get("init")
+        ):
+            # The candidate tokens of all the labels, shared by all the examples.
+            self.register_buffer(
+                "verbalizer_ids",
+                self.create_verbalizer_ids(tokenized_verbalizers["init"]),
+                persistent=False,
+            )
+            if self.verbalizer_head:
+                # The tokens of all the verbalizers, the LM head only projects onto these
+                # tokens, and the table of the verbalizer tokens indexed in this vocabulary.
+                valid_tokens = self.verbalizer_ids != -100
+                self.register_buffer(
+                    "verbalizer_vocab",
+                    torch.unique(self.verbalizer_ids[valid_tokens]),
+                    persistent=False,
+                )
+                self.register_buffer(
+                    "verbalizer_vocab_ids",
+                    torch.searchsorted(
+                        self.verbalizer_vocab, self.verbalizer_ids.clamp(min=0)
+                    ).masked_fill(~valid_tokens, -100),
+                    persistent=False,
+                )
         self.init_weights()
 
     def _init_weights(self, module):
@@ -1321,12 +1366,100 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
         extra_embeddings = nn.Embedding(self.num_extra_tokens, self.config.hidden_size)
         return extra_embeddings
 
+    def create_verbalizer_ids(self, tokenized_verbalizers):
+        """Creates the table of the verbalizer tokens of size num_labels x num_masks, the
+        verbalizers shorter than the number of masks are padded with -100."""
+        num_masks = max([len(verbalizers[0]) for verbalizers in tokenized_verbalizers])
+        return torch.tensor(
+            [
+                verbalizers[0] + [-100] * (num_masks - len(verbalizers[0]))
+                for verbalizers in tokenized_verbalizers
+            ]
+        )
+
+    def get_mask_indices(self, input_ids, mask_start, num_masks):
+        """Returns the positions of the consecutive masks of size batch_size x num_masks."""
+        if mask_start is None:
+            mask_start = (input_ids == self.config.mask_token_id).int().argmax(dim=-1)
+        return mask_start.unsqueeze(-1) + torch.arange(
+            num_masks, device=mask_start.device
+        )
+
+    def get_masks_hidden_states(self, input_ids, mask_start, sequence_output):
+        """Returns the hidden states of the masks of size batch_size x num_masks x hidden_dim."""
+        num_masks = self.num_masks if self.soft_pet else self.verbalizer_ids.shape[1]
+        # The verbalizers shorter than num_masks may be followed by fewer positions.
+        mask_indices = self.get_mask_indices(input_ids, mask_start, num_masks).clamp(
+            max=sequence_output.shape[1] - 1
+        )
+        rows = torch.arange(sequence_output.shape[0], device=sequence_output.device)
+        return sequence_output[rows.unsqueeze(-1), mask_indices]
+
     def get_output_embeddings(self):
         return self.lm_head.decoder
 
     def set_output_embeddings(self, new_embeddings):
         self.lm_head.decoder = new_embeddings
 
+    def compute_hinge_loss(self, losses, labels):
+        """Computes the hinge loss between the loss of the correct label and the loss of
+        each wrong label, summed over the wrong labels as PET.
+        losses: the losses of all the labels of size batch_size x num_labels.
+        Returns the hinge loss of each example of size batch_size."""
+        loss_correct_label = losses.gather(1, labels.view(-1, 1))
+        hinge_loss = (1 + loss_correct_label - losses).clamp(min=0)
+        wrong_labels = labels.view(-1, 1) != torch.arange(
+            losses.shape[1], device=losses.device
+        )
+        return (hinge_loss * wrong_labels).sum(dim=-1)
+
+    def sample_candidate_labels(self, labels):
+        """Samples num_negatives wrong labels for each example, uniformly or among the wrong
+        labels with the largest hinge losses in the previous steps.
+        Returns the candidate labels of size batch_size x (1 + num_negatives), the correct
+        label first, or None if the losses are computed against all the wrong labels."""
+        num_labels = self.config.num_labels
+        if (
+            not self.training
+            or not self.sample_negatives
+            or self.num_negatives is None
+            or self.num_negatives >= num_labels - 1
+        ):
+            return None
+        batch_size = labels.shape[0]
+        if self.negative_sampling == "hardest":
+            scores = self.negative_hinge_losses[labels]
+        else:
+            scores = torch.zeros(batch_size, num_labels, device=labels.device)
+        scores = scores.scatter(1, labels.view(-1, 1), -math.inf)
+        # Shuffles the labels, so the stable sort breaks the ties randomly.
+        permutation = torch.rand(batch_size, num_labels, device=labels.device).argsort(
+            dim=1
+        )
+        scores = scores.gather(1, permutation)
+        order = scores.sort(dim=1, descending=True, stable=True)[1]
+        negatives = permutation.gather(1, order[:, : self.num_negatives])
+        return torch.cat([labels.view(-1, 1), negatives], dim=1)
+
+    def compute_sampled_hinge_loss(self, losses, candidates):
+        """Computes the hinge loss between the loss of the correct label and the loss of
+        each sampled wrong label, summed over the wrong labels and scaled to the number of
+        wrong labels, so that it has the scale of `compute_hinge_loss`.
+        losses: the losses of the candidate labels of size batch_size x ... x (1 + num_negatives).
+        candidates: the candidate labels of size batch_size x (1 + num_negatives).
+        Returns the hinge loss of size batch_size x ..."""
+        hinge_loss = (1 + losses[..., :1] - losses[..., 1:]).clamp(min=0)
+        if self.negative_sampling == "hardest":
+            # Records the hinge losses of the sampled labels for the next steps.
+            pairs_hinge_loss = hinge_loss.detach().view(
+                candidates.shape[0], -1, self.num_negatives
+            )
+            self.negative_hinge_losses[candidates[:, :1], candidates[:, 1:]] = (
+                pairs_hinge_loss.mean(dim=1).to(self.negative_hinge_losses.dtype)
+            )
+        scale = (self.config.num_labels - 1) / self.num_negatives
+        return hinge_loss.sum(dim=-1) * scale
+
     @add_start_docstrings_to_model_forward(
         ROBERTA_INPUTS_DOCSTRING.format("batch_size, sequence_length")
     )
@@ -1337,84 +1470,49 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
         config_class=_CONFIG_FOR_DOC,
         mask="<mask>",
     )
-    def compute_pet_loss(self, candidates_ids, logits, labels, input_ids):
+    def compute_pet_loss(self, mask_start, logits, labels, input_ids):
+        batch_size = input_ids.shape[0]
+        if self.verbalizer_head:
+            # The logits are only computed at the masks, over the verbalizer vocabulary.
+            masks_logits = logits
+            verbalizer_ids = self.verbalizer_vocab_ids
+        else:
+            num_masks = self.verbalizer_ids.shape[1]
+            mask_indices = self.get_mask_indices(input_ids, mask_start, num_masks)
+            rows = torch.arange(batch_size, device=input_ids.device).unsqueeze(-1)
+            masks_logits = logits[rows, mask_indices]
+            verbalizer_ids = self.verbalizer_ids
+        # batch_size x num_masks x vocab_size
+        masks_log_probs = masks_logits.log_softmax(dim=-1)
+        candidates = self.sample_candidate_labels(labels)
+        if candidates is not None:
+            # Only the verbalizers of the candidate labels of each example are scored.
+            # batch_size x num_masks x num_candidates
+            verbalizer_ids = verbalizer_ids[candidates].transpose(1, 2)
+            valid_tokens = verbalizer_ids != -100
+            tokens = verbalizer_ids.clamp(min=0)
+        else:
+            valid_tokens = (verbalizer_ids != -100).t()  # num_masks x num_labels
+            tokens = verbalizer_ids.clamp(min=0).t().expand(batch_size, -1, -1)
+        # The cross-entropy losses of the verbalizer tokens of all the labels at once, the
+        # tokens padding the shorter verbalizers have a zero loss.
+        tokens_losses = -masks_log_probs.gather(-1, tokens).masked_fill(
+            ~valid_tokens, 0
+        )  # batch_size x num_masks x num_labels
         if self.train_in_batch:
-            batch_size = input_ids.shape[0]
-            mask_indices = (
-                (input_ids == self.config.mask_token_id)
-                .nonzero()[:, -1]
-                .view(batch_size, -1)
-            )
-            masks_logits = logits[torch.arange(batch_size).unsqueeze(-1), mask_indices]
-            candidates_ids = candidates_ids.permute(
-                0, 2, 1
-            )  #  batch-size x seq_length x num_labels
-            candidates_ids = candidates_ids[
-                torch.arange(batch_size).unsqueeze(-1), mask_indices
-            ]
-            candidates_ids = candidates_ids.permute(
-                2, 0, 1
-            )  # num_labels x batch_size x num_masks
-            labels = labels.cpu().numpy()
-            mask_labels = torch.stack(
-                [candidates_ids[labels[i], i, :] for i in range(batch_size)]
-            )
-            mask_labels = mask_labels.reshape(-1)  # candidates_ids[label].reshape(-1)
-            loss_fct = CrossEntropyLoss(reduction="none")
-            loss_correct_label = (
-                loss_fct(
-                    masks_logits.contiguous().view(-1, self.config.vocab_size),
-                    mask_labels,
-                )
-                .view(batch_size, -1)
-                .mean(dim=-1)
-                .view(batch_size, 1)
-            )
-            batch_wrong_mask_labels = []
-            for i in range(batch_size):
-                wrong_labelss = torch.tensor(
-                    [j for j in range(self.config.num_labels) if j != labels[i]]
-                ).cuda()
-                wrong_mask_labels = torch.stack(
-                    [candidates_ids[label, i, :] for label in wrong_labelss]
-                )  # .reshape(-1)
-                batch_wrong_mask_labels.append(
-                    wrong_mask_labels.view(-1, wrong_mask_labels.shape[-1])
-                )  # self.num_masks))
-            wrong_mask_labels = torch.stack(
-                batch_wrong_mask_labels
-            )  # batch_size x n-1 x num_masks
-            wrong_logits = masks_logits.repeat(self.config.num_labels - 1, 1, 1)
-            loss_wrong_labels = (
-                loss_fct(
-                    wrong_logits.view(-1, self.config.vocab_size),
-                    wrong_mask_labels.reshape(-1),
-                )
-                .view(batch_size, self.config.num_labels - 1, -1)
-                .mean(dim=-1)
-            )  # batch_size x n-1
+            # Averages the losses over all the mask tokens.
+            losses = tokens_losses.mean(dim=1)
             # Computes hinge loss for all mask tokens, sum over tokens as PET, get average over the batch.
-            hinge_loss = 1 + loss_correct_label - loss_wrong_labels
-            hinge_loss[hinge_loss < 0] = 0
-            loss = hinge_loss.sum(dim=-1).mean(dim=0)
-            return loss
+            if candidates is not None:
+                return self.compute_sampled_hinge_loss(losses, candidates).mean(dim=0)
+            return self.compute_hinge_loss(losses, labels).mean(dim=0)
         else:
-            # We assume batch size is one.
-            logits = logits.view(-1, self.config.vocab_size)
-            loss_fct = CrossEntropyLoss()
-            assert candidates_ids.shape[0] == 1, "this only works with batch size of 1."
-            candidates_ids = candidates_ids.permute(1, 0, 2)
-            label = labels.cpu().numpy()
-            total_loss = 0
-            loss_correct_label = loss_fct(logits, candidates_ids[label].reshape(-1))
-            for i, candidate_ids in enumerate(candidates_ids):
-                if i == label:
-                    continue
-                loss_wrong_label = loss_fct(logits, candidates_ids[i].reshape(-1))
-                hinge_loss = 1 + loss_correct_label - loss_wrong_label
-                hinge_loss[hinge_loss < 0] = 0
-                total_loss += hinge_loss
-            return total_loss
+            # Averages the losses over the tokens of each verbalizer, the batches have a
+            # single example except in the multi-task training.
+            losses = tokens_losses.sum(dim=1) / valid_tokens.sum(dim=-2)
+            if candidates is not None:
+                return self.compute_sampled_hinge_loss(losses, candidates).mean(dim=0)
+            return self.compute_hinge_loss(losses, labels).mean(dim=0)
 
     def map_labels_to_mask_ids(self, labels):
         mask_labels = (
@@ -1443,13 +1541,8 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
                 torch.arange(logits.shape[0]), :, torch.arange(logits.shape[2])
             ]
 
-    def map_labels_per_token(self, label):
-        return label.repeat(self.num_masks).view(
-            -1
-        )  # torch.tensor([label] * (self.num_masks)).view(-1).cuda()
-
     def compute_pet_with_extra_tokens_loss(
-        self, input_ids, logits, labels, candidates_ids, hidden_states
+        self, input_ids, mask_start, logits, labels, hidden_states
     ):
         # this for batch for now forget about it.
         if self.token_hinge_loss:
@@ -1457,37 +1550,50 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
         else:
             loss_fct = CrossEntropyLoss(reduction="none")
 
-        total_tokens = self.num_extra_tokens
-
         batch_size = input_ids.shape[0]
-        mask_indices = (
-            (input_ids == self.config.mask_token_id)
-            .nonzero()[:, -1]
-            .view(batch_size, -1)
-        )
-        masks_logits = logits[
-            torch.arange(batch_size).unsqueeze(-1), mask_indices
-        ]  # batch_size x num_masks x num_labels
+        if self.verbalizer_head:
+            # The logits are only computed at the masks.
+            masks_logits = logits
+        else:
+            mask_indices = self.get_mask_indices(input_ids, mask_start, self.num_masks)
+            masks_logits = logits[
+                torch.arange(batch_size, device=input_ids.device).unsqueeze(-1),
+                mask_indices,
+            ]  # batch_size x num_masks x num_labels
 
         masks_logits = self.map_logits_per_token(
             masks_logits
         )  # batch_size x num_masks x num_labels
-        mask_labels = torch.cat(
-            [self.map_labels_per_token(i) for i in labels]
-        ).squeeze()
         total_tokens = self.config.num_labels
 
         if self.multiclass_ce_loss or self.token_hinge_loss:
-            # let assume we have X mask tokens, we have a logit for each mask location.
-            # after reshape, mask_logits are of shape: (batch_size x num_extra_tokens)x(num_labels)
-            # mask_labels is of shape: (batch_size x num_extra_tokens)
-            total_loss = (
-                loss_fct(masks_logits.contiguous().view(-1, total_tokens), mask_labels)
-                .view(batch_size, -1)
-                .mean(dim=-1)
-                .view(batch_size, 1)
-                .mean()
-            )
+            candidates = None
+            if self.token_hinge_loss:
+                candidates = self.sample_candidate_labels(labels)
+            if candidates is not None:
+                # The multi-class hinge loss of each mask token over the candidate labels, divided
+                # by the number of labels as MultiMarginLoss.
+                candidates_logits = masks_logits.gather(
+                    -1, candidates.unsqueeze(1).expand(-1, self.num_masks, -1)
+                )  # batch_size x num_masks x num_candidates
+                total_loss = (
+                    self.compute_sampled_hinge_loss(-candidates_logits, candidates)
+                    / total_tokens
+                ).mean()
+            else:
+                mask_labels = labels.repeat_interleave(self.num_masks)
+                # let assume we have X mask tokens, we have a logit for each mask location.
+                # after reshape, mask_logits are of shape: (batch_size x num_extra_tokens)x(num_labels)
+                # mask_labels is of shape: (batch_size x num_extra_tokens)
+                total_loss = (
+                    loss_fct(
+                        masks_logits.contiguous().view(-1, total_tokens), mask_labels
+                    )
+                    .view(batch_size, -1)
+                    .mean(dim=-1)
+                    .view(batch_size, 1)
+                    .mean()
+                )
 
             # This is only if we use these logits for eval, as the loss, we compute the loss by computing the
             # average over the mask tokens.
@@ -1505,36 +1611,17 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
                 eval_logits = eval_logits.permute((0, 2, 1)).mean(dim=-1)
             return total_loss, eval_logits
 
-        # Computing the hinge loss over losses.
-        loss_correct_label = (
-            loss_fct(masks_logits.contiguous().view(-1, total_tokens), mask_labels)
-            .view(batch_size, -1)
-            .mean(dim=-1)
-            .view(batch_size, 1)
-        )
-        batch_wrong_mask_labels = []
-        for i in range(batch_size):
-            wrong_labelss = torch.tensor(
-                [j for j in range(self.config.num_labels) if j != labels[i]]
-            ).cuda()
-            wrong_mask_labels = torch.cat(
-                [self.map_labels_per_token(i) for i in wrong_labelss]
-            ).squeeze()
-            batch_wrong_mask_labels.append(wrong_mask_labels.view(-1, self.num_masks))
-
-        wrong_mask_labels = torch.stack(
-            batch_wrong_mask_labels
-        )  # batch_size x n-1 x num_masks
-        wrong_logits = masks_logits.repeat(self.config.num_labels - 1, 1, 1)
-        loss_wrong_labels = (
-            loss_fct(wrong_logits.view(-1, total_tokens), wrong_mask_labels.reshape(-1))
-            .view(batch_size, self.config.num_labels - 1, -1)
-            .mean(dim=-1)
-        )  # batch_size x n-1
+        # Computing the hinge loss over losses, the cross-entropy losses of all the labels
+        # at each mask token are computed at once and averaged over the mask tokens.
+        # batch_size x num_labels
+        losses = -masks_logits.log_softmax(dim=-1).mean(dim=1)
         # Computes hinge loss for all mask tokens, sum over tokens as PET, get average over the batch.
-        hinge_loss = 1 + loss_correct_label - loss_wrong_labels
-        hinge_loss[hinge_loss < 0] = 0
-        loss = hinge_loss.sum(dim=-1).mean(dim=0)
+        candidates = self.sample_candidate_labels(labels)
+        if candidates is not None:
+            losses = losses.gather(1, candidates)
+            loss = self.compute_sampled_hinge_loss(losses, candidates).mean(dim=0)
+        else:
+            loss = self.compute_hinge_loss(losses, labels).mean(dim=0)
         return loss, None
 
     def compute_joint_lm_head(self, sequence_output):
@@ -1597,13 +1684,17 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
         output_hidden_states=None,
         return_dict=None,
         mlm_labels=None,
-        candidates_ids=None,
+        mask_start=None,
+        encoder_outputs=None,
     ):
         r"""
         labels (:obj:`torch.LongTensor` of shape :obj:`(batch_size, sequence_length)`, `optional`):
             Labels for computing the masked language modeling loss. Indices should be in ``[-100, 0, ...,
             config.vocab_size]`` (see ``input_ids`` docstring) Tokens with indices set to ``-100`` are ignored
             (masked), the loss is only computed for the tokens with labels in ``[0, ..., config.vocab_size]``
+        encoder_outputs (:obj:`BaseModelOutputWithPoolingAndCrossAttentions`, `optional`):
+            The outputs of :obj:`roberta` on the inputs, computed beforehand as in the multi-task training, in
+            which case the encoder is not run.
         kwargs (:obj:`Dict[str, any]`, optional, defaults to `{}`):
             Used to hide legacy arguments that have been deprecated.
         """
@@ -1616,22 +1707,39 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
             input_ids, attention_mask, inputs_embeds = self.append_prompts(
                 input_ids, attention_mask, inputs_embeds
             )
+            # The prompts are prepended to the inputs.
+            if mask_start is not None:
+                mask_start = mask_start + self.prompt_length
 
-        outputs = self.roberta(
-            input_ids if not self.prompt_tune else None,
-            attention_mask=attention_mask,
-            token_type_ids=token_type_ids,
-            position_ids=position_ids,
-            head_mask=head_mask,
-            inputs_embeds=inputs_embeds,
-            encoder_hidden_states=encoder_hidden_states,
-            encoder_attention_mask=encoder_attention_mask,
-            output_attentions=output_attentions,
-            output_hidden_states=output_hidden_states,
-            return_dict=return_dict,
-        )
+        if encoder_outputs is not None:
+            outputs = encoder_outputs
+        else:
+            outputs = self.roberta(
+                input_ids if not self.prompt_tune else None,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+                position_ids=position_ids,
+                head_mask=head_mask,
+                inputs_embeds=inputs_embeds,
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_attention_mask=encoder_attention_mask,
+                output_attentions=output_attentions,
+                output_hidden_states=output_hidden_states,
+                return_dict=return_dict,
+            )
         sequence_output = outputs[0]
-        if not self.soft_pet:
+        if self.verbalizer_head:
+            # Projects only the hidden states of the masks, onto the verbalizer tokens.
+            masks_hidden_states = self.get_masks_hidden_states(
+                input_ids, mask_start, sequence_output
+            )
+            if self.soft_pet:
+                prediction_scores = self.compute_joint_lm_head(masks_hidden_states)
+            else:
+                prediction_scores = self.lm_head(
+                    masks_hidden_states, vocab=self.verbalizer_vocab
+                )
+        elif not self.soft_pet:
             prediction_scores = self.lm_head(sequence_output)
         elif self.soft_pet:
             prediction_scores = self.compute_joint_lm_head(sequence_output)
@@ -1644,16 +1752,16 @@ class RobertaForMaskedLM(RobertaPreTrainedModel):
             if self.soft_pet:
                 masked_lm_loss, eval_logits = self.compute_pet_with_extra_tokens_loss(
                     input_ids,
+                    mask_start,
                     prediction_scores,
                     labels,
-                    candidates_ids,
                     sequence_output,
                 )
                 if eval_logits is not None:
                     prediction_scores = eval_logits
             else:
                 masked_lm_loss = self.compute_pet_loss(
-                    candidates_ids, prediction_scores, labels, input_ids
+                    mask_start, prediction_scores, labels, input_ids
                 )
 
         if not return_dict:
@@ -1683,13 +1791,18 @@ class RobertaLMHead(nn.Module):
         self.bias = nn.Parameter(torch.zeros(config.vocab_size))
         self.decoder.bias = self.bias
 
-    def forward(self, features, **kwargs):
+    def forward(self, features, vocab=None, **kwargs):
+        """vocab: if given, the ids of the tokens onto which the features are projected,
+        instead of the whole vocabulary."""
         x = self.dense(features)
         x = gelu(x)
         x = self.layer_norm(x)
 
         # project back to size of vocabulary with bias
-        x = self.decoder(x)
+        if vocab is not None:
+            x = F.linear(x, self.decoder.weight[vocab], self.decoder.bias[vocab])
+        else:
+            x = self.decoder(x)
 
         return x
 
@@ -1739,28 +1852,35 @@ class RobertaForSequenceClassification(RobertaPreTrainedModel):
         output_attentions=None,
         output_hidden_states=None,
         return_dict=None,
+        encoder_outputs=None,
     ):
         r"""
         labels (:obj:`torch.LongTensor` of shape :obj:`(batch_size,)`, `optional`):
             Labels for computing the sequence classification/regression loss. Indices should be in :obj:`[0, ...,
             config.num_labels - 1]`. If :obj:`config.num_labels == 1` a regression loss is computed (Mean-Square loss),
             If :obj:`config.num_labels > 1` a classification loss is computed (Cross-Entropy).
+        encoder_outputs (:obj:`BaseModelOutputWithPoolingAndCrossAttentions`, `optional`):
+            The outputs of :obj:`roberta` on the inputs, computed beforehand as in the multi-task training, in
+            which case the encoder is not run.
         """
         return_dict = (
             return_dict if return_dict is not None else self.config.use_return_dict
         )
 
-        outputs = self.roberta(
-            input_ids,
-            attention_mask=attention_mask,
-            token_type_ids=token_type_ids,
-            position_ids=position_ids,
-            head_mask=head_mask,
-            inputs_embeds=inputs_embeds,
-            output_attentions=output_attentions,
-            output_hidden_states=output_hidden_states,
-            return_dict=return_dict,
-        )
+        if encoder_outputs is not None:
+            outputs = encoder_outputs
+        else:
+            outputs = self.roberta(
+                input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+                position_ids=position_ids,
+                head_mask=head_mask,
+                inputs_embeds=inputs_embeds,
+                output_attentions=output_attentions,
+                output_hidden_states=output_hidden_states,
+                return_dict=return_dict,
+            )
         sequence_output = outputs[0]
         logits = self.classifier(sequence_output)
 
@@ -0,0 +1,163 @@
+"""
+Reports the accuracy and CPU latency of the int8 quantized models against the fp32 ones, to decide
+for each task whether the quantized model can be shipped.
+
+Usage: python src/quantization_report.py configs/ade_corpus_v2.json configs/banking_77.json ...,
+with `model_name_or_path` set to the trained checkpoint of each task.
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+os.environ["WANDB_DISABLED"] = "true"
+
+import numpy as np
+import torch
+from transformers import HfArgumentParser
+
+from training_args import (
+    ModelArguments,
+    DataTrainingArguments,
+    FewShotTrainingArguments,
+    AdapterArguments,
+)
+from data.tasks import AutoTask
+from serving import load_predictor
+
+logger = logging.getLogger(__name__)
+
+
+def get_model_size(model):
+    """Returns the size in MB of the serialized weights of the model."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def score_examples(predictor, examples, batch_size):
+    """Returns the scores of the examples, and the latencies of the batches in seconds."""
+    scores, latencies = [], []
+    for i in range(0, len(examples), batch_size):
+        start = time.perf_counter()
+        scores.append(predictor.score(examples[i : i + batch_size]))
+        latencies.append(time.perf_counter() - start)
+    return np.concatenate(scores), np.array(latencies)
+
+
+def report_task(config, quantizations, num_test_examples):
+    parser = HfArgumentParser(
+        (
+            ModelArguments,
+            DataTrainingArguments,
+            FewShotTrainingArguments,
+            AdapterArguments,
+        )
+    )
+    results = {}
+    reference_predictions = None
+    for quantization in quantizations:
+        model_args, data_args, training_args, adapter_args = parser.parse_json_file(
+            json_file=os.path.abspath(config)
+        )
+        training_args.no_cuda = True
+        training_args.quantization = quantization
+        task = AutoTask.get(
+            task=data_args.task,
+            data_seed=data_args.data_seed,
+            cache_dir=model_args.cache_dir,
+            data_dir=data_args.data_dir,
+        )
+        datasets = task.get_datasets()
+        validation_examples = list(datasets["validation"])
+        test_examples = list(
+            datasets["test"].select(
+                range(min(num_test_examples, datasets["test"].num_rows))
+            )
+        )
+        predictor = load_predictor(model_args, data_args, training_args, adapter_args)
+        batch_size = training_args.per_device_eval_batch_size
+
+        validation_scores, _ = score_examples(
+            predictor, validation_examples, batch_size
+        )
+        targets = [
+            predictor.processor.processor.get_target(example)
+            for example in validation_examples
+        ]
+        accuracy = np.mean(validation_scores.argmax(axis=1) == np.array(targets))
+        test_scores, latencies = score_examples(predictor, test_examples, batch_size)
+        test_predictions = test_scores.argmax(axis=1)
+        if reference_predictions is None:
+            reference_predictions = test_predictions
+        model_name = quantization or "fp32"
+        results[model_name] = {
+            "validation_accuracy": float(accuracy),
+            "test_agreement_with_fp32": float(
+                np.mean(test_predictions == reference_predictions)
+            ),
+            "latency_ms_per_example": float(
+                latencies.sum() / len(test_examples) * 1000
+            ),
+            "latency_ms_per_batch_p50": float(np.percentile(latencies, 50) * 1000),
+            "latency_ms_per_batch_p90": float(np.percentile(latencies, 90) * 1000),
+            "model_size_mb": get_model_size(predictor.trainer.model),
+        }
+        logger.info(f"{data_args.task} {model_name}: {results[model_name]}")
+    return data_args.task, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("configs", nargs="+", help="The config of each task.")
+    parser.add_argument(
+        "--quantizations",
+        nargs="+",
+        default=["dynamic", "static"],
+        choices=["dynamic", "static"],
+    )
+    parser.add_argument(
+        "--num_test_examples",
+        type=int,
+        default=500,
+        help="The number of test examples used to measure the latency and the agreement with fp32.",
+    )
+    parser.add_argument("--output", default="results/quantization_report.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%m/%d/%Y %H:%M:%S",
+        handlers=[logging.StreamHandler(sys.stdout)],
+        level=logging.INFO,
+    )
+
+    report = {}
+    for config in args.configs:
+        task, results = report_task(
+            config, [None] + args.quantizations, args.num_test_examples
+        )
+        report[task] = results
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(
+        f"{'task':35s} {'model':8s} {'val acc':>8s} {'agree':>8s} {'ms/ex':>8s} {'MB':>8s}"
+    )
+    for task, results in report.items():
+        for model, result in results.items():
+            print(
+                f"{task:35s} {model:8s} {result['validation_accuracy']:8.3f} "
+                f"{result['test_agreement_with_fp32']:8.3f} "
+                f"{result['latency_ms_per_example']:8.2f} {result['model_size_mb']:8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Serves a trained checkpoint with a local server, which coalesces the concurrent requests into micro-batches.
+
+Usage: python src/serve.py configs/serve.json, with `model_name_or_path` set to the trained checkpoint.
+To serve several tasks with a single model, set `task_configs` to the configs of the tasks with their
+trained checkpoints, and give the `task` of each example sent.
+"""
+
+import logging
+import os
+import sys
+
+os.environ["WANDB_DISABLED"] = "true"
+
+from transformers import HfArgumentParser
+
+from training_args import (
+    ModelArguments,
+    DataTrainingArguments,
+    FewShotTrainingArguments,
+    AdapterArguments,
+    ServingArguments,
+)
+from serving import (
+    MicroBatcher,
+    load_predictor,
+    load_multitask_predictor,
+    create_server,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = HfArgumentParser(
+        (
+            ModelArguments,
+            DataTrainingArguments,
+            FewShotTrainingArguments,
+            AdapterArguments,
+            ServingArguments,
+        )
+    )
+    if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
+        (
+            model_args,
+            data_args,
+            training_args,
+            adapter_args,
+            serving_args,
+        ) = parser.parse_json_file(json_file=os.path.abspath(sys.argv[1]))
+    else:
+        (
+            model_args,
+            data_args,
+            training_args,
+            adapter_args,
+            serving_args,
+        ) = parser.parse_args_into_dataclasses()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%m/%d/%Y %H:%M:%S",
+        handlers=[logging.StreamHandler(sys.stdout)],
+        level=logging.INFO,
+    )
+
+    if data_args.task_configs is not None:
+        predictor = load_multitask_predictor(
+            model_args, data_args, training_args, adapter_args
+        )
+    else:
+        predictor = load_predictor(model_args, data_args, training_args, adapter_args)
+    batcher = MicroBatcher(
+        predictor.predict,
+        max_batch_size=serving_args.max_batch_size,
+        max_latency=serving_args.max_latency_ms / 1000,
+    ).start()
+    server = create_server(
+        batcher,
+        host=serving_args.host,
+        port=serving_args.port,
+        unix_socket=serving_args.unix_socket,
+    )
+    logger.info(
+        f"Serving {model_args.model_name_or_path} on "
+        + (
+            serving_args.unix_socket
+            if serving_args.unix_socket is not None
+            else f"{serving_args.host}:{serving_args.port}"
+        )
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+from .batcher import MicroBatcher
+from .predictor import Predictor, load_predictor
+from .server import create_server
+from .multitask_predictor import MultiTaskPredictor, load_multitask_predictor
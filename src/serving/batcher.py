@@ -0,0 +1,93 @@
+"""Implements a micro-batcher, which coalesces the concurrent requests into batches."""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Collects the items submitted from concurrent threads into micro-batches, which are
+    processed in a single worker thread. A batch is processed once it has max_batch_size
+    items, or max_latency seconds after its first item arrived. If a batch fails, its items
+    are processed one by one, so an invalid item only fails its own future.
+    predict_fn: maps a list of items to the list of their results."""
+
+    def __init__(self, predict_fn, max_batch_size, max_latency):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue = queue.Queue()
+        self.stopped = False
+        # Guards the queue against submissions after stop.
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.worker = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def stop(self):
+        """Processes the items submitted so far and stops the worker, the items submitted
+        afterwards fail."""
+        with self.lock:
+            self.stopping = True
+            self.queue.put(None)
+        self.worker.join()
+        while not self.queue.empty():
+            request = self.queue.get()
+            if request is not None:
+                request[1].set_exception(RuntimeError("The batcher is stopped."))
+
+    def submit(self, item):
+        """Submits an item, returns a future holding its result."""
+        future = Future()
+        with self.lock:
+            if self.stopping:
+                future.set_exception(RuntimeError("The batcher is stopped."))
+            else:
+                self.queue.put((item, future))
+        return future
+
+    def collect_batch(self):
+        """Waits for the first item, and collects the next ones until the batch is full
+        or the deadline is reached."""
+        request = self.queue.get()
+        if request is None:
+            self.stopped = True
+            return []
+        batch = [request]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                self.stopped = True
+                break
+            batch.append(request)
+        return batch
+
+    def process_batch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.predict_fn(items)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            for request in batch:
+                self.process_batch([request])
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def run(self):
+        while not self.stopped:
+            batch = self.collect_batch()
+            if batch:
+                self.process_batch(batch)
@@ -0,0 +1,196 @@
+"""Exports the soft-PET prototypical classifier to a self-contained ONNX or TorchScript
+artifact, and runs the exported artifacts with the same interface as `BaseTrainer.predict`.
+"""
+import abc
+import inspect
+
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+
+from transformers.utils import logging
+from utils.utils import compute_prototypical_similarity
+
+logger = logging.get_logger(__name__)
+
+
+class PrototypicalClassifier(nn.Module):
+    """Computes the scores of the labels from the input ids and attention mask, with the
+    encoder of the model (including its adapters), the gathering of the mask embeddings
+    and the similarity to the centroids.
+    model: a RobertaForMaskedLM trained with soft_pet.
+    centroids: the centroids of size num_labels x num_masks x hidden_dim."""
+
+    def __init__(self, model, centroids, similarity, aggregation):
+        super().__init__()
+        self.roberta = model.roberta
+        self.mask_token_id = model.config.mask_token_id
+        self.num_masks = model.num_masks
+        self.similarity = similarity
+        self.aggregation = aggregation
+        self.register_buffer("centroids", centroids.detach().clone())
+
+    def forward(self, input_ids, attention_mask):
+        hidden_states = self.roberta(
+            input_ids=input_ids, attention_mask=attention_mask
+        )[0]
+        # The masks are consecutive, we gather them from the first mask position onward.
+        mask_start = (input_ids == self.mask_token_id).int().argmax(dim=-1)
+        mask_indices = mask_start.unsqueeze(-1) + torch.arange(
+            self.num_masks, device=input_ids.device
+        )
+        mask_embeds = hidden_states.gather(
+            1,
+            mask_indices.unsqueeze(-1).expand(-1, -1, hidden_states.shape[-1]),
+        )  # batch_size x num_masks x hidden_dim
+        return compute_prototypical_similarity(
+            mask_embeds,
+            self.centroids,
+            similarity=self.similarity,
+            aggregation=self.aggregation,
+        )
+
+
+def get_prototypical_classifier(trainer):
+    """Builds the prototypical classifier from the model and centroids of the trainer."""
+    args = trainer.args
+    if not (args.soft_pet and args.prototypical_eval) or args.prompt_tune:
+        raise ValueError(
+            "Export is only supported for soft_pet with prototypical_eval, without prompt_tune."
+        )
+    trainer.model.eval()
+    classifier = PrototypicalClassifier(
+        trainer.model,
+        trainer.get_centroids(trainer.model),
+        similarity=args.prototypical_similarity,
+        aggregation=args.eval_soft_pet_aggregation,
+    )
+    return classifier.eval()
+
+
+def export_prototypical_classifier(
+    classifier, inputs, path, export_format, opset_version=13
+):
+    """Traces the classifier on the given inputs, with dynamic batch and sequence axes."""
+    example_inputs = (inputs["input_ids"], inputs["attention_mask"])
+    with torch.no_grad():
+        if export_format == "onnx":
+            # Recent versions of torch export with `torch.export` by default, which does not
+            # support the older opsets, the TorchScript exporter is kept for all the opsets.
+            export_kwargs = (
+                {"dynamo": False}
+                if "dynamo" in inspect.signature(torch.onnx.export).parameters
+                else {}
+            )
+            torch.onnx.export(
+                classifier,
+                example_inputs,
+                path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["scores"],
+                dynamic_axes={
+                    "input_ids": {0: "batch_size", 1: "sequence_length"},
+                    "attention_mask": {0: "batch_size", 1: "sequence_length"},
+                    "scores": {0: "batch_size"},
+                },
+                opset_version=opset_version,
+                **export_kwargs,
+            )
+        elif export_format == "torchscript":
+            torch.jit.trace(classifier, example_inputs).save(path)
+        else:
+            raise ValueError(
+                f"Unrecognized export format {export_format}, it should be `onnx` or `torchscript`."
+            )
+    logger.info(f"Exported the prototypical classifier to {path}")
+
+
+class ExportedModelRunner(abc.ABC):
+    """Runs an exported classifier, with the same interface as `BaseTrainer.predict`.
+    data_collator: the collator used to batch the processed examples.
+    batch_size: the number of examples scored at once."""
+
+    def __init__(self, path, data_collator, batch_size):
+        self.path = path
+        self.data_collator = data_collator
+        self.batch_size = batch_size
+
+    @abc.abstractmethod
+    def score(self, input_ids, attention_mask):
+        """Returns the scores of the labels as a numpy array of size batch_size x num_labels."""
+        pass
+
+    def collate(self, features):
+        features = [
+            {k: feature[k] for k in ["input_ids", "attention_mask"]}
+            for feature in features
+        ]
+        return self.data_collator(features)
+
+    def predict_batches(self, predict_datasets):
+        dataloader = DataLoader(
+            predict_datasets, batch_size=self.batch_size, collate_fn=self.collate
+        )
+        for inputs in dataloader:
+            yield self.score(inputs["input_ids"], inputs["attention_mask"])
+
+    def predict(self, predict_datasets):
+        y_hats = []
+        for logits in self.predict_batches(predict_datasets):
+            y_hats.extend(np.argmax(logits, axis=1))
+        return y_hats
+
+
+class ONNXRunner(ExportedModelRunner):
+    def __init__(self, path, data_collator, batch_size):
+        super().__init__(path, data_collator, batch_size)
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(
+            path, providers=["CPUExecutionProvider"]
+        )
+
+    def score(self, input_ids, attention_mask):
+        return self.session.run(
+            ["scores"],
+            {
+                "input_ids": input_ids.cpu().numpy().astype(np.int64),
+                "attention_mask": attention_mask.cpu().numpy().astype(np.int64),
+            },
+        )[0]
+
+
+class TorchScriptRunner(ExportedModelRunner):
+    def __init__(self, path, data_collator, batch_size):
+        super().__init__(path, data_collator, batch_size)
+        self.module = torch.jit.load(path, map_location="cpu").eval()
+
+    def score(self, input_ids, attention_mask):
+        with torch.no_grad():
+            return self.module(input_ids, attention_mask).float().numpy()
+
+
+RUNNER_MAPPING = {"onnx": ONNXRunner, "torchscript": TorchScriptRunner}
+
+
+def check_parity(classifier, runner, batches, atol=1e-4):
+    """Compares the scores of the exported classifier with the eager one on the given batches,
+    returns the maximum absolute difference and raises an error if this is above atol.
+    """
+    max_diff = 0.0
+    for inputs in batches:
+        with torch.no_grad():
+            expected = (
+                classifier(inputs["input_ids"], inputs["attention_mask"])
+                .float()
+                .numpy()
+            )
+        scores = runner.score(inputs["input_ids"], inputs["attention_mask"])
+        max_diff = max(max_diff, float(np.abs(expected - scores).max()))
+    if max_diff > atol:
+        raise ValueError(
+            f"The exported classifier differs from the eager one by {max_diff} > {atol}."
+        )
+    logger.info(f"Parity with the eager classifier: max absolute difference {max_diff}")
+    return max_diff
@@ -0,0 +1,119 @@
+"""Generates a synthetic load of concurrent clients on a local prediction server, and
+reports the latency and throughput.
+
+Usage: python src/serving/load_generator.py --task tweet_eval_hate --unix_socket /tmp/raft.sock
+"""
+import argparse
+import http.client
+import json
+import random
+import socket
+import string
+import threading
+import time
+
+import numpy as np
+
+# The fields of the examples of each task, which are filled with random words.
+TASK_FIELDS = {
+    "ade_corpus_v2": ["Sentence"],
+    "banking_77": ["Query"],
+    "neurips_impact_statement_risks": ["Impact statement"],
+    "one_stop_english": ["Article"],
+    "overruling": ["Sentence"],
+    "semiconductor_org_types": ["Paper title", "Organization name"],
+    "systematic_review_inclusion": ["Title", "Abstract"],
+    "tai_safety_research": ["Title", "Abstract Note"],
+    "terms_of_service": ["Sentence"],
+    "tweet_eval_hate": ["Tweet"],
+    "twitter_complaints": ["Tweet text"],
+}
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix socket."""
+
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def get_connection(args):
+    if args.unix_socket is not None:
+        return UnixHTTPConnection(args.unix_socket)
+    return http.client.HTTPConnection(args.host, args.port)
+
+
+def random_example(fields, max_words):
+    def random_word():
+        return "".join(random.choices(string.ascii_lowercase, k=random.randint(2, 8)))
+
+    return {
+        field: " ".join(random_word() for _ in range(random.randint(1, max_words)))
+        for field in fields
+    }
+
+
+def run_client(args, fields, latencies, lock):
+    connection = get_connection(args)
+    for _ in range(args.num_requests):
+        examples = [
+            random_example(fields, args.max_words)
+            for _ in range(args.examples_per_request)
+        ]
+        body = json.dumps({"examples": examples})
+        start = time.monotonic()
+        connection.request(
+            "POST", "/predict", body, {"Content-Type": "application/json"}
+        )
+        response = connection.getresponse()
+        predictions = json.loads(response.read())["predictions"]
+        assert response.status == 200 and len(predictions) == len(examples)
+        with lock:
+            latencies.append(time.monotonic() - start)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--task", required=True, choices=list(TASK_FIELDS.keys()))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix_socket", default=None)
+    parser.add_argument("--num_clients", type=int, default=16)
+    parser.add_argument("--num_requests", type=int, default=20)
+    parser.add_argument("--examples_per_request", type=int, default=1)
+    parser.add_argument("--max_words", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    latencies = []
+    lock = threading.Lock()
+    clients = [
+        threading.Thread(
+            target=run_client, args=(args, TASK_FIELDS[args.task], latencies, lock)
+        )
+        for _ in range(args.num_clients)
+    ]
+    start = time.monotonic()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    total_time = time.monotonic() - start
+
+    latencies = np.array(latencies) * 1000
+    num_examples = len(latencies) * args.examples_per_request
+    print(f"requests: {len(latencies)}, examples: {num_examples}")
+    print(f"throughput: {num_examples / total_time:.2f} examples/s")
+    for percentile in [50, 90, 99]:
+        print(f"latency p{percentile}: {np.percentile(latencies, percentile):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Loads the trained checkpoints of several tasks into a single model, and predicts the
+labels of batches mixing the examples of the tasks."""
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List
+
+import torch
+
+from transformers import HfArgumentParser
+from transformers.file_utils import WEIGHTS_NAME
+from transformers.modeling_utils import no_init_weights
+
+from adapters import BankedLayerNorm, BankedLinear, set_adapter_ids
+from models import RobertaConfig, RobertaModel
+from trainers import CENTROIDS_NAME
+from training_args import (
+    ModelArguments,
+    DataTrainingArguments,
+    FewShotTrainingArguments,
+    AdapterArguments,
+)
+from utils.utils import (
+    compute_prototypical_similarity,
+    create_layer_norm_banks,
+    get_adapter_config,
+    set_config_args,
+    set_trainable_params,
+)
+from data.collators import DataCollatorWithDynamicPadding
+from data.preprocessing import MLMProcessor
+from .predictor import load_task_processor
+
+
+@dataclass
+class TaskHead:
+    """Preprocesses the examples of a task and scores its rows of the batch.
+    centroids: the centroids of size num_labels x num_masks x hidden_dim."""
+
+    processor: MLMProcessor
+    verbalizers: List[str]
+    centroids: torch.Tensor
+    similarity: str
+    aggregation: str
+
+    def score(self, sequence_output, mask_start):
+        """Returns the scores of the labels of size batch_size x num_labels."""
+        num_masks = self.centroids.shape[1]
+        mask_indices = (
+            mask_start.unsqueeze(-1) + torch.arange(num_masks, device=mask_start.device)
+        ).clamp(max=sequence_output.shape[1] - 1)
+        rows = torch.arange(sequence_output.shape[0], device=sequence_output.device)
+        mask_embeds = sequence_output[rows.unsqueeze(-1), mask_indices]
+        return compute_prototypical_similarity(
+            mask_embeds,
+            self.centroids,
+            similarity=self.similarity,
+            aggregation=self.aggregation,
+        )
+
+
+class MultiTaskPredictor:
+    """Keeps a single backbone with banks of adapters resident, and predicts the labels of
+    batches mixing the examples of several tasks. The whole batch goes through the encoder
+    at once, each row with the adapters and layer norms of its task, then the rows of each
+    task are scored against the centroids of their task.
+    model: a RobertaModel with banks of adapters, indexed by the task ids.
+    heads: an OrderedDict of the TaskHead of each task, in the order of the task ids.
+    pad_token_id: the id used to pad the input_ids.
+    device: the device of the model."""
+
+    def __init__(self, model, heads, pad_token_id, device):
+        self.model = model
+        self.heads = heads
+        self.task_ids = {task: task_id for task_id, task in enumerate(heads)}
+        self.data_collator = DataCollatorWithDynamicPadding(pad_token_id=pad_token_id)
+        self.device = device
+
+    def get_task(self, example):
+        task = example.get("task")
+        if task not in self.heads:
+            raise ValueError(
+                f"Each example should have a `task` among {list(self.heads)}, got {task}."
+            )
+        return task
+
+    def preprocess(self, example):
+        example = dict(example)
+        task = self.get_task(example)
+        # Examples to predict are not labeled, as in the test sets.
+        example.setdefault("Label", 0)
+        features = self.heads[task].processor(example)
+        features.pop("extra_fields")
+        features["task_ids"] = self.task_ids[task]
+        return features
+
+    def score(self, examples):
+        """Returns the scores of the labels of each example, as arrays of size the number
+        of labels of its task."""
+        features = [self.preprocess(example) for example in examples]
+        batch = self.data_collator(features)
+        batch = {key: value.to(self.device) for key, value in batch.items()}
+        task_ids = batch["task_ids"]
+        scores = [None] * len(examples)
+        with torch.no_grad():
+            set_adapter_ids(self.model, task_ids)
+            sequence_output = self.model(
+                input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]
+            )[0]
+            for task_id, head in enumerate(self.heads.values()):
+                rows = (task_ids == task_id).nonzero().squeeze(-1)
+                if len(rows) == 0:
+                    continue
+                task_scores = head.score(
+                    sequence_output[rows], batch["mask_start"][rows]
+                )
+                for row, row_scores in zip(
+                    rows.tolist(), task_scores.float().cpu().numpy()
+                ):
+                    scores[row] = row_scores
+        return scores
+
+    def predict(self, examples):
+        """Returns for each example the predicted label of its task and the scores of all
+        the labels of its task."""
+        scores = self.score(examples)
+        return [
+            {
+                "label": self.heads[self.get_task(example)].verbalizers[
+                    int(example_scores.argmax())
+                ],
+                "scores": example_scores.tolist(),
+            }
+            for example, example_scores in zip(examples, scores)
+        ]
+
+
+def check_banked_inference_args(training_args, adapter_args, task_config):
+    if (
+        not training_args.soft_pet
+        or not training_args.prototypical_eval
+        or training_args.prompt_tune
+        or training_args.train_classifier
+        or not adapter_args.adapter_tune
+        or adapter_args.tune_biases
+    ):
+        raise ValueError(
+            "Serving several tasks with a single model requires checkpoints trained with "
+            "soft_pet, prototypical_eval and adapter_tune, without prompt_tune and tune_biases, "
+            f"in {task_config}."
+        )
+
+
+def load_task_weights(model, state_dict, task_id, checkpoint):
+    """Loads the weights of the `roberta` encoder of the task in the state dict into its
+    slot of the banks of the model. The other weights should be the ones of the frozen
+    backbone shared by all the tasks, they are loaded from the first task."""
+    banked_names = {
+        f"{module_name}.{name}"
+        for module_name, module in model.named_modules()
+        if isinstance(module, (BankedLinear, BankedLayerNorm))
+        for name, _ in module.named_parameters()
+    }
+    for name, value in model.state_dict().items():
+        weight = state_dict.get(f"roberta.{name}")
+        if weight is None:
+            raise ValueError(f"The weight roberta.{name} is missing from {checkpoint}.")
+        if name in banked_names:
+            value[task_id].copy_(weight)
+        elif task_id == 0:
+            value.copy_(weight)
+        elif not torch.equal(value, weight.to(value.dtype)):
+            raise ValueError(
+                f"The weight roberta.{name} of {checkpoint} differs from the one of the first "
+                "task, the tasks should share their frozen backbone."
+            )
+
+
+def load_multitask_predictor(model_args, data_args, training_args, adapter_args):
+    """Loads the trained checkpoints of the tasks of `data_args.task_configs`, read from
+    the `model_name_or_path` of each config, into a single backbone with banks of the
+    adapters, and of the layer norms with tune_layernorms, of the tasks."""
+    parser = HfArgumentParser(
+        (
+            ModelArguments,
+            DataTrainingArguments,
+            FewShotTrainingArguments,
+            AdapterArguments,
+        )
+    )
+    tasks_args = OrderedDict()
+    for task_config in data_args.task_configs:
+        task_args = parser.parse_json_file(json_file=os.path.abspath(task_config))
+        check_banked_inference_args(task_args[2], task_args[3], task_config)
+        if task_args[1].task in tasks_args:
+            raise ValueError(f"The task {task_args[1].task} is given twice.")
+        tasks_args[task_args[1].task] = task_args
+
+    first_model_args, _, first_training_args, first_adapter_args = next(
+        iter(tasks_args.values())
+    )
+    adapter_config = get_adapter_config(first_adapter_args)
+    for task, (_, _, _, task_adapter_args) in tasks_args.items():
+        if dict(vars(task_adapter_args), print_params=None) != dict(
+            vars(first_adapter_args), print_params=None
+        ):
+            raise ValueError(
+                f"The adapters of {task} differ from the ones of the first task, the tasks "
+                "should be trained with the same adapter arguments."
+            )
+    config = RobertaConfig.from_pretrained(
+        first_model_args.model_name_or_path, cache_dir=first_model_args.cache_dir
+    )
+    set_config_args(config, first_training_args)
+    adapter_config.num_adapters = len(tasks_args)
+    # All the weights are loaded from the checkpoints.
+    with no_init_weights():
+        model = RobertaModel(
+            config, add_pooling_layer=False, adapter_config=adapter_config
+        )
+    # The layer norms trained with the adapters differ across the tasks, the other ones
+    # are the ones of the frozen backbone.
+    set_trainable_params(model, first_adapter_args)
+    create_layer_norm_banks(model, len(tasks_args))
+
+    heads = OrderedDict()
+    for task_id, (task, task_args) in enumerate(tasks_args.items()):
+        task_model_args, task_data_args, task_training_args, _ = task_args
+        checkpoint = task_model_args.model_name_or_path
+        task_config = RobertaConfig.from_pretrained(
+            checkpoint, cache_dir=task_model_args.cache_dir
+        )
+        (
+            auto_task,
+            tokenizer,
+            mlm_processor,
+            _,
+            verbalizers_tags,
+        ) = load_task_processor(
+            task_model_args, task_data_args, task_training_args, task_config.vocab_size
+        )
+        state_dict = torch.load(
+            os.path.join(checkpoint, WEIGHTS_NAME), map_location="cpu"
+        )
+        load_task_weights(model, state_dict, task_id, checkpoint)
+        if task_training_args.label_embeddings_as_centroids:
+            centroids = state_dict["extra_embeddings.weight"].view(
+                auto_task.num_labels, task_training_args.num_extra_tokens, -1
+            )
+        else:
+            centroids_path = os.path.join(checkpoint, CENTROIDS_NAME)
+            if not os.path.isfile(centroids_path):
+                raise ValueError(
+                    f"Prototypical eval requires the train centroids saved in {centroids_path}."
+                )
+            centroids = torch.load(centroids_path, map_location="cpu")
+        heads[task] = TaskHead(
+            processor=mlm_processor,
+            verbalizers=verbalizers_tags,
+            centroids=centroids.to(training_args.device),
+            similarity=task_training_args.prototypical_similarity,
+            aggregation=task_training_args.eval_soft_pet_aggregation,
+        )
+        del state_dict
+
+    model.to(training_args.device).eval()
+    return MultiTaskPredictor(
+        model,
+        heads,
+        pad_token_id=tokenizer.pad_token_id,
+        device=training_args.device,
+    )
@@ -0,0 +1,214 @@
+"""Loads a trained checkpoint once and predicts the labels of raw examples."""
+import os
+import torch
+
+from transformers import AutoTokenizer
+from transformers.file_utils import WEIGHTS_NAME
+
+from models import RobertaForMaskedLM, RobertaConfig, RobertaForSequenceClassification
+from trainers import BaseTrainer, CENTROIDS_NAME
+from utils.utils import (
+    get_adapter_config,
+    set_config_args,
+)
+from data.preprocessing import MLMProcessor
+from data.tasks import AutoTask
+from data.processors import AutoProcessor
+from data.collators import DataCollatorWithDynamicPadding
+from .quantization import quantize_model
+
+
+class Predictor:
+    """Keeps the tokenizer, processors, model and centroids resident, and predicts
+    the labels of batches of raw examples with the same code as `BaseTrainer.predict`.
+    trainer: a BaseTrainer holding the trained model.
+    processor: the MLMProcessor used to preprocess the examples.
+    verbalizers: the verbalizer of each label, which is returned as the label."""
+
+    def __init__(self, trainer, processor, verbalizers):
+        self.trainer = trainer
+        self.processor = processor
+        self.verbalizers = verbalizers
+        self.data_collator = trainer.data_collator
+
+    def preprocess(self, example):
+        # Examples to predict are not labeled, as in the test sets.
+        example = dict(example)
+        example.setdefault("Label", 0)
+        features = self.processor(example)
+        features.pop("extra_fields")
+        return features
+
+    def score(self, examples):
+        """Returns the scores of the labels of size len(examples) x num_labels."""
+        features = [self.preprocess(example) for example in examples]
+        return self.trainer.score_batch(self.data_collator(features))
+
+    def quantize(self, quantization, calibration_examples=None, batch_size=32):
+        """Quantizes the model to int8 for CPU inference, the static quantization is
+        calibrated on the given examples. The centroids computed with the original model
+        are kept."""
+        if self.trainer.args.device.type != "cpu":
+            raise ValueError(
+                "Quantized inference is only supported on CPU, set no_cuda."
+            )
+        model = self.trainer.model
+        centroids = None
+        if self.trainer.args.prototypical_eval:
+            centroids = self.trainer.get_centroids(model)
+
+        def calibrate():
+            for i in range(0, len(calibration_examples), batch_size):
+                self.score(calibration_examples[i : i + batch_size])
+
+        quantize_model(
+            model,
+            quantization,
+            calibration_fn=calibrate if calibration_examples is not None else None,
+        )
+        if centroids is not None:
+            self.trainer.set_centroids(centroids)
+
+    def predict(self, examples):
+        """Returns for each example the predicted label and the scores of all labels."""
+        scores = self.score(examples)
+        return [
+            {
+                "label": self.verbalizers[int(example_scores.argmax())],
+                "scores": example_scores.tolist(),
+            }
+            for example_scores in scores
+        ]
+
+
+def load_task_processor(model_args, data_args, training_args, vocab_size):
+    """Returns the task, the tokenizer, the MLMProcessor preprocessing the examples, the
+    tokenized verbalizers of the model and the verbalizer of each label. The extra tokens
+    of soft_pet are numbered from vocab_size."""
+    checkpoint = model_args.model_name_or_path
+    task = AutoTask.get(
+        task=data_args.task,
+        data_seed=data_args.data_seed,
+        cache_dir=model_args.cache_dir,
+        data_dir=data_args.data_dir,
+    )
+    tokenizer = AutoTokenizer.from_pretrained(
+        model_args.tokenizer_name if model_args.tokenizer_name else checkpoint,
+        cache_dir=model_args.cache_dir,
+        use_fast=model_args.use_fast_tokenizer,
+    )
+    processor = AutoProcessor.get(
+        task=data_args.task,
+        tokenizer=tokenizer,
+        with_pattern=not training_args.soft_pet and not data_args.no_pattern,
+        pattern_id=data_args.pattern_id,
+        mask_position=training_args.mask_position,
+    )
+    verbalizers_tags = processor.get_verbalizers()
+
+    if training_args.num_extra_tokens == -1:
+        training_args.num_extra_tokens = max(
+            [len(t[0]) for t in processor.get_tokenized_verbalizers()]
+        )
+    verbalizers = {"init": processor.get_tokenized_verbalizers()}
+    extra_token_verbalizers = None
+    if training_args.soft_pet:
+        start = vocab_size
+        extra_token_verbalizers = []
+        for l in range(task.num_labels):
+            tokens = [i for i in range(start, start + training_args.num_extra_tokens)]
+            start += training_args.num_extra_tokens
+            extra_token_verbalizers.append([tokens])
+        verbalizers["extra"] = extra_token_verbalizers
+
+    mlm_processor = MLMProcessor(
+        tokenizer=tokenizer,
+        tokenized_verbalizers=extra_token_verbalizers,
+        max_seq_length=data_args.max_seq_length,
+        processor=processor,
+        mask_length=training_args.num_extra_tokens if training_args.soft_pet else None,
+        train_classifier=training_args.train_classifier,
+    )
+    return task, tokenizer, mlm_processor, verbalizers, verbalizers_tags
+
+
+def load_predictor(model_args, data_args, training_args, adapter_args):
+    """Loads the trained checkpoint in `model_args.model_name_or_path`, with the centroids
+    saved next to it in case of prototypical eval."""
+    checkpoint = model_args.model_name_or_path
+    config = RobertaConfig.from_pretrained(checkpoint, cache_dir=model_args.cache_dir)
+    task, tokenizer, mlm_processor, verbalizers, verbalizers_tags = load_task_processor(
+        model_args, data_args, training_args, config.vocab_size
+    )
+    set_config_args(config, training_args)
+    config.num_labels = task.num_labels
+    config.mask_token_id = tokenizer.mask_token_id
+    config.pad_token_id = tokenizer.pad_token_id
+    # The extra embeddings are loaded from the checkpoint, so there is no need to initialize them from
+    # the pretrained model.
+    config.extra_tokens_init = "random"
+
+    if training_args.train_classifier:
+        model = RobertaForSequenceClassification.from_pretrained(
+            checkpoint, config=config, cache_dir=model_args.cache_dir
+        )
+    else:
+        model = RobertaForMaskedLM.from_pretrained(
+            checkpoint,
+            config=config,
+            cache_dir=model_args.cache_dir,
+            adapter_config=get_adapter_config(adapter_args),
+            tokenized_verbalizers=verbalizers,
+        )
+    if training_args.prompt_tune:
+        # The prompt embedding is created after loading the model, we load its weights separately.
+        model.create_prompt_embedding()
+        state_dict = torch.load(
+            os.path.join(checkpoint, WEIGHTS_NAME), map_location="cpu"
+        )
+        model.load_state_dict(state_dict, strict=False)
+
+    trainer = BaseTrainer(
+        model=model,
+        args=training_args,
+        tokenizer=tokenizer,
+        data_collator=DataCollatorWithDynamicPadding(
+            pad_token_id=tokenizer.pad_token_id
+        ),
+        task=data_args.task,
+        metrics=task.metric,
+    )
+    if (
+        training_args.prototypical_eval
+        and not training_args.label_embeddings_as_centroids
+    ):
+        centroids_path = os.path.join(checkpoint, CENTROIDS_NAME)
+        if not os.path.isfile(centroids_path):
+            raise ValueError(
+                f"Prototypical eval requires the train centroids saved in {centroids_path}."
+            )
+        trainer.load_centroids(centroids_path)
+    predictor = Predictor(
+        trainer=trainer, processor=mlm_processor, verbalizers=verbalizers_tags
+    )
+    if training_args.quantization is not None:
+        calibration_examples = None
+        if training_args.quantization == "static":
+            # Calibrates on the train examples, completed with unlabeled test examples.
+            datasets = task.get_datasets()
+            calibration_examples = list(datasets["train"])[
+                : training_args.num_calibration_examples
+            ]
+            num_test_examples = min(
+                training_args.num_calibration_examples - len(calibration_examples),
+                datasets["test"].num_rows,
+            )
+            calibration_examples += list(
+                datasets["test"].select(range(num_test_examples))
+            )
+        predictor.quantize(
+            training_args.quantization,
+            calibration_examples=calibration_examples,
+            batch_size=training_args.per_device_eval_batch_size,
+        )
+    return predictor
@@ -0,0 +1,88 @@
+"""Quantizes the linear layers of the encoder and of the adapters to int8 for CPU inference."""
+import torch
+from torch import nn
+from torch.quantization import DeQuantStub, QuantStub
+
+from transformers.utils import logging
+from adapters.adapter_modeling import Adapter
+from models.roberta.modeling_roberta import (
+    RobertaSelfAttention,
+    RobertaSelfOutput,
+    RobertaIntermediate,
+    RobertaOutput,
+)
+
+logger = logging.get_logger(__name__)
+
+# The modules whose linear layers are quantized, the embeddings and the LM head are kept in fp32.
+QUANTIZED_MODULES = (
+    RobertaSelfAttention,
+    RobertaSelfOutput,
+    RobertaIntermediate,
+    RobertaOutput,
+    Adapter,
+)
+
+
+class StaticQuantizedLinear(nn.Module):
+    """Wraps a linear layer to quantize its inputs and dequantize its outputs, so that only
+    the linear layer runs in int8 with static quantization."""
+
+    def __init__(self, linear):
+        super().__init__()
+        self.quant = QuantStub()
+        self.linear = linear
+        self.dequant = DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.linear(self.quant(x)))
+
+
+def get_quantized_linear_layers(model):
+    """Returns the qualified name, parent module and attribute name of each linear layer
+    to quantize."""
+    layers = []
+    for prefix, module in model.named_modules():
+        if isinstance(module, QUANTIZED_MODULES):
+            for name, child in module.named_children():
+                if isinstance(child, nn.Linear):
+                    layers.append((f"{prefix}.{name}", module, name))
+    return layers
+
+
+def quantize_model(model, quantization, calibration_fn=None, backend="fbgemm"):
+    """Quantizes in place the linear layers of `QUANTIZED_MODULES` to int8.
+    quantization: `dynamic` quantizes the activations on the fly, `static` uses the scales
+        of the activations observed while running calibration_fn.
+    calibration_fn: runs the model on the calibration examples, required for `static`.
+    backend: the quantized engine, `fbgemm` for x86 or `qnnpack` for arm."""
+    model.eval()
+    torch.backends.quantized.engine = backend
+    layers = get_quantized_linear_layers(model)
+    if quantization == "dynamic":
+        qconfig_spec = {
+            qualified_name: torch.quantization.default_dynamic_qconfig
+            for qualified_name, _, _ in layers
+        }
+        torch.quantization.quantize_dynamic(
+            model, qconfig_spec, dtype=torch.qint8, inplace=True
+        )
+    elif quantization == "static":
+        if calibration_fn is None:
+            raise ValueError("Static quantization requires a calibration_fn.")
+        for _, module, name in layers:
+            wrapper = StaticQuantizedLinear(getattr(module, name))
+            wrapper.qconfig = torch.quantization.get_default_qconfig(backend)
+            setattr(module, name, wrapper)
+        torch.quantization.prepare(model, inplace=True)
+        with torch.no_grad():
+            calibration_fn()
+        torch.quantization.convert(model, inplace=True)
+    else:
+        raise ValueError(
+            f"Unrecognized quantization {quantization}, it should be `dynamic` or `static`."
+        )
+    logger.info(
+        f"Quantized {len(layers)} linear layers with {quantization} quantization"
+    )
+    return model
@@ -0,0 +1,78 @@
+"""Implements a local HTTP server, listening on a TCP port or a unix socket, to predict
+the labels of the examples sent to it."""
+import json
+import os
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """Handles `POST /predict` with a body of the form {"examples": [{field: value, ...}]}
+    and answers with {"predictions": [{"label": ..., "scores": [...]}]}, and `GET /health`.
+    """
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        self.send_json({"status": "ok"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            examples = json.loads(self.rfile.read(length))["examples"]
+        except (ValueError, KeyError, TypeError):
+            examples = None
+        if not isinstance(examples, list) or not all(
+            isinstance(example, dict) for example in examples
+        ):
+            self.send_error(
+                400, "The body should be a json of the form {'examples': [{...}, ...]}"
+            )
+            return
+        # Each example is submitted separately, so they are batched with the examples of
+        # the concurrent requests.
+        futures = [self.server.batcher.submit(example) for example in examples]
+        try:
+            predictions = [future.result() for future in futures]
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_json({"predictions": predictions})
+
+    def send_json(self, results):
+        body = json.dumps(results).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Clients of unix sockets have no address.
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+
+def create_server(batcher, host="127.0.0.1", port=8000, unix_socket=None):
+    """Creates a server answering the requests with the given batcher, on the unix socket
+    if this is given, otherwise on host:port."""
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, PredictionRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), PredictionRequestHandler)
+    server.batcher = batcher
+    return server
@@ -1 +1,2 @@
-from .trainer import BaseTrainer
+from .trainer import BaseTrainer, CENTROIDS_NAME
+from .multitask_trainer import MultiTaskTrainer
@@ -0,0 +1,110 @@
+"""Implements a trainer training several tasks at once with a shared frozen backbone."""
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from torch.utils.data.dataset import Dataset
+
+from transformers.file_utils import WEIGHTS_NAME
+from transformers.utils import logging
+
+from .trainer import BaseTrainer
+
+logger = logging.get_logger(__name__)
+
+
+class MultiTaskTrainer(BaseTrainer):
+    """Trains the models of a `MultiTaskModel` at once, on batches mixing the examples of
+    the tasks. Each task is evaluated, saved and predicted by its own BaseTrainer, with the
+    arguments of its config, as in its separate run.
+    task_trainers: an OrderedDict of the BaseTrainer of each task, holding the task model,
+    in the order of the task ids."""
+
+    def __init__(self, task_trainers, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.task_trainers = task_trainers
+
+    def get_optimizer_grouped_parameters(self):
+        """Returns the parameter groups of all the tasks, with the learning rates and weight
+        decay of their configs. The frozen backbone is shared by the tasks, so only the
+        trainable parameters are optimized."""
+        optimizer_grouped_parameters = []
+        for trainer in self.task_trainers.values():
+            for group in trainer.get_optimizer_grouped_parameters():
+                group = dict(group)
+                group["params"] = [p for p in group["params"] if p.requires_grad]
+                group.setdefault("lr", trainer.args.learning_rate)
+                optimizer_grouped_parameters.append(group)
+        return optimizer_grouped_parameters
+
+    def set_negative_sampling(self, global_step, max_steps):
+        for trainer in self.task_trainers.values():
+            trainer.set_negative_sampling(global_step, max_steps)
+
+    def invalidate_centroids(self):
+        """The task models are trained by this trainer, so the centroids cached by the
+        task trainers are invalidated with its own."""
+        super().invalidate_centroids()
+        for trainer in self.task_trainers.values():
+            trainer.invalidate_centroids()
+
+    def evaluate(
+        self,
+        eval_datasets: Optional[Dataset] = None,
+        eval_targets: Optional[Dataset] = None,
+        ignore_keys: Optional[List[str]] = None,
+        metric_key_prefix: str = "eval",
+    ) -> Dict[str, float]:
+        """Evaluates each task on its validation set, the metrics are prefixed with the
+        task name, and the `average` metric is the average of the tasks averages."""
+        metrics = {}
+        for task, trainer in self.task_trainers.items():
+            if trainer.eval_dataset is None:
+                continue
+            output = trainer.eval_loop(
+                eval_datasets=None,
+                eval_targets=None,
+                description=f"Evaluation of {task}",
+                metric_key_prefix=metric_key_prefix,
+            )
+            for key, value in output.metrics.items():
+                name = key[len(metric_key_prefix) + 1 :]
+                metrics[f"{metric_key_prefix}_{task}_{name}"] = value
+        metrics[f"{metric_key_prefix}_average"] = np.mean(
+            [
+                metrics[f"{metric_key_prefix}_{task}_average"]
+                for task in self.task_trainers
+                if f"{metric_key_prefix}_{task}_average" in metrics
+            ]
+        )
+        self.log(metrics)
+        self.control = self.callback_handler.on_evaluate(
+            self.args, self.state, self.control, metrics
+        )
+        return metrics
+
+    def _save(self, output_dir: Optional[str] = None, state_dict=None):
+        """Saves the trainable parameters of the tasks, from which the training is resumed
+        and the best model is loaded. The checkpoint of each task is saved by its trainer."""
+        output_dir = output_dir if output_dir is not None else self.args.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        logger.info(f"Saving the trainable parameters of the tasks to {output_dir}")
+        state_dict = {
+            n: p.detach() for n, p in self.model.named_parameters() if p.requires_grad
+        }
+        torch.save(state_dict, os.path.join(output_dir, WEIGHTS_NAME))
+        torch.save(self.args, os.path.join(output_dir, "training_args.bin"))
+
+    def _load_state_dict_in_model(self, state_dict):
+        self.model.load_state_dict(state_dict, strict=False)
+        missing_keys = [
+            n
+            for n, p in self.model.named_parameters()
+            if p.requires_grad and n not in state_dict
+        ]
+        if len(missing_keys) != 0:
+            logger.warn(
+                f"There were missing keys in the checkpoint model loaded: {missing_keys}."
+            )
+        self.invalidate_centroids()
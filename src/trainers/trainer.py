@@ -10,11 +10,12 @@ from typing import Dict, List, Optional, Union, Any
 from torch.utils.checkpoint import checkpoint_sequential
 from tqdm.auto import tqdm
 import warnings
-from torch.utils.data import DataLoader, Dataset, IterableDataset
+from torch.utils.data import BatchSampler, DataLoader, Dataset, IterableDataset
 from torch.utils.data.distributed import DistributedSampler
 from torch import nn
 import torch.nn.functional as F
 import collections
+import datasets
 
 
 from transformers import __version__
@@ -59,6 +60,7 @@ if is_torch_tpu_available():
 
 from utils.utils import compute_accuracy_from_losses, get_aggregation
 from models import RobertaForMaskedLM
+from data.tensor_store import TensorStore
 
 if is_fairscale_available():
     dep_version_check("fairscale")
@@ -74,12 +76,24 @@ else:
 if is_sagemaker_mp_enabled():
     import smdistributed.modelparallel.torch as smp
 
-from utils.utils import get_aggregation, trim_input_ids, create_dir
+from utils.utils import (
+    get_aggregation,
+    trim_input_ids,
+    trim_batch_input_ids,
+    create_dir,
+    is_out_of_memory_error,
+    free_memory,
+    split_batch,
+    get_rng_states,
+    set_rng_states,
+    compute_prototypical_similarity,
+)
 
 logger = logging.get_logger(__name__)
 
 
 SOFT_MASK_LABELS = "extra_embeddings"
+CENTROIDS_NAME = "centroids.bin"
 
 
 class BaseTrainer(Trainer):
@@ -97,6 +111,253 @@ class BaseTrainer(Trainer):
         self.task = task
         self.metrics = metrics
         self.extra_info = extra_info
+        # Caches the train centroids, until the weights of the model change.
+        self._train_centroids = None
+        self._train_label_counts = None
+        self._eval_batch_size_probed = False
+        # With auto_batch_size, the train batches are run in chunks of at most this size
+        # once a train batch ran out of memory.
+        self._train_chunk_size = None
+        self._loss_weight = 1.0
+
+    def train(self, *args, **kwargs):
+        if self.args.auto_batch_size and self.train_dataset is not None:
+            self.probe_train_batch_size()
+        return super().train(*args, **kwargs)
+
+    def set_negative_sampling(self, global_step, max_steps):
+        """Samples the negative labels of the hinge losses except in the last
+        full_negatives_steps steps, where they are computed against all the wrong labels."""
+        if self.args.num_negatives is not None:
+            self.model.sample_negatives = (
+                global_step < max_steps - self.args.full_negatives_steps
+            )
+
+    def training_step(self, model, inputs):
+        self.set_negative_sampling(self.state.global_step, self.state.max_steps)
+        # The optimizer step following this step updates the weights.
+        self.invalidate_centroids()
+        if not self.args.auto_batch_size:
+            return super().training_step(model, inputs)
+        batch_size = next(iter(inputs.values())).shape[0]
+        chunk_size = min(self._train_chunk_size or batch_size, batch_size)
+        return sum(
+            self._train_with_backoff(model, chunk, batch_size)
+            for chunk in split_batch(inputs, chunk_size)
+        )
+
+    def _train_with_backoff(self, model, inputs, batch_size):
+        """Runs the training step on a chunk of a train batch of size batch_size, with the
+        loss weighted by the share of the chunk in the batch. In case of running out of
+        memory, the gradients of the chunk are discarded and the chunk is split in halves,
+        which are processed in turn, and the next batches are run in chunks of this size."""
+        chunk_size = next(iter(inputs.values())).shape[0]
+        parameters = [p for p in model.parameters() if p.requires_grad]
+        # The gradients accumulated before the chunk, to restore them if the backward pass
+        # runs out of memory after updating some of them.
+        grads = [None if p.grad is None else p.grad.clone() for p in parameters]
+        self._loss_weight = chunk_size / batch_size
+        try:
+            return super().training_step(model, inputs)
+        except RuntimeError as e:
+            if not is_out_of_memory_error(e) or chunk_size == 1:
+                raise
+        finally:
+            self._loss_weight = 1.0
+        for parameter, grad in zip(parameters, grads):
+            parameter.grad = grad
+        del grads
+        free_memory()
+        self._train_chunk_size = (chunk_size + 1) // 2
+        logger.info(
+            f"  Out of memory, running the train batches in chunks of {self._train_chunk_size}"
+        )
+        return sum(
+            self._train_with_backoff(model, chunk, batch_size)
+            for chunk in split_batch(inputs, self._train_chunk_size)
+        )
+
+    def compute_loss(self, model, inputs, return_outputs=False):
+        outputs = super().compute_loss(model, inputs, return_outputs=return_outputs)
+        if self._loss_weight == 1.0:
+            return outputs
+        if return_outputs:
+            return outputs[0] * self._loss_weight, outputs[1]
+        return outputs * self._loss_weight
+
+    def _load_state_dict_in_model(self, state_dict):
+        super()._load_state_dict_in_model(state_dict)
+        self.invalidate_centroids()
+
+    def _get_tensor_store_dataloader(self, dataset, sampler, batch_size, drop_last):
+        """The tensor store collates whole batches, so the dataloader samples the lists of
+        indices of the batches and does not collate them again."""
+        return DataLoader(
+            dataset,
+            sampler=BatchSampler(sampler, batch_size, drop_last),
+            batch_size=None,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+        )
+
+    def get_train_dataloader(self):
+        if not isinstance(self.train_dataset, TensorStore):
+            return super().get_train_dataloader()
+        return self._get_tensor_store_dataloader(
+            self.train_dataset,
+            self._get_train_sampler(),
+            self.args.train_batch_size,
+            self.args.dataloader_drop_last,
+        )
+
+    def get_eval_dataloader(self, eval_dataset=None):
+        eval_dataset = eval_dataset if eval_dataset is not None else self.eval_dataset
+        if not isinstance(eval_dataset, TensorStore):
+            return super().get_eval_dataloader(eval_dataset)
+        return self._get_tensor_store_dataloader(
+            eval_dataset,
+            self._get_eval_sampler(eval_dataset),
+            self.args.eval_batch_size,
+            False,
+        )
+
+    def _prepare_inputs(self, inputs):
+        inputs = super()._prepare_inputs(inputs)
+        # The tensor store keeps the integer columns in their smallest dtype, they are
+        # widened once on the device.
+        return {
+            k: v.long()
+            if isinstance(v, torch.Tensor)
+            and v.dtype in (torch.int8, torch.int16, torch.int32)
+            else v
+            for k, v in inputs.items()
+        }
+
+    def _get_probe_batch(self, dataset, batch_size):
+        """Builds a batch of the given size from the longest examples of the dataset."""
+        if isinstance(dataset, TensorStore):
+            indices = np.argsort(-dataset.lengths, kind="stable")[:batch_size]
+            return self._prepare_inputs(dataset[np.resize(indices, batch_size)])
+        if isinstance(dataset, datasets.Dataset):
+            lengths = np.array([len(input_ids) for input_ids in dataset["input_ids"]])
+            indices = np.argsort(-lengths, kind="stable")[:batch_size]
+            indices = np.resize(indices, batch_size).tolist()
+            dataset = self._remove_unused_columns(dataset.select(indices))
+            features = [dataset[i] for i in range(batch_size)]
+        else:
+            # The other datasets, as the multi-task one, are indexed by single examples.
+            lengths = np.array(
+                [len(dataset[i]["input_ids"]) for i in range(len(dataset))]
+            )
+            indices = np.argsort(-lengths, kind="stable")[:batch_size]
+            features = [dataset[i] for i in np.resize(indices, batch_size).tolist()]
+        return self._prepare_inputs(self.data_collator(features))
+
+    def _probe_batch_size(self, dataset, max_batch_size, step, divisors=False):
+        """Returns the largest batch size, halving from max_batch_size, for which running
+        step on a batch of the longest examples of the dataset does not run out of memory.
+        With divisors, the batch sizes are rounded down to the divisors of max_batch_size."""
+        batch_size = max_batch_size
+        while True:
+            out_of_memory = False
+            try:
+                step(self._get_probe_batch(dataset, batch_size))
+            except RuntimeError as e:
+                if not is_out_of_memory_error(e) or batch_size == 1:
+                    raise
+                out_of_memory = True
+            free_memory()
+            if not out_of_memory:
+                return batch_size
+            batch_size = batch_size // 2
+            while divisors and max_batch_size % batch_size != 0:
+                batch_size -= 1
+
+    def probe_train_batch_size(self):
+        """Finds the largest divisor of the train batch size fitting in the memory, and
+        keeps the effective batch size by increasing the gradient accumulation steps. The
+        probe leaves the random number generators, the buffers of the model (as the losses
+        of the hardest negatives) and the gradients as they were before it."""
+        max_batch_size = min(
+            self.args.per_device_train_batch_size, len(self.train_dataset)
+        )
+        rng_states = get_rng_states()
+        buffers = {name: buffer.clone() for name, buffer in self.model.named_buffers()}
+
+        def train_step(inputs):
+            try:
+                super(BaseTrainer, self).training_step(self.model, inputs)
+            finally:
+                self.model.zero_grad()
+
+        try:
+            batch_size = self._probe_batch_size(
+                self.train_dataset, max_batch_size, train_step, divisors=True
+            )
+        finally:
+            set_rng_states(rng_states)
+            with torch.no_grad():
+                for name, buffer in self.model.named_buffers():
+                    buffer.copy_(buffers[name])
+        self.args.gradient_accumulation_steps *= max_batch_size // batch_size
+        self.args.per_device_train_batch_size = batch_size
+        logger.info(
+            f"  Auto batch size: per_device_train_batch_size = {batch_size}, "
+            f"gradient_accumulation_steps = {self.args.gradient_accumulation_steps}"
+        )
+
+    def probe_eval_batch_size(self, model, dataset):
+        """Finds the largest eval batch size fitting in the memory for the evaluation
+        path in use (prototypical, classifier or decoding)."""
+
+        def eval_step(inputs):
+            with torch.no_grad():
+                if self.args.prototypical_eval:
+                    self.get_masks_embeds(model, inputs)
+                else:
+                    self._predict_batch(model, inputs)
+
+        batch_size = self._probe_batch_size(
+            dataset, self.args.per_device_eval_batch_size, eval_step
+        )
+        self.args.per_device_eval_batch_size = batch_size
+        self._eval_batch_size_probed = True
+        logger.info(f"  Auto batch size: per_device_eval_batch_size = {batch_size}")
+
+    def _run_with_backoff(self, fn, inputs):
+        """Runs fn on the batch, in case of running out of memory with auto_batch_size, the
+        batch is split in halves which are processed in turn, and the eval batch size is
+        reduced for the next batches. The outputs are concatenated along the batch."""
+        batch_size = next(iter(inputs.values())).shape[0]
+        try:
+            return fn(inputs)
+        except RuntimeError as e:
+            if (
+                not self.args.auto_batch_size
+                or not is_out_of_memory_error(e)
+                or batch_size == 1
+            ):
+                raise
+        free_memory()
+        batch_size = (batch_size + 1) // 2
+        self.args.per_device_eval_batch_size = min(
+            self.args.per_device_eval_batch_size, batch_size
+        )
+        logger.info(
+            f"  Out of memory, reducing per_device_eval_batch_size to {batch_size}"
+        )
+        return torch.cat(
+            [
+                self._run_with_backoff(fn, chunk)
+                for chunk in split_batch(inputs, batch_size)
+            ]
+        )
+
+    def _predict_batch(self, model, inputs, centroids=None):
+        """Returns the scores of the labels of size batch_size x num_labels."""
+        if self.args.train_classifier or self.args.classifier_eval:
+            return model(**inputs)["logits"]
+        return self.evaluate_pet(model, inputs, centroids=centroids)
 
     def evaluate(
         self,
@@ -201,37 +462,71 @@ class BaseTrainer(Trainer):
             predictions=None, label_ids=None, metrics=metrics, num_samples=num_samples
         )
 
+    def get_centroids(self, model):
+        """Returns the per-token centroids of all labels stacked in a tensor of
+        shape num_labels x num_masks x hidden_dim."""
+        if self.args.label_embeddings_as_centroids:
+            return self._get_per_token_train_centroids_from_label_embeddings(model)
+        return self._compute_per_token_train_centroids(model)
+
+    def save_centroids(self, output_dir):
+        """Saves the train centroids next to the model weights, so predictions can be
+        computed later without the training set. They are recomputed with the saved weights
+        when the training set is given, otherwise the loaded centroids are saved."""
+        if self.train_dataset is not None:
+            self.invalidate_centroids()
+        training = self.model.training
+        self.model.eval()
+        centroids = self.get_centroids(self.model)
+        self.model.train(training)
+        torch.save(centroids.cpu(), os.path.join(output_dir, CENTROIDS_NAME))
+
+    def load_centroids(self, path):
+        """Loads the train centroids saved with a checkpoint."""
+        self.set_centroids(torch.load(path, map_location=self.args.device))
+
+    def set_centroids(self, centroids):
+        """Sets the train centroids, they are used until `invalidate_centroids` is called."""
+        self._train_centroids = centroids
+
+    def invalidate_centroids(self):
+        """Discards the cached train centroids, which should be called whenever the weights
+        of the model change (training steps, loading a checkpoint). The optimizers update
+        the weights through `p.data`, so the changes cannot be detected from the weights."""
+        self._train_centroids = None
+
+    def _save(self, output_dir: Optional[str] = None, state_dict=None):
+        super()._save(output_dir, state_dict=state_dict)
+        if (
+            self.args.prototypical_eval
+            and not self.args.label_embeddings_as_centroids
+            and (self.train_dataset is not None or self._train_centroids is not None)
+        ):
+            output_dir = output_dir if output_dir is not None else self.args.output_dir
+            self.save_centroids(output_dir)
+
     def _get_per_token_train_centroids_from_label_embeddings(self, model):
-        centroids = {}
-        start = 0
-        num_masks = model.num_masks
-        for label in range(self.model.config.num_labels):
-            centroids[label] = model.extra_embeddings.weight.data[
-                start : start + num_masks
-            ]
-            start += num_masks
-        return centroids
+        return model.extra_embeddings.weight.data.view(
+            self.model.config.num_labels, model.num_masks, -1
+        )
 
     def compute_pet_metrics(self, eval_datasets, model, extra_info):
-        dataloader = self.get_eval_dataloader(eval_datasets)
+        if self.args.auto_batch_size and not self._eval_batch_size_probed:
+            self.probe_eval_batch_size(model, eval_datasets)
         centroids = None
         if self.args.prototypical_eval:
-            if self.args.label_embeddings_as_centroids:
-                centroids = self._get_per_token_train_centroids_from_label_embeddings(
-                    model
-                )
-            else:
-                centroids = self._compute_per_token_train_centroids(model)
+            centroids = self.get_centroids(model)
+        dataloader = self.get_eval_dataloader(eval_datasets)
 
         y_hats = []
         labels = []
         for _, inputs in enumerate(dataloader):
             inputs = self._prepare_inputs(inputs)
             with torch.no_grad():
-                if self.args.train_classifier or self.args.classifier_eval:
-                    logits = model(**inputs)["logits"]
-                else:
-                    logits = self.evaluate_pet(model, inputs, centroids=centroids)
+                logits = self._run_with_backoff(
+                    functools.partial(self._predict_batch, model, centroids=centroids),
+                    inputs,
+                )
                 y_hat = torch.argmax(logits, axis=1).cpu().detach().numpy()
                 y_hats.extend(y_hat)
                 labels.extend(inputs["labels"].cpu().detach().numpy())
@@ -244,48 +539,23 @@ class BaseTrainer(Trainer):
 
     def evaluate_pet(self, model, batch, centroids=None):
         """Evaluates the model on the given inputs."""
-        candidates_ids = batch["candidates_ids"]
-        candidates_ids = candidates_ids.permute(1, 0, 2)
-        num_labels = candidates_ids.shape[0]
-        log_probs = []
-
-        for label in range(num_labels):
-            candidate_labels = candidates_ids[label]
-
-            if self.args.soft_pet:
-                if self.args.prototypical_eval:
-                    log_prob = self._get_prototypical_candidate_eval_probability(
-                        model, batch, label, centroids
-                    )
-                else:
-                    log_prob = (
-                        self._get_candidate_soft_log_probability_with_extra_tokens(
-                            model,
-                            batch,
-                            label,
-                            decoding_strategy=self.args.decoding_strategy,
-                        )
-                    )
-            else:
-                log_prob = self._get_candidate_log_probability(
-                    model,
-                    batch,
-                    candidate_labels[0],
-                    decoding_strategy=self.args.decoding_strategy,
-                )
-            log_probs.append(log_prob)
-
-        result = torch.tensor([log_probs])
-
-        if self.args.prototypical_eval:
-            result = result.squeeze()
-            result = result.permute(1, 0)
-        return result
+        if self.args.soft_pet and self.args.prototypical_eval:
+            # Scores all the labels at once from a single encoder forward.
+            return self._get_prototypical_eval_probabilities(model, batch, centroids)
+        if self.args.soft_pet:
+            return self._get_candidates_soft_log_probabilities_with_extra_tokens(
+                model, batch, decoding_strategy=self.args.decoding_strategy
+            )
+        return self._get_candidates_log_probabilities(
+            model, batch, decoding_strategy=self.args.decoding_strategy
+        )
 
     def get_masks_embeds(self, model, batch):
         """Returns mask embeddings of size batch_size x num_masks x hidden_dim"""
         input_ids = batch["input_ids"]
         attention_mask = batch["attention_mask"]
+        # The masks are gathered from the precomputed position of the first mask.
+        mask_start = batch["mask_start"]
         if self.args.prompt_tune:
             input_ids, attention_mask, inputs_embeds = model.append_prompts(
                 input_ids, attention_mask, inputs_embeds=None
@@ -295,77 +565,58 @@ class BaseTrainer(Trainer):
                 attention_mask=attention_mask,
                 inputs_embeds=inputs_embeds,
             )
+            # The prompts are prepended to the inputs.
+            mask_start = mask_start + model.prompt_length
         else:
             hidden_states = model.roberta(
                 input_ids=input_ids, attention_mask=attention_mask
             )
-        hidden_states = hidden_states[0]
-        batch_size = input_ids.shape[0]
-        mask_indices = (
-            (input_ids == model.config.mask_token_id)
-            .nonzero()[:, -1]
-            .view(batch_size, -1)
-        )
-        return hidden_states[
-            torch.arange(hidden_states.shape[0]).unsqueeze(-1), mask_indices
-        ]
+        return model.get_masks_hidden_states(input_ids, mask_start, hidden_states[0])
 
     def _compute_per_token_train_centroids(self, model):
         """For training datapoints belonging to each label, computes the average embedding of masked tokens
-        across all samples of each label.
-        Returns a dictionary from labels to embedding size of shape [num_tokens, hidden_dim]"""
-
-        def get_label_samples(dataset, label):
-            # import ipdb; ipdb.set_trace() # FIXME: REMOVE BREAKPOINT
-            return dataset.filter(lambda example: int(example["labels"]) == label)
-
-        label_to_token_centroids = {}
-        for label in range(self.model.config.num_labels):
-            data = get_label_samples(self.train_dataset, label)
-            dataloader = self.get_eval_dataloader(data)
-            mask_embeds = []
-            # import ipdb; ipdb.set_trace() # FIXME: REMOVE BREAKPOINT
-            for _, inputs in enumerate(dataloader):
-                batch = self._prepare_inputs(inputs)
-                with torch.no_grad():
-                    mask_embeds.append(self.get_masks_embeds(model, batch))
-            # Computes the averaged mask embeddings for the samples of this label.
-
-            label_to_token_centroids[label] = torch.mean(
-                torch.cat(mask_embeds, dim=0), dim=0
+        across all samples of each label, in a single pass over the training set. The centroids are reused
+        until `invalidate_centroids` is called.
+        Returns a tensor of shape [num_labels, num_tokens, hidden_dim]"""
+        if self._train_centroids is not None:
+            return self._train_centroids
+
+        num_labels = self.model.config.num_labels
+        if self._train_label_counts is None:
+            self._train_label_counts = torch.bincount(
+                torch.tensor(self.train_dataset["labels"]), minlength=num_labels
             )
-        return label_to_token_centroids
 
-    def _get_prototypical_candidate_eval_probability(
-        self, model, batch, label, centroids
-    ):
-        def cosine_similarity(embed1, embed2):
-            embed1 = F.normalize(embed1, dim=-1)
-            embed2 = F.normalize(embed2, dim=-1)
-            return F.cosine_similarity(embed1, embed2, dim=2)
+        dataloader = self.get_eval_dataloader(self.train_dataset)
+        centroids = None
+        for _, inputs in enumerate(dataloader):
+            batch = self._prepare_inputs(inputs)
+            with torch.no_grad():
+                mask_embeds = self._run_with_backoff(
+                    functools.partial(self.get_masks_embeds, model), batch
+                )
+            if centroids is None:
+                centroids = mask_embeds.new_zeros(num_labels, *mask_embeds.shape[1:])
+            # Sums the mask embeddings of the samples of each label.
+            centroids.index_add_(0, batch["labels"], mask_embeds)
+        centroids /= self._train_label_counts.to(centroids)[:, None, None]
 
-        def euclidean_similarity(embed1, embed2):
-            embed1 = F.normalize(embed1, dim=-1)
-            embed2 = F.normalize(embed2, dim=-1)
-            return torch.exp(-(embed1 - embed2).pow(2).sum(-1))
+        self._train_centroids = centroids
+        return centroids
 
+    def _get_prototypical_eval_probabilities(self, model, batch, centroids):
+        """Computes the similarity of the mask embeddings of the batch to the centroids
+        of all the labels. centroids is of shape num_labels x num_masks x hidden_dim.
+        Returns the aggregated similarities of shape batch_size x num_labels."""
         mask_embeds = self.get_masks_embeds(
             model, batch
         )  # batch_size x num_masks x hidden_dim
-        label_centroids = centroids[label][None, :]  # 1 x num_masks x hidden_dim
-        if self.args.prototypical_similarity == "cos":
-            similarity = cosine_similarity(
-                label_centroids, mask_embeds
-            )  # batch_size x num_masks
-        elif self.args.prototypical_similarity == "euc":
-            similarity = euclidean_similarity(
-                label_centroids, mask_embeds
-            )  # batch_size x num_masks
-        aggregate = get_aggregation(self.args.eval_soft_pet_aggregation)
-        prob = aggregate(similarity, dim=-1)
-        if self.args.eval_soft_pet_aggregation in ["min", "max"]:
-            prob = prob[0]
-        return prob.cpu().detach().numpy().tolist()
+        return compute_prototypical_similarity(
+            mask_embeds,
+            centroids,
+            similarity=self.args.prototypical_similarity,
+            aggregation=self.args.eval_soft_pet_aggregation,
+        )
 
     def get_masks_probs(self, model, batch, prev_mask_ids):
         assert (
@@ -395,107 +646,179 @@ class BaseTrainer(Trainer):
         prob = next_token_logits[masks_positions[len(prev_mask_ids)]]
         return prob
 
-    def _get_candidate_soft_log_probability_with_extra_tokens(
-        self, model, batch, label, decoding_strategy="default"
+    def _get_candidates_soft_log_probabilities_with_extra_tokens(
+        self, model, batch, decoding_strategy="default"
     ):
-        """Computes the probability of the given candidate labels."""
+        """Computes the log probabilities of all the labels for the whole batch, by
+        decoding the extra tokens of each label greedily (or in parallel) in place of
+        the masks. Each (example, label) pair is expanded into a row of a single batch.
+        Returns a tensor of size batch_size x num_labels."""
         num_masks = self.model.num_masks
-        assert (
-            batch["input_ids"].shape[0] == 1
-        ), "we only support batch size of 1 during eval."
-        # removes the pad and keeps at most the num_mask tokens of masks.
-        input_ids = trim_input_ids(
-            batch["input_ids"],
-            num_masks=num_masks,
-            pad_token_id=self.model.config.pad_token_id,
-            mask_token_id=self.model.config.mask_token_id,
-        )
-        masks_positions = [
-            idx
-            for idx, tok_id in enumerate(input_ids[0, :])
-            if tok_id == self.model.config.mask_token_id
-        ]
-        mask_labels = self.model.map_labels_to_mask_ids(torch.tensor([label]).cuda())
-        mask_labels = mask_labels.detach().cpu().numpy().tolist()
-        if not isinstance(mask_labels, list):
-            mask_labels = [mask_labels]
-        # first element is the index in the sequence, second is the position within all masks.
-        masks_positions = [
-            (mask_position, mask_label)
-            for mask_position, mask_label in zip(masks_positions, mask_labels)
-        ]
-        log_probabilities = []
+        num_labels = self.model.config.num_labels
+        input_ids = batch["input_ids"]
+        batch_size = input_ids.shape[0]
+        device = input_ids.device
+        input_ids = input_ids.repeat_interleave(num_labels, dim=0)
+        attention_mask = batch["attention_mask"].repeat_interleave(num_labels, dim=0)
+        num_rows = input_ids.shape[0]
+
+        rows = torch.arange(num_rows, device=device)
+        # first element is the index in the sequence, second is the extra token id of the label.
+        mask_start = batch["mask_start"].repeat_interleave(num_labels, dim=0)
+        masks_positions = mask_start.unsqueeze(-1) + torch.arange(
+            num_masks, device=device
+        )  # num_rows x num_masks
+        labels = torch.arange(num_labels, device=device).repeat(batch_size)
+        mask_labels = labels.unsqueeze(-1) * num_masks + torch.arange(
+            num_masks, device=device
+        )  # num_rows x num_masks
+
         inputs_embeds = self.model.roberta.embeddings.word_embeddings(input_ids)
-        for i in range(num_masks):
-            outputs = model(input_ids=None, inputs_embeds=inputs_embeds)
-            next_token_logits = torch.nn.Softmax(dim=2)(outputs[0])[0]
+        remaining = torch.ones_like(mask_labels, dtype=torch.bool)
+        log_probabilities = torch.zeros(num_rows, device=device)
+        for _ in range(num_masks):
+            outputs = model(
+                input_ids=None,
+                inputs_embeds=inputs_embeds,
+                attention_mask=attention_mask,
+                mask_start=mask_start,
+            )
+            masks_logits = outputs[0]
+            if not self.model.verbalizer_head:
+                masks_logits = masks_logits[rows.unsqueeze(-1), masks_positions]
+            # num_rows x num_masks
+            tokens_log_probs = (
+                torch.log_softmax(masks_logits.float(), dim=-1)
+                .gather(-1, mask_labels.unsqueeze(-1))
+                .squeeze(-1)
+            )
             if decoding_strategy == "parallel":
-                for m_pos, m_id in masks_positions:
-                    log_probabilities.append(
-                        math.log(next_token_logits[m_pos][m_id].item())
-                    )
+                log_probabilities += tokens_log_probs.sum(dim=-1)
                 break
-            mask_pos, masked_id = None, None
-            max_prob = None
-            for m_pos, m_id in masks_positions:
-                m_prob = next_token_logits[m_pos][m_id].item()
-                if max_prob is None or m_prob > max_prob:
-                    max_prob = m_prob
-                    mask_pos, masked_id = m_pos, m_id
-            log_probabilities.append(math.log(max(max_prob, sys.float_info.min)))
+            selected = (
+                tokens_log_probs.masked_fill(~remaining, -math.inf)
+                .argmax(dim=-1)
+                .unsqueeze(-1)
+            )
+            log_prob = tokens_log_probs.gather(-1, selected).squeeze(-1)
+            log_probabilities += log_prob.clamp(min=math.log(sys.float_info.min))
             # put the mask position with maximum probability in its place.
-            shift = 0
-            inputs_embeds[0, mask_pos, :] = self.model.extra_embeddings(
-                torch.tensor([masked_id - shift]).cuda()
-            )  # self.model.soft_mask_labels[label][min_n, :]
-            masks_positions.remove((mask_pos, masked_id))
-        return sum(log_probabilities)
-
-    def _get_candidate_log_probability(
-        self, model, batch, candidate_labels, decoding_strategy="default"
+            mask_pos = masks_positions.gather(-1, selected).squeeze(-1)
+            masked_id = mask_labels.gather(-1, selected).squeeze(-1)
+            inputs_embeds = inputs_embeds.index_put(
+                (rows, mask_pos),
+                self.model.extra_embeddings(masked_id).to(inputs_embeds.dtype),
+            )
+            remaining.scatter_(-1, selected, False)
+        return log_probabilities.view(batch_size, num_labels)
+
+    def _get_candidates_log_probabilities(
+        self, model, batch, decoding_strategy="default"
     ):
-        """Computes the probability of the given candidate labels."""
-        num_masks = sum(1 for token_id in candidate_labels if token_id != -100)
-        # removes the pad and keeps at most the num_mask tokens of masks.
-        input_ids = trim_input_ids(
-            batch["input_ids"],
-            num_masks=num_masks,
+        """Computes the log probabilities of all the candidate labels for the whole batch.
+        Each (example, candidate) pair is expanded into a row of a single batch, and the
+        masks are decoded for all rows at once. Returns a tensor of size batch_size x num_labels."""
+        input_ids = batch["input_ids"]
+        batch_size, seq_length = input_ids.shape
+        # num_labels x max_num_masks, padded with -100.
+        verbalizer_ids = self.model.verbalizer_ids
+        num_labels, max_num_masks = verbalizer_ids.shape
+        input_ids = input_ids.repeat_interleave(num_labels, dim=0)
+        attention_mask = batch["attention_mask"].repeat_interleave(num_labels, dim=0)
+        num_rows = input_ids.shape[0]
+
+        # The candidate tokens are placed from the first mask position onward.
+        mask_start = batch["mask_start"].repeat_interleave(num_labels, dim=0)
+        positions = (
+            mask_start.unsqueeze(-1)
+            + torch.arange(max_num_masks, device=input_ids.device)
+        ).clamp(max=seq_length - 1)  # num_rows x max_num_masks
+        tokens = verbalizer_ids.repeat(batch_size, 1)
+        remaining = tokens != -100
+        tokens = tokens.masked_fill(~remaining, 0)
+        # The indices of the tokens in the logits, which only cover the verbalizer tokens
+        # with verbalizer_head.
+        logits_tokens = tokens
+        if self.model.verbalizer_head:
+            logits_tokens = self.model.verbalizer_vocab_ids.repeat(batch_size, 1)
+            logits_tokens = logits_tokens.masked_fill(~remaining, 0)
+        # removes the pad and keeps at most the num_mask tokens of masks per row.
+        input_ids, attention_mask = trim_batch_input_ids(
+            input_ids,
+            attention_mask,
+            num_masks=remaining.sum(dim=-1),
             pad_token_id=self.model.config.pad_token_id,
             mask_token_id=self.model.config.mask_token_id,
         )
-        log_probabilities = []
-        while True:
-            masks = [
-                (idx, tok_id)
-                for idx, tok_id in enumerate(candidate_labels)
-                if tok_id != -100
-            ]
-            if not masks:  # there are no masks left to process, we are done
-                break
-            outputs = model(input_ids)
-            next_token_logits = torch.nn.Softmax(dim=2)(outputs[0])[0]
-            if decoding_strategy == "ltr":
-                mask_pos, masked_id = masks[0]
-                max_prob = next_token_logits[mask_pos][masked_id].item()
-            elif decoding_strategy == "parallel":
-                for m_pos, m_id in masks:
-                    log_probabilities.append(
-                        math.log(next_token_logits[m_pos][m_id].item())
-                    )
+
+        rows = torch.arange(num_rows, device=input_ids.device)
+        log_probabilities = torch.zeros(num_rows, device=input_ids.device)
+        for step in range(max_num_masks):
+            outputs = model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                mask_start=mask_start,
+            )
+            masks_logits = outputs[0]
+            if not self.model.verbalizer_head:
+                masks_logits = masks_logits[rows.unsqueeze(-1), positions]
+            # num_rows x max_num_masks
+            tokens_log_probs = (
+                torch.log_softmax(masks_logits.float(), dim=-1)
+                .gather(-1, logits_tokens.unsqueeze(-1))
+                .squeeze(-1)
+            )
+            if decoding_strategy == "parallel":
+                log_probabilities += tokens_log_probs.masked_fill(~remaining, 0).sum(-1)
                 break
+            elif decoding_strategy == "ltr":
+                selected = torch.full_like(rows, step)
             else:
-                mask_pos, masked_id = None, None
-                max_prob = None
-                for m_pos, m_id in masks:
-                    m_prob = next_token_logits[m_pos][m_id].item()
-                    if max_prob is None or m_prob > max_prob:
-                        max_prob = m_prob
-                        mask_pos, masked_id = m_pos, m_id
-            log_probabilities.append(math.log(max_prob))
+                selected = tokens_log_probs.masked_fill(~remaining, -math.inf).argmax(
+                    dim=-1
+                )
+            selected = selected.unsqueeze(-1)
+            is_active = remaining.gather(-1, selected).squeeze(-1)
+            log_prob = tokens_log_probs.gather(-1, selected).squeeze(-1)
+            log_probabilities += log_prob.masked_fill(~is_active, 0)
             # put the mask position with maximum probability in its place.
-            input_ids[0][mask_pos] = masked_id
-            candidate_labels[mask_pos] = -100
-        return sum(log_probabilities)
+            mask_pos = positions.gather(-1, selected).squeeze(-1)
+            masked_id = tokens.gather(-1, selected).squeeze(-1)
+            input_ids[rows, mask_pos] = torch.where(
+                is_active, masked_id, input_ids[rows, mask_pos]
+            )
+            remaining.scatter_(-1, selected, False)
+        return log_probabilities.view(batch_size, num_labels)
+
+    def get_optimizer_grouped_parameters(self):
+        """Returns the parameter groups of the optimizer, the label embeddings have their
+        own learning rate and the biases and layer norms have no weight decay."""
+        decay_parameters = get_parameter_names(self.model, [nn.LayerNorm])
+        decay_parameters = [name for name in decay_parameters if "bias" not in name]
+        return [
+            {
+                "params": [
+                    p for n, p in self.model.named_parameters() if SOFT_MASK_LABELS in n
+                ],
+                "lr": self.args.soft_mask_labels_learning_rate,
+            },
+            {
+                "params": [
+                    p
+                    for n, p in self.model.named_parameters()
+                    if n in decay_parameters and SOFT_MASK_LABELS not in n
+                ],
+                "weight_decay": self.args.weight_decay,
+            },
+            {
+                "params": [
+                    p
+                    for n, p in self.model.named_parameters()
+                    if n not in decay_parameters and SOFT_MASK_LABELS not in n
+                ],
+                "weight_decay": 0.0,
+            },
+        ]
 
     def create_optimizer(self):
         """
@@ -504,34 +827,7 @@ class BaseTrainer(Trainer):
         Trainer's init through :obj:`optimizers`, or subclass and override this method in a subclass.
         """
         if self.optimizer is None:
-            decay_parameters = get_parameter_names(self.model, [nn.LayerNorm])
-            decay_parameters = [name for name in decay_parameters if "bias" not in name]
-            optimizer_grouped_parameters = [
-                {
-                    "params": [
-                        p
-                        for n, p in self.model.named_parameters()
-                        if SOFT_MASK_LABELS in n
-                    ],
-                    "lr": self.args.soft_mask_labels_learning_rate,
-                },
-                {
-                    "params": [
-                        p
-                        for n, p in self.model.named_parameters()
-                        if n in decay_parameters and SOFT_MASK_LABELS not in n
-                    ],
-                    "weight_decay": self.args.weight_decay,
-                },
-                {
-                    "params": [
-                        p
-                        for n, p in self.model.named_parameters()
-                        if n not in decay_parameters and SOFT_MASK_LABELS not in n
-                    ],
-                    "weight_decay": 0.0,
-                },
-            ]
+            optimizer_grouped_parameters = self.get_optimizer_grouped_parameters()
             optimizer_cls = Adafactor if self.args.adafactor else AdamW
             if self.args.adafactor:
                 optimizer_cls = Adafactor
@@ -560,14 +856,45 @@ class BaseTrainer(Trainer):
         return self.optimizer
 
     def predict(self, predict_datasets):
-        """Prediction loop."""
-        logger.info(f"***** Running Prediction *****")
+        """Prediction loop, returns the predicted labels."""
+        y_hats = []
+        for logits in self.predict_batches(predict_datasets):
+            y_hats.extend(np.argmax(logits, axis=1))
+        return y_hats
+
+    def _score_batch(self, model, inputs, centroids=None):
+        inputs = self._prepare_inputs(inputs)
+        with torch.no_grad():
+            logits = self._run_with_backoff(
+                functools.partial(self._predict_batch, model, centroids=centroids),
+                inputs,
+            )
+        return logits.float().cpu().detach().numpy()
 
+    def score_batch(self, inputs):
+        """Computes the scores of the labels for a collated batch of processed examples,
+        returns a numpy array of size batch_size x num_labels."""
+        self.model.eval()
+        centroids = None
+        if self.args.prototypical_eval:
+            centroids = self.get_centroids(self.model)
+        return self._score_batch(self.model, inputs, centroids)
+
+    def _get_predict_model(self):
         model = self._wrap_model(self.model, training=False)
         # if full fp16 is wanted on eval and this ``evaluation`` or ``predict`` isn't called while
         # ``train`` is running, halve it first and then put on device
         if not self.is_in_train and self.args.fp16_full_eval:
             model = model.half().to(self.args.device)
+        model.eval()
+        return model
+
+    def predict_batches(self, predict_datasets):
+        """Prediction loop, which yields the scores of the labels of each batch as a numpy
+        array of size batch_size x num_labels as soon as the batch is processed."""
+        logger.info(f"***** Running Prediction *****")
+
+        model = self._get_predict_model()
 
         num_samples = (
             predict_datasets[0].num_rows
@@ -576,26 +903,34 @@ class BaseTrainer(Trainer):
         )
         logger.info(f"  Num examples = {num_samples}")
 
-        model.eval()
-
-        dataloader = self.get_eval_dataloader(predict_datasets)
+        if self.args.auto_batch_size and not self._eval_batch_size_probed:
+            self.probe_eval_batch_size(model, predict_datasets)
         centroids = None
         if self.args.prototypical_eval:
-            if self.args.label_embeddings_as_centroids:
-                centroids = self._get_per_token_train_centroids_from_label_embeddings(
-                    model
-                )
-            else:
-                centroids = self._compute_per_token_train_centroids(model)
+            centroids = self.get_centroids(model)
+        dataloader = self.get_eval_dataloader(predict_datasets)
 
-        y_hats = []
         for _, inputs in enumerate(dataloader):
-            inputs = self._prepare_inputs(inputs)
-            with torch.no_grad():
-                if self.args.train_classifier or self.args.classifier_eval:
-                    logits = model(**inputs)["logits"]
-                else:
-                    logits = self.evaluate_pet(model, inputs, centroids=centroids)
-                y_hat = torch.argmax(logits, axis=1).cpu().detach().numpy()
-                y_hats.extend(y_hat)
-        return y_hats
+            yield self._score_batch(model, inputs, centroids)
+
+    def predict_stream(self, predict_dataset):
+        """Streaming prediction loop over a `StreamingPredictionDataset`, which yields the IDs
+        and the scores of the labels of each batch. The examples are read and processed in
+        the workers of the dataloader while the previous batches are predicted, so the memory
+        does not grow with the number of examples."""
+        logger.info(f"***** Running Streaming Prediction *****")
+        logger.info(f"  Examples file = {predict_dataset.path}")
+
+        model = self._get_predict_model()
+        centroids = None
+        if self.args.prototypical_eval:
+            centroids = self.get_centroids(model)
+        dataloader = DataLoader(
+            predict_dataset,
+            batch_size=None,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+        )
+
+        for ids, inputs in dataloader:
+            yield ids, self._score_batch(model, inputs, centroids)
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from transformers import TrainingArguments
-from typing import Optional
+from typing import List, Optional
 
 
 @dataclass
@@ -45,6 +45,35 @@ class FewShotTrainingArguments(TrainingArguments):
     compute_memory: Optional[bool] = field(
         default=False, metadata={"help": "If set, computes the memory."}
     )
+    predict_output_format: Optional[str] = field(
+        default="csv",
+        metadata={
+            "help": "Defines the format of the predictions on the test set. `csv`: the"
+            "submission format with the IDs and labels, `parquet`: also includes the scores of all labels."
+        },
+    )
+    auto_batch_size: Optional[bool] = field(
+        default=False,
+        metadata={
+            "help": "If set, probes the largest train and eval batch sizes fitting in the memory, starting "
+            "from per_device_train_batch_size and per_device_eval_batch_size, and halves the train and eval "
+            "batches running out of memory. The train batch size is kept with gradient accumulation."
+        },
+    )
+    quantization: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "If set, quantizes the linear layers of the encoder and adapters to int8 for CPU inference. "
+            "`dynamic`: quantizes the activations on the fly, `static`: calibrates the scales of the activations "
+            "on num_calibration_examples train examples, completed with unlabeled test examples."
+        },
+    )
+    num_calibration_examples: Optional[int] = field(
+        default=256,
+        metadata={
+            "help": "The number of examples used to calibrate static quantization."
+        },
+    )
     train_classifier: Optional[bool] = field(
         default=False,
         metadata={
@@ -94,6 +123,37 @@ class FewShotTrainingArguments(TrainingArguments):
     train_in_batch: Optional[bool] = field(
         default=False, metadata={"help": "If set, trains the model in batches."}
     )
+    verbalizer_head: Optional[bool] = field(
+        default=False,
+        metadata={
+            "help": "If set, the LM head is only applied to the hidden states of the masks and projects them only "
+            "onto the verbalizer tokens (or onto the extra tokens with soft_pet), so the loss and the decoding "
+            "are computed over the verbalizer vocabulary instead of the whole vocabulary."
+        },
+    )
+    num_negatives: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "If set, the hinge losses of the PET losses (and the token hinge loss) are computed against "
+            "num_negatives wrong labels sampled for each example, instead of all the wrong labels. This is "
+            "experimental and off by default, until its accuracy on banking_77 is compared with the one of all "
+            "the wrong labels with src/compare_negatives.py."
+        },
+    )
+    negative_sampling: Optional[str] = field(
+        default="uniform",
+        metadata={
+            "help": "This can be `uniform`: samples the wrong labels uniformly, or `hardest`: samples the wrong "
+            "labels with the largest hinge losses for the correct label in the previous steps."
+        },
+    )
+    full_negatives_steps: Optional[int] = field(
+        default=0,
+        metadata={
+            "help": "With num_negatives, the number of last training steps in which the hinge losses are "
+            "computed against all the wrong labels."
+        },
+    )
     decoding_strategy: Optional[str] = field(
         default="default",
         metadata={
@@ -235,6 +295,17 @@ class DataTrainingArguments:
         required to pass the name of the task."
         },
     )
+    task_configs: Optional[List[str]] = field(
+        default=None,
+        metadata={
+            "help": "If set, trains the tasks of the given configs at once, with a single frozen backbone shared "
+            "by the adapters, layer norms and label embeddings of each task, on batches mixing their examples. "
+            "The model, data and evaluation arguments of each task are read from its config, and the task is "
+            "saved, evaluated and predicted as in its separate run, in output_dir/<task>. With serve.py, "
+            "serves the checkpoints in the model_name_or_path of the configs with a single backbone holding "
+            "banks of the adapters of the tasks."
+        },
+    )
     dataset_name: Optional[str] = field(
         default=None,
         metadata={"help": "The name of the dataset to use (via the datasets library)."},
@@ -277,6 +348,14 @@ class DataTrainingArguments:
             "value if set."
         },
     )
+    predict_file: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "A CSV, JSONL, Arrow or Parquet file of examples with an ID column to predict instead of the "
+            "test set. The examples are streamed from the file and processed in dataloader_num_workers workers "
+            "while predicting, so the memory does not grow with the number of examples."
+        },
+    )
     max_seq_length: Optional[int] = field(
         default=128,
         metadata={
@@ -287,6 +366,20 @@ class DataTrainingArguments:
         default=False,
         metadata={"help": "Overwrite the cached training and evaluation sets"},
     )
+    preprocessing_cache_dir: Optional[str] = field(
+        default="cache",
+        metadata={
+            "help": "Where to store the processed datasets, which are loaded in the next runs with the same "
+            "tokenizer, task, pattern and processing settings unless overwrite_cache is set."
+        },
+    )
+    use_tensor_store: bool = field(
+        default=False,
+        metadata={
+            "help": "If set, stores the processed datasets as memory-mapped arrays in preprocessing_cache_dir, "
+            "from which the batches are sliced without collating the examples."
+        },
+    )
     validation_split_percentage: Optional[int] = field(
         default=5,
         metadata={
@@ -338,3 +431,63 @@ class AdapterArguments:
         default=False,
         metadata={"help": "If set, tunes the lm-head also when tuning biases."},
     )
+
+
+@dataclass
+class ServingArguments:
+    """
+    Arguments related to serving a trained model with a local server.
+    """
+
+    host: Optional[str] = field(
+        default="127.0.0.1", metadata={"help": "The host the server listens on."}
+    )
+    port: Optional[int] = field(
+        default=8000, metadata={"help": "The port the server listens on."}
+    )
+    unix_socket: Optional[str] = field(
+        default=None,
+        metadata={"help": "If set, the server listens on this unix socket instead."},
+    )
+    max_batch_size: Optional[int] = field(
+        default=64,
+        metadata={"help": "The maximum number of examples predicted in a micro-batch."},
+    )
+    max_latency_ms: Optional[float] = field(
+        default=10,
+        metadata={
+            "help": "The maximum time to wait for more requests to fill a micro-batch."
+        },
+    )
+
+
+@dataclass
+class ExportArguments:
+    """
+    Arguments related to exporting a trained model for inference.
+    """
+
+    export_format: Optional[str] = field(
+        default="onnx",
+        metadata={
+            "help": "Defines the format of the exported model, `onnx` or `torchscript`."
+        },
+    )
+    export_path: Optional[str] = field(
+        default=None, metadata={"help": "The path to write the exported model to."}
+    )
+    opset_version: Optional[int] = field(
+        default=13, metadata={"help": "The ONNX opset version used for the export."}
+    )
+    num_parity_examples: Optional[int] = field(
+        default=8,
+        metadata={
+            "help": "The number of test examples used to check the exported model against the eager one."
+        },
+    )
+    parity_atol: Optional[float] = field(
+        default=1e-4,
+        metadata={
+            "help": "The maximum absolute difference allowed between the scores of the exported and eager models."
+        },
+    )
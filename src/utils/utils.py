@@ -1,13 +1,17 @@
 """Implements utility functions."""
 import os
+import gc
 import json
+import random
 import numpy as np
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from adapters import AdapterConfig
 from adapters import AdapterController
+from adapters import BankedLayerNorm
 
 
 def create_dir(out_dir):
@@ -67,6 +71,24 @@ def set_layernorms_trainable_params(model, tune_layernorms):
                 p.requires_grad = tune_layernorms
 
 
+def create_layer_norm_banks(model, num_adapters):
+    """Replaces the trainable layer norms of the model by banks of num_adapters layer norms,
+    indexed per row like the adapters. The frozen layer norms are shared by all the rows."""
+    for module in list(model.modules()):
+        for name, sub_module in module.named_children():
+            if isinstance(sub_module, nn.LayerNorm) and any(
+                p.requires_grad for p in sub_module.parameters()
+            ):
+                setattr(
+                    module,
+                    name,
+                    BankedLayerNorm(
+                        num_adapters, sub_module.normalized_shape[-1], sub_module.eps
+                    ),
+                )
+    return model
+
+
 def set_trainable_params_for_adapters(model, tune_layernorms):
     """Freezes all the parameters of the model,
     except for the adapters, and layernorms if specified."""
@@ -103,6 +125,21 @@ def set_trainable_params_for_prompt_tuning(model):
                 param.requires_grad = True
 
 
+def set_trainable_params(model, adapter_args, prompt_tune=False):
+    """Freezes the parameters of the model which are not trained with the given adapter
+    arguments, and prompt_tune."""
+    if adapter_args.adapter_tune:
+        set_trainable_params_for_adapters(model, adapter_args.tune_layernorms)
+    if adapter_args.freeze_model:
+        freeze_model(model)
+    if adapter_args.tune_layernorms:
+        set_layernorms_trainable_params(model, adapter_args.tune_layernorms)
+    if adapter_args.tune_biases:
+        set_trainable_params_for_bitfit(model, adapter_args.tune_lm_head)
+    if prompt_tune:
+        set_trainable_params_for_prompt_tuning(model)
+
+
 def set_config_args(config, args):
     """Sets the pruning arguments in the config."""
     for arg in vars(args):
@@ -111,6 +148,28 @@ def set_config_args(config, args):
     return config
 
 
+def share_frozen_parameters(reference_model, model):
+    """Replaces the frozen parameters of the model by the ones of the reference model with
+    the same names, so the models built from the same pretrained checkpoint keep a single
+    copy of their frozen backbone. The trainable parameters of the model are kept."""
+    reference_parameters = {}
+    for module_name, module in reference_model.named_modules():
+        for name, param in module._parameters.items():
+            if param is not None and not param.requires_grad:
+                reference_parameters[f"{module_name}.{name}"] = param
+    for module_name, module in model.named_modules():
+        for name, param in list(module._parameters.items()):
+            reference = reference_parameters.get(f"{module_name}.{name}")
+            if (
+                param is not None
+                and not param.requires_grad
+                and reference is not None
+                and reference.shape == param.shape
+            ):
+                module._parameters[name] = reference
+    return model
+
+
 def trim_input_ids(
     input_ids: torch.tensor, pad_token_id, mask_token_id, num_masks: int
 ):
@@ -138,6 +197,70 @@ def trim_input_ids(
     return torch.tensor([trimmed_input_ids], dtype=torch.long, device=input_ids.device)
 
 
+def trim_batch_input_ids(
+    input_ids: torch.tensor,
+    attention_mask: torch.tensor,
+    pad_token_id,
+    mask_token_id,
+    num_masks: torch.tensor,
+):
+    """
+    Batched version of `trim_input_ids`, which keeps at most `num_masks[i]` mask tokens in the i-th row.
+    The dropped mask tokens are moved to the end of each row and replaced with padding tokens, so the kept
+    tokens are at the same positions as in the trimmed sequence.
+
+    :param input_ids: the input token ids of size batch_size x seq_length
+    :param attention_mask: the attention mask of size batch_size x seq_length
+    :param pad_token_id: the id of the pad token
+    :param mask_token_id: the id of the mask tokens
+    :param num_masks: the number of masks to keep for each row, of size batch_size
+    :return: the trimmed input ids and attention mask
+    """
+    is_mask = input_ids == mask_token_id
+    mask_rank = is_mask.long().cumsum(dim=-1) - 1
+    drop = is_mask & (mask_rank >= num_masks.unsqueeze(-1))
+    # Stable sort, so the kept tokens preserve their order.
+    order = torch.sort(drop.int(), dim=-1, stable=True)[1]
+    drop = drop.gather(-1, order)
+    input_ids = input_ids.gather(-1, order).masked_fill(drop, pad_token_id)
+    attention_mask = attention_mask.gather(-1, order).masked_fill(drop, 0)
+    return input_ids, attention_mask
+
+
+def compute_prototypical_similarity(mask_embeds, centroids, similarity, aggregation):
+    """Computes the similarity of the mask embeddings to the centroids of all the labels,
+    aggregated over the masks.
+
+    :param mask_embeds: the mask embeddings of size batch_size x num_masks x hidden_dim
+    :param centroids: the centroids of size num_labels x num_masks x hidden_dim
+    :param similarity: `cos` for cosine similarity or `euc` for euclidean one
+    :param aggregation: the aggregation over the masks
+    :return: the similarities of size batch_size x num_labels
+    """
+    mask_embeds = F.normalize(mask_embeds, dim=-1)
+    centroids = F.normalize(centroids.to(mask_embeds.dtype), dim=-1)
+    # Computes the dot products of all the pairs, without materializing
+    # batch_size x num_labels x num_masks x hidden_dim tensors.
+    dots = torch.einsum(
+        "bmh,lmh->blm", mask_embeds, centroids
+    )  # batch_size x num_labels x num_masks
+    if similarity == "cos":
+        similarities = dots
+    elif similarity == "euc":
+        # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b
+        distance = (
+            mask_embeds.pow(2).sum(-1)[:, None, :]
+            + centroids.pow(2).sum(-1)[None, :, :]
+            - 2 * dots
+        )
+        similarities = torch.exp(-distance.clamp(min=0))
+    aggregate = get_aggregation(aggregation)
+    prob = aggregate(similarities, dim=-1)
+    if aggregation in ["min", "max"]:
+        prob = prob[0]
+    return prob
+
+
 def get_aggregation(aggregation_type):
     if aggregation_type == "min":
         return torch.min
@@ -147,3 +270,48 @@ def get_aggregation(aggregation_type):
         return torch.mean
     elif aggregation_type == "sum":
         return torch.sum
+
+
+def is_out_of_memory_error(exception):
+    """Returns True if the given exception is raised by a failed allocation on the CPU or GPU."""
+    return isinstance(exception, RuntimeError) and any(
+        message in str(exception)
+        for message in ["out of memory", "can't allocate memory", "not enough memory"]
+    )
+
+
+def free_memory():
+    """Releases the memory of the tensors which are not referenced anymore."""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def get_rng_states():
+    """Returns the states of the python, numpy and torch random number generators."""
+    states = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "cpu": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        states["cuda"] = torch.cuda.get_rng_state_all()
+    return states
+
+
+def set_rng_states(states):
+    """Restores the states of the random number generators returned by get_rng_states."""
+    random.setstate(states["python"])
+    np.random.set_state(states["numpy"])
+    torch.set_rng_state(states["cpu"])
+    if "cuda" in states:
+        torch.cuda.set_rng_state_all(states["cuda"])
+
+
+def split_batch(batch, batch_size):
+    """Splits a dictionary of tensors along the batch dimension in chunks of size batch_size."""
+    num_rows = next(iter(batch.values())).shape[0]
+    return [
+        {k: v[start : start + batch_size] for k, v in batch.items()}
+        for start in range(0, num_rows, batch_size)
+    ]
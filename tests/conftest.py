@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of the repo are imported from src, as when running the scripts in src.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
@@ -0,0 +1,114 @@
+"""Builds tiny models, processed datasets and trainers for the tests."""
+
+import datasets
+import torch
+from transformers.modeling_utils import no_init_weights
+
+from data.collators import DataCollatorWithDynamicPadding
+from models import RobertaConfig, RobertaForMaskedLM
+from trainers import BaseTrainer
+from training_args import FewShotTrainingArguments
+
+VOCAB_SIZE = 100
+MASK_TOKEN_ID = 4
+PAD_TOKEN_ID = 1
+
+
+def build_model(
+    num_labels=2,
+    num_masks=2,
+    soft_pet=True,
+    seed=0,
+    adapter_config=None,
+    **config_kwargs
+):
+    """Returns a randomly initialized RobertaForMaskedLM with a verbalizer of num_masks
+    tokens for each label."""
+    config = RobertaConfig(
+        vocab_size=VOCAB_SIZE,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        intermediate_size=37,
+        max_position_embeddings=80,
+        soft_pet=soft_pet,
+        train_in_batch=True,
+        extra_tokens_init="random",
+        **config_kwargs,
+    )
+    config.num_labels = num_labels
+    config.mask_token_id = MASK_TOKEN_ID
+    config.pad_token_id = PAD_TOKEN_ID
+    tokenized_verbalizers = {
+        "init": [
+            [list(range(10 + label * num_masks, 10 + (label + 1) * num_masks))]
+            for label in range(num_labels)
+        ]
+    }
+    if soft_pet:
+        tokenized_verbalizers["extra"] = [
+            [
+                list(
+                    range(
+                        VOCAB_SIZE + label * num_masks,
+                        VOCAB_SIZE + (label + 1) * num_masks,
+                    )
+                )
+            ]
+            for label in range(num_labels)
+        ]
+    torch.manual_seed(seed)
+    with no_init_weights():
+        model = RobertaForMaskedLM(
+            config,
+            tokenized_verbalizers=tokenized_verbalizers,
+            adapter_config=adapter_config,
+        )
+    for parameter in model.parameters():
+        parameter.data.normal_(mean=0.0, std=0.2)
+    return model
+
+
+def build_dataset(num_examples, num_labels=2, num_masks=2, seed=0):
+    """Returns processed examples of random tokens and lengths with num_masks masks."""
+    generator = torch.Generator().manual_seed(seed)
+    columns = {"input_ids": [], "attention_mask": [], "mask_start": [], "labels": []}
+    for i in range(num_examples):
+        length = int(torch.randint(num_masks + 3, 16, (1,), generator=generator))
+        input_ids = torch.randint(
+            10, VOCAB_SIZE, (length,), generator=generator
+        ).tolist()
+        input_ids[0], input_ids[-1] = 0, 2
+        mask_start = int(
+            torch.randint(1, length - num_masks, (1,), generator=generator)
+        )
+        input_ids[mask_start : mask_start + num_masks] = [MASK_TOKEN_ID] * num_masks
+        columns["input_ids"].append(input_ids)
+        columns["attention_mask"].append([1] * length)
+        columns["mask_start"].append(mask_start)
+        columns["labels"].append(i % num_labels)
+    return datasets.Dataset.from_dict(columns)
+
+
+def build_trainer(model, train_dataset, output_dir, **args_kwargs):
+    """Returns a BaseTrainer with the soft-PET prototypical eval on CPU."""
+    args = FewShotTrainingArguments(
+        **{
+            "output_dir": output_dir,
+            "no_cuda": True,
+            "report_to": [],
+            "per_device_train_batch_size": 4,
+            "per_device_eval_batch_size": 4,
+            "learning_rate": 1e-2,
+            "soft_pet": True,
+            "prototypical_eval": True,
+            **args_kwargs,
+        }
+    )
+    return BaseTrainer(
+        model=model,
+        args=args,
+        train_dataset=train_dataset,
+        data_collator=DataCollatorWithDynamicPadding(pad_token_id=PAD_TOKEN_ID),
+        metrics=[],
+    )
@@ -0,0 +1,31 @@
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from adapters import BankedLayerNorm, BankedLinear, set_adapter_ids
+from utils.utils import create_layer_norm_banks
+
+
+def test_banked_linear_projects_each_row_with_its_adapter():
+    torch.manual_seed(0)
+    linear = BankedLinear(3, 8, 5)
+    nn.init.normal_(linear.bias)
+    x = torch.randn(6, 4, 8)
+    for adapter_ids in ([2, 0, 2, 1, 0, 2], [1] * 6):
+        adapter_ids = torch.tensor(adapter_ids)
+        set_adapter_ids(linear, adapter_ids)
+        expected = torch.stack(
+            [
+                F.linear(row, linear.weight[i], linear.bias[i])
+                for row, i in zip(x, adapter_ids)
+            ]
+        )
+        assert torch.allclose(linear(x), expected, atol=1e-6)
+
+
+def test_only_the_trainable_layer_norms_are_banked():
+    model = nn.Sequential(nn.LayerNorm(4), nn.Linear(4, 4), nn.LayerNorm(4))
+    model[0].requires_grad_(False)
+    create_layer_norm_banks(model, 2)
+    assert isinstance(model[0], nn.LayerNorm)
+    assert isinstance(model[2], BankedLayerNorm)
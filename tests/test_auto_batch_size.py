@@ -0,0 +1,84 @@
+import functools
+
+import torch
+
+from helpers import build_dataset, build_model, build_trainer
+
+
+def limit_batch_size(model, max_batch_size):
+    """Makes the forward pass of the model run out of memory on larger batches."""
+    forward = model.forward
+
+    @functools.wraps(forward)
+    def limited_forward(**inputs):
+        if inputs["input_ids"].shape[0] > max_batch_size:
+            raise RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+        return forward(**inputs)
+
+    model.forward = limited_forward
+
+
+def test_probe_keeps_the_effective_train_batch_size(tmp_path):
+    model = build_model()
+    limit_batch_size(model, 12)
+    trainer = build_trainer(
+        model,
+        build_dataset(50),
+        str(tmp_path),
+        auto_batch_size=True,
+        per_device_train_batch_size=50,
+    )
+    trainer.probe_train_batch_size()
+    assert trainer.args.per_device_train_batch_size == 10
+    assert trainer.args.gradient_accumulation_steps == 5
+
+
+def test_probe_leaves_the_training_state_unchanged(tmp_path):
+    model = build_model(num_labels=4, num_negatives=1, negative_sampling="hardest")
+    trainer = build_trainer(
+        model,
+        build_dataset(8, num_labels=4),
+        str(tmp_path),
+        auto_batch_size=True,
+        num_negatives=1,
+        negative_sampling="hardest",
+    )
+    negative_hinge_losses = model.negative_hinge_losses.clone()
+    rng_state = torch.get_rng_state()
+    trainer.probe_train_batch_size()
+    assert torch.equal(model.negative_hinge_losses, negative_hinge_losses)
+    assert torch.equal(torch.get_rng_state(), rng_state)
+    assert all(
+        parameter.grad is None or not parameter.grad.any()
+        for parameter in model.parameters()
+    )
+
+
+def test_train_batches_running_out_of_memory_are_split(tmp_path):
+    def get_grads(max_batch_size):
+        model = build_model(hidden_dropout_prob=0.0, attention_probs_dropout_prob=0.0)
+        trainer = build_trainer(
+            model,
+            build_dataset(8),
+            str(tmp_path),
+            auto_batch_size=True,
+            gradient_accumulation_steps=2,
+        )
+        batches = [
+            trainer.data_collator([trainer.train_dataset[i] for i in indices])
+            for indices in (range(4), range(4, 8))
+        ]
+        trainer.training_step(model, batches[0])
+        # The second batch runs out of memory after the first one accumulated gradients.
+        limit_batch_size(model, max_batch_size)
+        loss = trainer.training_step(model, batches[1])
+        grads = [p.grad.clone() for p in model.parameters() if p.grad is not None]
+        return loss, grads, trainer
+
+    loss, grads, _ = get_grads(max_batch_size=4)
+    split_loss, split_grads, trainer = get_grads(max_batch_size=1)
+    assert trainer._train_chunk_size == 1
+    assert torch.allclose(split_loss, loss)
+    assert len(split_grads) == len(grads)
+    for split_grad, grad in zip(split_grads, grads):
+        assert torch.allclose(split_grad, grad, atol=1e-6)
@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from serving import MicroBatcher
+
+
+def predict(items):
+    return [1 / item for item in items]
+
+
+def test_an_invalid_item_only_fails_its_future():
+    batcher = MicroBatcher(predict, max_batch_size=4, max_latency=0.5)
+    # The items are queued before the worker starts, so they form a single batch.
+    futures = [batcher.submit(item) for item in (1, 0, 4)]
+    batcher.start()
+    assert futures[0].result(timeout=5) == 1
+    with pytest.raises(ZeroDivisionError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 0.25
+    batcher.stop()
+
+
+def test_stop_processes_the_queued_items_and_fails_the_next_ones():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_predict(items):
+        started.set()
+        release.wait()
+        return predict(items)
+
+    batcher = MicroBatcher(slow_predict, max_batch_size=1, max_latency=0.0).start()
+    first = batcher.submit(1)
+    started.wait()
+    queued = batcher.submit(2)
+    stopper = threading.Thread(target=batcher.stop)
+    stopper.start()
+    while not batcher.stopping:
+        pass
+    late = batcher.submit(4)
+    release.set()
+    stopper.join(timeout=5)
+    assert first.result(timeout=5) == 1
+    assert queued.result(timeout=5) == 0.5
+    with pytest.raises(RuntimeError):
+        late.result(timeout=5)
@@ -0,0 +1,55 @@
+import torch
+from transformers.file_utils import WEIGHTS_NAME
+
+from helpers import build_dataset, build_model, build_trainer
+from trainers import CENTROIDS_NAME
+
+
+def test_centroids_follow_the_training_steps(tmp_path):
+    model = build_model()
+    trainer = build_trainer(model, build_dataset(8), str(tmp_path), max_steps=2)
+    model.eval()
+    initial_centroids = trainer.get_centroids(model).clone()
+    trainer.train()
+    model.eval()
+    centroids = trainer.get_centroids(model)
+    assert not torch.allclose(centroids, initial_centroids)
+
+    # The centroids are the ones of the trained weights.
+    trainer.invalidate_centroids()
+    assert torch.allclose(centroids, trainer.get_centroids(model))
+
+
+def test_checkpoint_centroids_match_the_saved_weights(tmp_path):
+    model = build_model()
+    train_dataset = build_dataset(8)
+    trainer = build_trainer(
+        model,
+        train_dataset,
+        str(tmp_path),
+        max_steps=2,
+        save_strategy="steps",
+        save_steps=1,
+    )
+    # Fills the cache before training, as an evaluation would.
+    model.eval()
+    trainer.get_centroids(model)
+    trainer.train()
+
+    for step in (1, 2):
+        checkpoint = tmp_path / f"checkpoint-{step}"
+        saved_model = build_model(seed=1)
+        # The decoder of the LM head is not saved, it is not used by the centroids.
+        saved_model.load_state_dict(torch.load(checkpoint / WEIGHTS_NAME), strict=False)
+        saved_model.eval()
+        centroids = build_trainer(
+            saved_model, train_dataset, str(tmp_path)
+        ).get_centroids(saved_model)
+        assert torch.allclose(torch.load(checkpoint / CENTROIDS_NAME), centroids)
+
+    # Centroids set on the trainer are recomputed from the weights when saving.
+    model.eval()
+    centroids = trainer.get_centroids(model)
+    trainer.set_centroids(torch.zeros_like(centroids))
+    trainer.save_model(str(tmp_path / "final"))
+    assert torch.allclose(torch.load(tmp_path / "final" / CENTROIDS_NAME), centroids)
@@ -0,0 +1,18 @@
+from data.collators import DataCollatorWithDynamicPadding
+
+
+def test_the_keys_missing_from_some_examples_are_filled():
+    features = [
+        {"input_ids": [0, 5, 2], "attention_mask": [1, 1, 1], "labels": 1},
+        {
+            "input_ids": [0, 4, 4, 6, 2],
+            "attention_mask": [1, 1, 1, 1, 1],
+            "mask_start": 1,
+            "labels": 0,
+        },
+    ]
+    batch = DataCollatorWithDynamicPadding(pad_token_id=1)(features)
+    assert batch["input_ids"].tolist() == [[0, 5, 2, 1, 1], [0, 4, 4, 6, 2]]
+    assert batch["attention_mask"].tolist() == [[1, 1, 1, 0, 0], [1, 1, 1, 1, 1]]
+    assert batch["mask_start"].tolist() == [-100, 1]
+    assert batch["labels"].tolist() == [1, 0]
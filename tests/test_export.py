@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import torch
+
+from helpers import build_dataset, build_model, build_trainer
+from serving.export import (
+    RUNNER_MAPPING,
+    ExportedModelRunner,
+    export_prototypical_classifier,
+    get_prototypical_classifier,
+)
+
+
+@pytest.mark.parametrize("export_format", ["torchscript", "onnx"])
+def test_exported_scores_match_the_eager_model(tmp_path, export_format):
+    if export_format == "onnx":
+        pytest.importorskip("onnxruntime")
+    model = build_model()
+    dataset = build_dataset(8)
+    trainer = build_trainer(
+        model, dataset, str(tmp_path), eval_soft_pet_aggregation="mean"
+    )
+    classifier = get_prototypical_classifier(trainer)
+    path = str(tmp_path / f"model.{export_format}")
+    export_prototypical_classifier(
+        classifier,
+        trainer.data_collator([dataset[i] for i in range(4)]),
+        path,
+        export_format,
+    )
+    runner = RUNNER_MAPPING[export_format](path, trainer.data_collator, batch_size=8)
+
+    # The batch and sequence sizes differ from the ones of the export.
+    batch = trainer.data_collator([dataset[i] for i in range(8)])
+    with torch.no_grad():
+        expected = trainer.evaluate_pet(
+            model, batch, centroids=trainer.get_centroids(model)
+        )
+    scores = runner.score(batch["input_ids"], batch["attention_mask"])
+    np.testing.assert_allclose(scores, expected.numpy(), atol=1e-5)
+    assert runner.predict(dataset) == list(expected.argmax(dim=1).numpy())
+
+
+def test_runners_should_implement_score():
+    class IncompleteRunner(ExportedModelRunner):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteRunner("model.onnx", data_collator=None, batch_size=8)
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+import torch
+
+from adapters import AdapterConfig
+from data.collators import DataCollatorWithDynamicPadding
+from data.multitask import MultiTaskDataset
+from helpers import PAD_TOKEN_ID, build_dataset, build_model, build_trainer
+from models import MultiTaskModel
+from models.multitask import TaskRouter
+from utils.utils import set_trainable_params_for_adapters, share_frozen_parameters
+
+
+def build_multitask_dataset(models, num_examples=4):
+    return MultiTaskDataset(
+        [
+            build_dataset(num_examples, num_labels=model.config.num_labels, seed=seed)
+            for seed, model in enumerate(models.values())
+        ]
+    )
+
+
+def build_task_models(num_labels=(2, 3)):
+    """Returns the models of tasks with their own adapters and layer norms, sharing the
+    frozen backbone of the first one."""
+    adapter_config = AdapterConfig(
+        add_layer_norm_after_adapter=True, reduction_factor=4
+    )
+    adapter_config.adapter_tune = True
+    models = OrderedDict()
+    for seed, task_num_labels in enumerate(num_labels):
+        model = build_model(
+            num_labels=task_num_labels,
+            seed=seed,
+            adapter_config=adapter_config,
+            hidden_dropout_prob=0.0,
+            attention_probs_dropout_prob=0.0,
+        )
+        set_trainable_params_for_adapters(model, tune_layernorms=True)
+        if models:
+            share_frozen_parameters(next(iter(models.values())), model)
+        models[f"task{seed}"] = model
+    return models
+
+
+def test_mixed_batches_go_through_the_encoder_once_with_the_modules_of_their_tasks():
+    models = build_task_models()
+    multitask_model = MultiTaskModel(models)
+    routed = {
+        type(router.task_modules[0]).__name__ for router in multitask_model.routers
+    }
+    assert routed == {"AdapterController", "LayerNorm"}
+
+    dataset = build_multitask_dataset(models)
+    collator = DataCollatorWithDynamicPadding(pad_token_id=PAD_TOKEN_ID)
+    batch = collator([dataset[i] for i in (0, 5, 1, 6, 7)])
+    task_ids = batch.pop("task_ids")
+
+    calls = []
+    for model in models.values():
+        model.roberta.register_forward_hook(lambda *args: calls.append(args))
+    loss = multitask_model(task_ids, **batch)["loss"]
+    assert calls == []
+    loss.backward()
+    # The layer norm of the LM head is not used by the soft-PET loss.
+    grads = {
+        n: p.grad.clone()
+        for n, p in multitask_model.named_parameters()
+        if p.grad is not None
+    }
+    multitask_model.zero_grad()
+
+    # The rows of each task with their own model.
+    expected_loss = 0
+    for task_id, model in enumerate(models.values()):
+        rows = (task_ids == task_id).nonzero().squeeze(-1)
+        rows_inputs = {key: value[rows] for key, value in batch.items()}
+        expected_loss = expected_loss + model(**rows_inputs).loss * len(rows)
+    expected_loss = expected_loss / len(task_ids)
+    expected_loss.backward()
+    assert torch.allclose(loss, expected_loss, atol=1e-6)
+    assert len(grads) > 0
+    for name, parameter in multitask_model.named_parameters():
+        if parameter.grad is not None:
+            assert torch.allclose(grads[name], parameter.grad, atol=1e-6), name
+
+
+def test_single_task_batches_are_not_split():
+    multitask_model = MultiTaskModel(build_task_models())
+    router = multitask_model.routers[0]
+    assert isinstance(router, TaskRouter)
+    dataset = build_dataset(3)
+    batch = DataCollatorWithDynamicPadding(pad_token_id=PAD_TOKEN_ID)(
+        [dataset[i] for i in range(3)]
+    )
+    loss = multitask_model(torch.zeros(3, dtype=torch.long), **batch)["loss"]
+    expected_loss = multitask_model.models["task0"](**batch).loss
+    assert torch.allclose(loss, expected_loss, atol=1e-6)
+
+
+def test_auto_batch_size_probes_the_mixed_task_batches(tmp_path):
+    models = build_task_models()
+    trainer = build_trainer(
+        MultiTaskModel(models),
+        build_multitask_dataset(models),
+        str(tmp_path),
+        auto_batch_size=True,
+        per_device_train_batch_size=8,
+    )
+    batch = trainer._get_probe_batch(trainer.train_dataset, 8)
+    assert batch["task_ids"].tolist().count(1) == 4
+    trainer.probe_train_batch_size()
+    assert trainer.args.per_device_train_batch_size == 8
@@ -0,0 +1,71 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from data.preprocessing import MLMProcessor
+
+
+def build_processor(max_seq_length):
+    # Roberta adds <s> and </s> to a single sequence, and </s></s> between two sequences.
+    tokenizer = SimpleNamespace(
+        mask_token_id=4,
+        pad_token_id=1,
+        num_special_tokens_to_add=lambda pair: 4 if pair else 2,
+    )
+    return MLMProcessor(
+        tokenizer=tokenizer,
+        tokenized_verbalizers=None,
+        max_seq_length=max_seq_length,
+        processor=None,
+    )
+
+
+def truncate_token_by_token(processor, parts_a, parts_b):
+    """The truncation of PET, removing the tokens one at a time."""
+
+    def remove_last(parts):
+        last_idx = max(
+            idx for idx, (seq, shortenable) in enumerate(parts) if shortenable and seq
+        )
+        parts[last_idx] = (parts[last_idx][0][:-1], parts[last_idx][1])
+
+    total_len = processor.seq_length(parts_a) + processor.seq_length(parts_b)
+    total_len += processor.tokenizer.num_special_tokens_to_add(bool(parts_b))
+    for _ in range(total_len - processor.max_seq_length):
+        if processor.seq_length(parts_a, only_shortenable=True) > processor.seq_length(
+            parts_b, only_shortenable=True
+        ):
+            remove_last(parts_a)
+        else:
+            remove_last(parts_b)
+
+
+def random_parts(rng, max_num_parts):
+    return [
+        (
+            [rng.randint(5, 100) for _ in range(rng.randint(0, 12))],
+            rng.random() < 0.6,
+        )
+        for _ in range(rng.randint(0, max_num_parts))
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_truncate_matches_token_by_token_truncation(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        parts_a = random_parts(rng, 4)
+        parts_b = random_parts(rng, 3) if rng.random() < 0.5 else []
+        processor = build_processor(max_seq_length=rng.randint(2, 50))
+        expected_a, expected_b = list(parts_a), list(parts_b)
+        try:
+            truncate_token_by_token(processor, expected_a, expected_b)
+        except ValueError:
+            # There are not enough shortenable tokens.
+            with pytest.raises(ValueError):
+                processor.truncate(parts_a, parts_b)
+            continue
+        assert processor.truncate(parts_a, parts_b) is None
+        assert parts_a == expected_a
+        assert parts_b == expected_b
@@ -0,0 +1,71 @@
+import csv
+import itertools
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from data import streaming
+from data.streaming import read_chunks
+
+ROWS = [
+    {
+        "ID": str(i),
+        "Tweet": f'tweet "{i}",\nwith a newline' if i % 3 == 0 else f"tweet {i}",
+    }
+    for i in range(23)
+]
+
+
+def write_rows(path, extension):
+    if extension == ".csv":
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["ID", "Tweet"])
+            writer.writeheader()
+            writer.writerows(ROWS[:10])
+            f.write("\r\n")
+            writer.writerows(ROWS[10:])
+    elif extension == ".jsonl":
+        with open(path, "w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in ROWS)
+    else:
+        table = pa.Table.from_pylist(ROWS)
+        if extension == ".parquet":
+            pq.write_table(table, path, row_group_size=4)
+        else:
+            with pa.ipc.new_stream(path, table.schema) as writer:
+                for batch in table.to_batches(max_chunksize=6):
+                    writer.write_batch(batch)
+
+
+@pytest.mark.parametrize("extension", [".csv", ".jsonl", ".arrow", ".parquet"])
+def test_shards_read_the_chunks_of_the_file_in_turn(tmp_path, extension):
+    path = str(tmp_path / f"predict{extension}")
+    write_rows(path, extension)
+    shards = [list(read_chunks(path, 5, shard_id, 3)) for shard_id in range(3)]
+    chunks = [
+        chunk
+        for chunks in itertools.zip_longest(*shards)
+        for chunk in chunks
+        if chunk is not None
+    ]
+    assert chunks == [ROWS[i : i + 5] for i in range(0, len(ROWS), 5)]
+
+
+def test_shards_only_parse_their_chunks(tmp_path, monkeypatch):
+    path = str(tmp_path / "predict.jsonl")
+    write_rows(path, ".jsonl")
+    parsed = []
+
+    def parse_jsonl_block(line):
+        parsed.append(json.loads(line)["ID"])
+        return [json.loads(line)]
+
+    monkeypatch.setitem(
+        streaming.READER_MAPPING,
+        ".jsonl",
+        (streaming.read_jsonl_blocks, parse_jsonl_block),
+    )
+    list(read_chunks(path, 5, shard_id=1, num_shards=3))
+    assert parsed == [str(i) for i in itertools.chain(range(5, 10), range(20, 23))]